@@ -0,0 +1,83 @@
+"""Checks that draw_genes.py starts quickly. Measures the time taken to
+run 'draw_genes.py --help' and checks that importing draw_genes does not
+import heavy modules (rpy2, numpy, scipy, genome or the track modules).
+Exits with a non-zero status if startup is over budget.
+
+usage: python benchmarks/startup.py [--budget SECONDS] [--repeat N]
+"""
+
+import sys
+import os
+import time
+import argparse
+import subprocess
+
+
+# modules that should not be imported until they are needed
+DEFERRED_MODULES = ["rpy2", "numpy", "scipy", "genome", "tables",
+                    "draw.window", "draw.track", "draw.readdepthtrack"]
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="checks startup time "
+                                     "of draw_genes.py")
+
+    parser.add_argument("--budget", type=float, default=0.5,
+                        help="maximum allowed time in seconds for "
+                        "draw_genes.py --help")
+
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="number of times to run draw_genes.py; "
+                        "fastest time is reported")
+
+    return parser.parse_args()
+
+
+def time_help(repeat):
+    """returns fastest wall time for running draw_genes.py --help"""
+    cmd = [sys.executable, os.path.join(SRC_DIR, "draw_genes.py"), "--help"]
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call(cmd, stdout=subprocess.DEVNULL, cwd=SRC_DIR)
+        times.append(time.time() - start)
+    return min(times)
+
+
+def get_loaded_deferred_modules():
+    """returns list of deferred modules that are loaded by importing
+    draw_genes"""
+    code = ("import sys; import draw_genes; "
+            "print(' '.join(sys.modules.keys()))")
+    out = subprocess.check_output([sys.executable, "-c", code],
+                                  cwd=SRC_DIR).decode()
+    loaded = set(out.split())
+
+    return [m for m in DEFERRED_MODULES if m in loaded]
+
+
+def main():
+    args = parse_args()
+
+    ok = True
+
+    loaded = get_loaded_deferred_modules()
+    if loaded:
+        sys.stderr.write("FAIL: importing draw_genes imports: %s\n" %
+                         ", ".join(loaded))
+        ok = False
+
+    elapsed = time_help(args.repeat)
+    sys.stderr.write("draw_genes.py --help: %.3fs (budget %.3fs)\n" %
+                     (elapsed, args.budget))
+    if elapsed > args.budget:
+        sys.stderr.write("FAIL: startup time is over budget\n")
+        ok = False
+
+    if not ok:
+        exit(1)
+
+
+main()
@@ -0,0 +1,159 @@
+#
+# Downsamples a read depth track to approximately a desired total number
+# of reads and writes the result as a new track. Each read is kept with
+# probability desired_total / total_reads. Reads are downsampled in
+# blocks of positions with a separately seeded random number generator
+# for each block, in the same way as ReadDepthTrack does when the
+# DOWNSAMPLE option is given, so for the same SEED and block size the
+# new track contains exactly the counts that ReadDepthTrack would draw.
+#
+
+import sys
+import argparse
+import multiprocessing
+
+import numpy as np
+import tables
+
+import genome.chrom
+import genome.track
+
+from draw import downsample
+
+
+# number of blocks of positions downsampled by each task
+BLOCKS_PER_TASK = 10
+
+# input track opened in each worker process
+worker_state = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="downsamples a read "
+                                     "depth track and writes the result "
+                                     "to a new track")
+
+    parser.add_argument("--seed", type=int, default=downsample.DEFAULT_SEED,
+                        help="seed for random number generators")
+
+    parser.add_argument("--block_size", type=int,
+                        default=downsample.DEFAULT_BLOCK_SIZE,
+                        help="number of positions in each block with "
+                        "its own random number generator")
+
+    parser.add_argument("--total_reads", type=int, default=None,
+                        help="total number of reads in input track. "
+                        "If not provided this is computed by summing "
+                        "the track over all chromosomes")
+
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes to use")
+
+    parser.add_argument("chrom_info", help="path to chromInfo file "
+                        "listing chromosomes")
+
+    parser.add_argument("input_track", help="name of read depth track "
+                        "to downsample")
+
+    parser.add_argument("output_track", help="name of track to write "
+                        "downsampled read depths to")
+
+    parser.add_argument("desired_total", type=int, help="desired total "
+                        "number of reads after downsampling")
+
+    return parser.parse_args()
+
+
+def init_worker(track_name):
+    worker_state['track'] = genome.track.Track(track_name)
+
+
+def get_counts(chrom, start, end):
+    return worker_state['track'].get_nparray(chrom, start=start, end=end)
+
+
+def sum_chunk(task):
+    chrom, start, end = task[:3]
+    return int(np.sum(get_counts(chrom, start, end), dtype=np.int64))
+
+
+def downsample_chunk(task):
+    chrom, start, end, p, seed, block_size = task
+    counts = get_counts(chrom, start, end)
+    return downsample.downsample_blocks(counts, chrom.name, start, p,
+                                        seed=seed, block_size=block_size)
+
+
+def get_tasks(chrom_list, block_size, args=()):
+    """Splits chromosomes into chunks of whole blocks"""
+    chunk_size = block_size * BLOCKS_PER_TASK
+    tasks = []
+    for chrom in chrom_list:
+        for start in range(1, chrom.length + 1, chunk_size):
+            end = min(start + chunk_size - 1, chrom.length)
+            tasks.append((chrom, start, end) + args)
+    return tasks
+
+
+def main():
+    args = parse_args()
+
+    chrom_dict = genome.chrom.parse_chromosomes_dict(args.chrom_info)
+    chrom_list = sorted(chrom_dict.values(), key=lambda c: c.name)
+
+    if args.processes > 1:
+        pool = multiprocessing.Pool(args.processes, initializer=init_worker,
+                                    initargs=(args.input_track,))
+        map_func = pool.imap
+    else:
+        init_worker(args.input_track)
+        pool = None
+        map_func = map
+
+    total_reads = args.total_reads
+    if total_reads is None:
+        tasks = get_tasks(chrom_list, args.block_size)
+        total_reads = sum(map_func(sum_chunk, tasks))
+        sys.stderr.write("total reads in %s: %d\n" %
+                         (args.input_track, total_reads))
+
+    if args.desired_total >= total_reads:
+        sys.stderr.write("desired total (%d) is not less than total "
+                         "reads (%d)\n" % (args.desired_total, total_reads))
+        sys.exit(2)
+
+    p = float(args.desired_total) / float(total_reads)
+
+    out_track = genome.track.Track(args.output_track, mode="w")
+    filters = tables.Filters(complevel=1, complib="zlib")
+
+    # chunks are downsampled in parallel but written in order by
+    # this process
+    tasks = get_tasks(chrom_list, args.block_size,
+                      (p, args.seed, args.block_size))
+    carray = None
+    new_total = 0
+    for task, counts in zip(tasks, map_func(downsample_chunk, tasks)):
+        chrom, start, end = task[:3]
+        if start == 1:
+            sys.stderr.write("%s\n" % chrom.name)
+            atom = tables.Atom.from_dtype(counts.dtype)
+            carray = out_track.h5f.createCArray(out_track.h5f.root,
+                                                chrom.name, atom,
+                                                shape=(chrom.length,),
+                                                filters=filters)
+        carray[start-1:end] = counts
+        new_total += int(np.sum(counts, dtype=np.int64))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    out_track.close()
+
+    sys.stderr.write("downsampled %d reads to %d. Set TOTAL_READS=%d "
+                     "when drawing %s\n" % (total_reads, new_total,
+                                            new_total, args.output_track))
+
+
+main()
@@ -0,0 +1,247 @@
+
+import sys
+import warnings
+
+import numpy as np
+
+
+# rows are kept exactly until more than this many regions are added,
+# after which quantiles are estimated from per-position histograms
+DEFAULT_MAX_EXACT = 2000
+
+# number of histogram bins per position used to estimate quantiles
+DEFAULT_N_BIN = 512
+
+
+
+class ProfileAccumulator(object):
+    """Accumulates the values of many aligned regions of the same
+    width, so that the mean, median and quantiles at each position can
+    be obtained after a single pass over the regions. Memory use does
+    not grow with the number of regions: the first max_exact rows are
+    stored so that small sets of regions give exact quantiles, and
+    after that values are counted in n_bin histogram bins per position
+    spanning the range of the stored rows (values outside this range
+    are counted in the first or last bin). Undefined (nan) values are
+    ignored."""
+
+    def __init__(self, width, max_exact=DEFAULT_MAX_EXACT,
+                 n_bin=DEFAULT_N_BIN):
+        self.width = width
+        self.max_exact = max_exact
+        self.n_bin = n_bin
+
+        self.n_region = 0
+        self.sums = np.zeros(width, dtype=np.float64)
+        self.counts = np.zeros(width, dtype=np.int64)
+
+        self.rows = []
+        self.n_row = 0
+
+        # histogram of values at each position, created once there
+        # are more than max_exact rows
+        self.hist = None
+        self.hist_min = None
+        self.hist_max = None
+
+
+    def add(self, matrix):
+        """Adds a (regions x positions) matrix of values"""
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.ndim != 2 or matrix.shape[1] != self.width:
+            raise ValueError("expected matrix with %d columns" % self.width)
+
+        defined = ~np.isnan(matrix)
+        self.sums += np.where(defined, matrix, 0.0).sum(axis=0)
+        self.counts += defined.sum(axis=0)
+        self.n_region += matrix.shape[0]
+
+        if self.hist is None:
+            self.rows.append(matrix)
+            self.n_row += matrix.shape[0]
+            if self.n_row > self.max_exact:
+                self.init_hist()
+        else:
+            self.add_hist(matrix)
+
+
+    def init_hist(self):
+        """Switches from storing rows to counting histograms, using the
+        range of the stored values for the bins"""
+        stored = np.vstack(self.rows)
+        self.rows = []
+        self.n_row = 0
+
+        defined = stored[~np.isnan(stored)]
+        if defined.size:
+            self.hist_min = float(defined.min())
+            self.hist_max = float(defined.max())
+        else:
+            self.hist_min = self.hist_max = 0.0
+        if self.hist_max <= self.hist_min:
+            self.hist_max = self.hist_min + 1.0
+
+        self.hist = np.zeros((self.width, self.n_bin), dtype=np.int64)
+        self.add_hist(stored)
+
+
+    def add_hist(self, matrix):
+        pos = np.broadcast_to(np.arange(self.width), matrix.shape)
+        defined = ~np.isnan(matrix)
+
+        scale = self.n_bin / (self.hist_max - self.hist_min)
+        bins = ((matrix[defined] - self.hist_min) * scale).astype(np.int64)
+        np.clip(bins, 0, self.n_bin - 1, out=bins)
+
+        flat = pos[defined] * self.n_bin + bins
+        self.hist += np.bincount(flat, minlength=self.width *
+                                 self.n_bin).reshape(self.width, self.n_bin)
+
+
+    def get_mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+
+    def get_quantile(self, q):
+        """Returns the q quantile of the values at each position"""
+        if self.hist is None:
+            if self.n_row == 0:
+                return np.full(self.width, np.nan)
+            with warnings.catch_warnings():
+                # positions with no defined values give nan
+                warnings.simplefilter("ignore", RuntimeWarning)
+                return np.nanquantile(np.vstack(self.rows), q, axis=0)
+
+        total = self.hist.sum(axis=1)
+        cum = np.cumsum(self.hist, axis=1)
+        target = q * total
+
+        # first bin where the cumulative count reaches the target,
+        # interpolating linearly within the bin
+        idx = np.argmax(cum >= target[:,None], axis=1)
+        rows = np.arange(self.width)
+        in_bin = self.hist[rows, idx]
+        before = cum[rows, idx] - in_bin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frac = np.where(in_bin > 0, (target - before) / in_bin, 0.5)
+
+        bin_width = (self.hist_max - self.hist_min) / self.n_bin
+        vals = self.hist_min + (idx + frac) * bin_width
+
+        return np.where(total > 0, vals, np.nan)
+
+
+    def get_median(self):
+        return self.get_quantile(0.5)
+
+
+
+def bin_means(matrix, n_bin, axis=1):
+    """Reduces a matrix to n_bin bins along an axis by taking the mean
+    of the defined values in each bin. Bins without defined values
+    are set to nan."""
+    size = matrix.shape[axis]
+    if n_bin >= size:
+        return matrix
+
+    idx = (np.arange(n_bin, dtype=np.int64) * size) // n_bin
+    defined = ~np.isnan(matrix)
+    sums = np.add.reduceat(np.where(defined, matrix, 0.0), idx, axis=axis)
+    counts = np.add.reduceat(defined.astype(np.int64), idx, axis=axis)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+
+def get_centered_regions(regions, width):
+    """Recenters regions to the provided width and groups them by
+    chromosome. Returns a list of (chrom, starts, strands, indices)
+    tuples sorted by chromosome name. The start positions of regions on
+    each chromosome are sorted, strands are 1, -1 or 0 and indices give
+    the position of each region in the original list. Regions that
+    would extend past the ends of their chromosome are skipped."""
+    chrom_regions = {}
+    n_skip = 0
+    for i in range(len(regions)):
+        reg = regions[i]
+        start = (reg.start + reg.end) // 2 - width // 2
+        if start < 1 or start + width - 1 > reg.chrom.length:
+            n_skip += 1
+            continue
+        strand = getattr(reg, "strand", 0)
+        if strand not in (1, -1):
+            strand = 0
+        key = reg.chrom.name
+        if key not in chrom_regions:
+            chrom_regions[key] = (reg.chrom, [], [], [])
+        chrom_regions[key][1].append(start)
+        chrom_regions[key][2].append(strand)
+        chrom_regions[key][3].append(i)
+
+    if n_skip:
+        sys.stderr.write("WARNING: skipped %d regions that extend past "
+                         "chromosome ends\n" % n_skip)
+
+    result = []
+    for key in sorted(chrom_regions.keys()):
+        chrom, starts, strands, indices = chrom_regions[key]
+        starts = np.array(starts, dtype=np.int64)
+        order = np.argsort(starts, kind='stable')
+        result.append((chrom, starts[order],
+                       np.array(strands, dtype=np.int8)[order],
+                       np.array(indices, dtype=np.int64)[order]))
+
+    return result
+
+
+
+def get_span_groups(starts, width, max_span):
+    """Splits the sorted start positions of regions into groups of
+    nearby regions that can be read as a single span of at most
+    max_span bases. Returns a list of (first, last) index pairs."""
+    groups = []
+    first = 0
+    for i in range(1, starts.size):
+        if (starts[i] - starts[i-1] > 2 * width or
+            starts[i] + width - starts[first] > max_span):
+            groups.append((first, i))
+            first = i
+    if starts.size:
+        groups.append((first, starts.size))
+    return groups
+
+
+
+def iter_region_matrices(track_class, options, chrom_regions, width,
+                         max_span):
+    """Creates tracks over spans of nearby regions (from
+    get_centered_regions) and yields (indices, matrix) for each span,
+    where each row of the (regions x positions) matrix holds the values
+    of one region, reversed for regions on the reverse strand, and
+    indices are the positions of the regions in the original list.
+    Raises a ValueError if tracks of this type do not have a value for
+    every position."""
+    import genome.coord
+
+    offsets = np.arange(width)
+
+    for chrom, starts, strands, indices in chrom_regions:
+        sys.stderr.write("  %s: %d regions\n" % (chrom.name, starts.size))
+        for first, last in get_span_groups(starts, width, max_span):
+            span = genome.coord.Coord(chrom, int(starts[first]),
+                                      int(starts[last-1]) + width - 1)
+            track = track_class(span, options)
+
+            values = getattr(track, "values", None)
+            if values is None or len(values) != span.end - span.start + 1:
+                raise ValueError("tracks of type %s do not have a value "
+                                 "for every position" % options['type'])
+
+            idx = (starts[first:last] - span.start)[:,None] + offsets
+            matrix = np.asarray(values, dtype=np.float64)[idx]
+            rev = strands[first:last] == -1
+            matrix[rev] = matrix[rev, ::-1]
+
+            yield indices[first:last], matrix
@@ -0,0 +1,102 @@
+import numpy as np
+from .rlib import robjects
+
+from .continuoustrack import ContinuousTrack
+
+
+
+class AggregateRegion(object):
+    """The region drawn by aggregate plots. Positions 1..width
+    correspond to offsets from the centers of the aggregated
+    regions."""
+
+    def __init__(self, width):
+        self.chrom = None
+        self.start = 1
+        self.end = width
+        self.strand = 0
+
+    def length(self):
+        return self.end - self.start + 1
+
+    def __str__(self):
+        return "aggregate:%d-%d" % (self.start, self.end)
+
+
+
+class AggregateTrack(ContinuousTrack):
+    """Draws the mean or median of a track across many aligned regions
+    as a continuous profile. A band between a lower and upper quantile
+    is drawn over the profile in BAND_COLOR."""
+
+    def __init__(self, values, region, options, lower=None, upper=None):
+        self.lower = lower
+        self.upper = upper
+
+        super(AggregateTrack, self).__init__(values, region, options)
+
+        if 'band_color' in options:
+            self.band_color = options['band_color'].replace('"', '')
+        else:
+            self.band_color = "#00000040"
+
+
+    def set_y_range(self, options):
+        super(AggregateTrack, self).set_y_range(options)
+
+        # make room for the quantile band unless limits are given
+        for band in (self.lower, self.upper):
+            if band is None:
+                continue
+            defined = band[~np.isnan(band)]
+            if defined.size == 0:
+                continue
+            if 'max_val' not in options:
+                self.max_val = max(self.max_val, np.max(defined))
+            if 'min_val' not in options:
+                self.min_val = min(self.min_val, np.min(defined))
+
+
+    def get_export_data(self):
+        data = {'values' : self.values}
+        if self.lower is not None:
+            data['lower'] = self.lower
+            data['upper'] = self.upper
+        return data
+
+
+    def draw_track(self, r):
+        super(AggregateTrack, self).draw_track(r)
+
+        if self.lower is None:
+            return
+
+        if self.max_val == self.min_val:
+            yscale = self.height
+        else:
+            yscale = self.height / (self.max_val - self.min_val)
+
+        lower = (np.clip(self.lower, self.min_val, self.max_val) -
+                 self.min_val) * yscale + self.bottom
+        upper = (np.clip(self.upper, self.min_val, self.max_val) -
+                 self.min_val) * yscale + self.bottom
+
+        # draw a polygon for each run of defined positions, separated
+        # by NA so that they are drawn with a single call
+        x = np.arange(self.region.start, self.region.end + 1,
+                      dtype=np.float64)
+        defined = ~(np.isnan(lower) | np.isnan(upper))
+        edges = np.diff(np.concatenate([[0], defined.astype(np.int8), [0]]))
+        run_starts = np.where(edges == 1)[0]
+        run_ends = np.where(edges == -1)[0]
+
+        poly_x = []
+        poly_y = []
+        for i, j in zip(run_starts, run_ends):
+            poly_x.extend([x[i:j], x[i:j][::-1], [np.nan]])
+            poly_y.extend([lower[i:j], upper[i:j][::-1], [np.nan]])
+
+        if poly_x:
+            r.polygon(robjects.FloatVector(np.concatenate(poly_x)),
+                      robjects.FloatVector(np.concatenate(poly_y)),
+                      col=self.band_color, border="NA")
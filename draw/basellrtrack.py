@@ -2,7 +2,7 @@
 import sys
 
 import numpy as np
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 from .continuoustrack import ContinuousTrack
 
@@ -49,6 +49,18 @@ class BaseLLRTrack(ContinuousTrack):
         axis = (-min_val * yscale) + self.bottom
         vals = (self.values * yscale) + axis
 
+        if self.raster_width:
+            # paint positive and negative fill heights of each pixel
+            # column directly into an image
+            img = self.get_raster_image(r)
+            col_min, col_max = img.get_column_range(vals)
+            col_max[col_max < axis] = np.nan
+            col_min[col_min >= axis] = np.nan
+            img.fill_columns(axis, col_max, self.pos_color)
+            img.fill_columns(col_min, axis, self.neg_color)
+            img.draw()
+            self.draw_y_axis(r, self.n_ticks)
+            return
                 
         (x1, x2, y) = self.get_segments(vals)
 
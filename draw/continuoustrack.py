@@ -2,9 +2,10 @@
 import sys
 
 import numpy as np
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 from .numerictrack import NumericTrack
+from . import simplify
 
 
 class ContinuousTrack(NumericTrack):
@@ -35,6 +36,18 @@ class ContinuousTrack(NumericTrack):
         else:
             self.n_ticks = 3
 
+        self.init_simplify(options)
+
+    
+    def init_simplify(self, options):
+        """Sets how closely drawn outlines must follow the values, in
+        device units (1/72 inch on PDF and SVG devices). Setting
+        SIMPLIFY_TOLERANCE=0 turns off simplification."""
+        if 'simplify_tolerance' in options:
+            self.simplify_tolerance = float(options['simplify_tolerance'])
+        else:
+            self.simplify_tolerance = simplify.DEFAULT_TOLERANCE
+
     
     def smooth_values(self, vals, win_sz, method):
         if method == 'average':
@@ -198,6 +211,26 @@ class ContinuousTrack(NumericTrack):
         return (np.array(p_x), np.array(p_y))
             
         
+    def draw_step_polygons(self, r, vals, color, border):
+        """Draws the filled step outline of values that have already
+        been scaled to y coordinates, with a single polygon call. The
+        outline is simplified so that it is unchanged at the resolution
+        of the device (see the SIMPLIFY_TOLERANCE option)."""
+        x, y = simplify.get_step_polygons(vals, self.region.start,
+                                          self.bottom)
+        if x.size == 0:
+            return
+
+        if self.simplify_tolerance > 0:
+            unit_x, unit_y = self.get_device_units(r)
+            x, y = simplify.simplify_path(x, y,
+                                          unit_x * self.simplify_tolerance,
+                                          unit_y * self.simplify_tolerance)
+
+        r.polygon(robjects.FloatVector(x), robjects.FloatVector(y),
+                  col=color, border=border)
+
+
     def draw_track(self, r):
 
         if self.max_val == self.min_val:
@@ -207,36 +240,17 @@ class ContinuousTrack(NumericTrack):
 
         vals = (self.values - self.min_val) * yscale + self.bottom
 
-        # break region into smaller blocks because
-        # some programs (e.g. illustrator) don't like it when
-        # polygons have too many points
-        block_sz = 10000
-        for block_start in range(0, vals.size, block_sz):
-            block_end = min(block_start + block_sz, vals.size)
-
-            block_vals = vals[block_start:block_end]
-            
-            # identify contiguous segments with same values
-            (x1, x2, y) = self.get_segments(block_vals)
-
-            # new way of drawing: convert contiguous segments
-            # to polygon coordinates
-            (x, y) = self.get_polygon_coords(x1, x2, y)
-
-            if len(x) > 0:
-                r.polygon(robjects.FloatVector(x + block_start),
-                          robjects.FloatVector(y),
-                          col=self.color,
-                          border=self.border_color)
-                      
-        # old way, 
-        # n_seg = len(x1)
-        # if n_seg > 0:
-        #     r.rect(robjects.FloatVector(x1),
-        #            robjects.FloatVector([self.bottom]),
-        #            robjects.FloatVector(x2),
-        #            robjects.FloatVector(y), col=self.color,
-        #            border=robjects.NA_Logical)
+        if self.raster_width:
+            # paint fill height of each pixel column directly
+            # into an image instead of drawing a polygon
+            img = self.get_raster_image(r)
+            col_min, col_max = img.get_column_range(vals)
+            img.fill_columns(self.bottom, col_max, self.color)
+            img.draw()
+            self.draw_y_axis(r, self.n_ticks)
+            return
+
+        self.draw_step_polygons(r, vals, self.color, self.border_color)
 
         self.draw_y_axis(r, self.n_ticks)
 
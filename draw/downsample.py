@@ -0,0 +1,49 @@
+
+import zlib
+
+import numpy as np
+
+
+# reads are downsampled in blocks of this many positions. Each block
+# uses its own random number generator, seeded from the seed, the
+# chromosome and the block number, so that the outcome at a position
+# does not depend on which region (or which process) it is drawn in
+DEFAULT_BLOCK_SIZE = 1000000
+
+DEFAULT_SEED = 0
+
+
+def get_block_rng(seed, chrom_name, block):
+    """Returns the random number generator for a block of positions"""
+    return np.random.default_rng([seed, zlib.crc32(chrom_name.encode()),
+                                  block])
+
+
+def get_block_bounds(start, end, chrom_len, block_size=DEFAULT_BLOCK_SIZE):
+    """Returns the start and end of the blocks that span the
+    positions start..end"""
+    block_start = ((start - 1) // block_size) * block_size + 1
+    block_end = min(((end - 1) // block_size + 1) * block_size, chrom_len)
+    return block_start, block_end
+
+
+def downsample_blocks(counts, chrom_name, start, p, seed=DEFAULT_SEED,
+                      block_size=DEFAULT_BLOCK_SIZE):
+    """Downsamples read counts by keeping each read with probability p.
+    counts contains the counts at positions start..start+len(counts)-1
+    and must cover whole blocks (apart from the last block of a
+    chromosome). Returns an array of the same type as counts."""
+    if (start - 1) % block_size != 0:
+        raise ValueError("start position %d is not at the start of "
+                         "a block" % start)
+
+    result = np.empty(counts.size, dtype=counts.dtype)
+    first_block = (start - 1) // block_size
+
+    for i in range(0, counts.size, block_size):
+        rng = get_block_rng(seed, chrom_name, first_block + i // block_size)
+        block_counts = counts[i:i+block_size]
+        result[i:i+block_counts.size] = \
+            rng.binomial(block_counts.astype(np.int64), p)
+
+    return result
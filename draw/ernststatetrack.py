@@ -3,7 +3,7 @@ import sys
 
 from .statetrack import StateTrack
 
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 
 class ErnstStateTrack(StateTrack):
@@ -0,0 +1,156 @@
+
+import ast
+import operator
+
+import numpy as np
+
+
+# default number of positions evaluated at a time
+DEFAULT_CHUNK_SIZE = 65536
+
+
+FUNCTIONS = {"log" : np.log,
+             "log2" : np.log2,
+             "log10" : np.log10,
+             "exp" : np.exp,
+             "sqrt" : np.sqrt,
+             "abs" : np.abs,
+             "isnan" : np.isnan,
+             "minimum" : np.fmin,
+             "maximum" : np.fmax,
+             "where" : np.where}
+
+BINARY_OPS = {ast.Add : np.add,
+              ast.Sub : np.subtract,
+              ast.Mult : np.multiply,
+              ast.Div : np.true_divide,
+              ast.Pow : np.power}
+
+UNARY_OPS = {ast.USub : np.negative,
+             ast.UAdd : np.positive,
+             ast.Not : np.logical_not}
+
+COMPARE_OPS = {ast.Lt : np.less,
+               ast.LtE : np.less_equal,
+               ast.Gt : np.greater,
+               ast.GtE : np.greater_equal,
+               ast.Eq : np.equal,
+               ast.NotEq : np.not_equal}
+
+BOOL_OPS = {ast.And : np.logical_and,
+            ast.Or : np.logical_or}
+
+CONSTANTS = {"nan" : np.nan,
+             "inf" : np.inf}
+
+
+
+class Expression(object):
+    """An arithmetic expression over named arrays, such as
+    'log2((dnase + 1) / (input1 + input2 + 1))'. Expressions may use
+    numbers, the names of source arrays, the operators + - * / ** and
+    comparisons, 'and', 'or', 'not', the constants nan and inf, and
+    the functions: log, log2, log10, exp, sqrt, abs, isnan,
+    minimum, maximum and where (e.g. 'where(uniq > 0.5, x, nan)')."""
+
+    def __init__(self, expr_str):
+        self.expr_str = expr_str
+        self.names = set()
+
+        try:
+            tree = ast.parse(expr_str.strip(), mode='eval')
+        except SyntaxError as err:
+            raise ValueError("invalid expression '%s': %s" % (expr_str, err))
+
+        self.func = self.compile_node(tree.body)
+
+
+    def compile_node(self, node):
+        """Converts a node of the expression's syntax tree to a function
+        that takes a dictionary of arrays and evaluates the node"""
+        if isinstance(node, ast.Constant) and \
+           isinstance(node.value, (int, float)):
+            val = float(node.value)
+            return lambda env: val
+
+        if isinstance(node, ast.Name):
+            name = node.id
+            if name in CONSTANTS:
+                val = CONSTANTS[name]
+                return lambda env: val
+            self.names.add(name)
+            return operator.itemgetter(name)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPS:
+            op = BINARY_OPS[type(node.op)]
+            left = self.compile_node(node.left)
+            right = self.compile_node(node.right)
+            return lambda env: op(left(env), right(env))
+
+        if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPS:
+            op = UNARY_OPS[type(node.op)]
+            operand = self.compile_node(node.operand)
+            return lambda env: op(operand(env))
+
+        if isinstance(node, ast.BoolOp) and type(node.op) in BOOL_OPS:
+            op = BOOL_OPS[type(node.op)]
+            values = [self.compile_node(v) for v in node.values]
+            def eval_bool_op(env):
+                result = values[0](env)
+                for v in values[1:]:
+                    result = op(result, v(env))
+                return result
+            return eval_bool_op
+
+        if isinstance(node, ast.Compare):
+            ops = []
+            for cmp_op in node.ops:
+                if type(cmp_op) not in COMPARE_OPS:
+                    break
+                ops.append(COMPARE_OPS[type(cmp_op)])
+            else:
+                operands = [self.compile_node(node.left)] + \
+                           [self.compile_node(c) for c in node.comparators]
+                def eval_compare(env):
+                    vals = [f(env) for f in operands]
+                    result = ops[0](vals[0], vals[1])
+                    for i in range(1, len(ops)):
+                        result = np.logical_and(result,
+                                                ops[i](vals[i], vals[i+1]))
+                    return result
+                return eval_compare
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+           and node.func.id in FUNCTIONS and not node.keywords:
+            func = FUNCTIONS[node.func.id]
+            args = [self.compile_node(a) for a in node.args]
+            return lambda env: func(*[a(env) for a in args])
+
+        raise ValueError("unsupported element '%s' in expression '%s'" %
+                         (ast.dump(node), self.expr_str))
+
+
+    def evaluate(self, sources, length, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Evaluates the expression over a dictionary of source arrays
+        of the provided length. The expression is evaluated over
+        chunk_size positions at a time, so temporary arrays are
+        never larger than a chunk. Returns an array of float32
+        values."""
+        missing = self.names - set(sources.keys())
+        if missing:
+            raise ValueError("expression '%s' refers to undefined "
+                             "source(s): %s" % (self.expr_str,
+                                                ", ".join(sorted(missing))))
+
+        result = np.empty(length, dtype=np.float32)
+
+        for start in range(0, length, chunk_size):
+            end = min(start + chunk_size, length)
+            env = {}
+            for name in self.names:
+                env[name] = sources[name][start:end].astype(np.float64)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[start:end] = self.func(env)
+
+        return result
@@ -0,0 +1,89 @@
+import sys
+
+import numpy as np
+
+from .basellrtrack import BaseLLRTrack
+from . import wigindex
+from . import trackcache
+from .expression import Expression, DEFAULT_CHUNK_SIZE
+
+
+def get_source_values(track_path, region):
+    """Returns the values of a source track over a region. Sources are
+    read through the shared block cache, so sources that are shared by
+    several expression tracks in the same window (e.g. the same input
+    track) are only read once."""
+    if wigindex.is_wig_path(track_path):
+        return trackcache.get_wig_values(track_path, region)
+    return trackcache.get_track_values(track_path, region)
+
+
+
+class ExpressionTrack(BaseLLRTrack):
+    """A continuous track whose values are computed from an arithmetic
+    expression over one or more named source tracks, for example:
+
+        SOURCE_DNASE=dnase/dnase_all_combined
+        SOURCE_INPUT=input/input_combined
+        EXPRESSION=log2((dnase + 1) / (input + 1))
+
+    Each SOURCE_<NAME> option gives the track (or the path to a wig or
+    bedGraph file) that <name> refers to in the expression (see
+    draw.expression for the supported operators and functions). Like
+    LLRTracks, negative values are drawn below an axis at 0.0."""
+
+    axis_values_by_position = True
+
+    def __init__(self, region, options):
+        values = self.evaluate(region, options)
+
+        sys.stderr.write("  %d > 0; %d < 0; %d == 0\n" %
+                         (np.sum(values > 0.0), np.sum(values < 0.0),
+                          np.sum(values == 0.0)))
+
+        super_init = super(ExpressionTrack, self).__init__
+        super_init(values, region, options)
+
+
+    @classmethod
+    def evaluate(cls, region, options):
+        """Returns the values of the expression over a region"""
+        if 'expression' not in options:
+            raise ValueError("ExpressionTrack requires EXPRESSION option")
+
+        expr = Expression(options['expression'])
+
+        # config option names are lowercase, so names used in the
+        # expression are matched to SOURCE_<NAME> options in lowercase
+        sources = {}
+        for name in expr.names:
+            option_name = "source_" + name.lower()
+            if option_name not in options:
+                raise ValueError("expression '%s' uses '%s' but there is "
+                                 "no %s option" % (expr.expr_str, name,
+                                                   option_name.upper()))
+            sources[name] = get_source_values(options[option_name], region)
+
+        if 'chunk_size' in options:
+            chunk_size = int(options['chunk_size'])
+        else:
+            chunk_size = DEFAULT_CHUNK_SIZE
+
+        return expr.evaluate(sources, region.length(), chunk_size)
+
+
+    @classmethod
+    def get_axis_values(cls, region, options):
+        # smoothing is ignored, since averaging cannot widen the
+        # range of the values
+        return cls.evaluate(region, options)
+
+
+    @classmethod
+    def prefetch(cls, region, options):
+        if 'expression' not in options:
+            return
+        for name in Expression(options['expression']).names:
+            option_name = "source_" + name.lower()
+            if option_name in options:
+                get_source_values(options[option_name], region)
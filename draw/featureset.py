@@ -0,0 +1,158 @@
+
+import numpy as np
+
+
+FEATURE_DTYPE = [('start', np.int64),
+                 ('end', np.int64),
+                 ('strand', np.int8),
+                 ('score', np.float64),
+                 ('name_idx', np.int32)]
+
+
+
+class FeatureSet(object):
+    """A compact set of features stored as columns of a numpy structured
+    array, with fields start, end, strand, score and name_idx. Feature
+    names are stored once each, in the names list, and name_idx gives
+    the index of the name of each feature (or -1 if it has no name).
+    Features are kept in order of their start position."""
+
+    __slots__ = ('data', 'names')
+
+    def __init__(self, data, names=None):
+        order = np.argsort(data['start'], kind='stable')
+        self.data = data[order]
+        self.names = names if names is not None else []
+
+
+    @classmethod
+    def from_arrays(cls, start, end, strand=None, score=None):
+        data = np.zeros(len(start), dtype=FEATURE_DTYPE)
+        data['start'] = start
+        data['end'] = end
+        if strand is not None:
+            data['strand'] = strand
+        if score is not None:
+            data['score'] = score
+        data['name_idx'] = -1
+        return cls(data)
+
+
+    @classmethod
+    def from_table(cls, table, region):
+        """Reads the features in an HDF5 table (with start and end
+        columns, and optionally strand, score and name columns) that
+        overlap the region, with a single query"""
+        qry = "(start <= %d) & (end >= %d)" % (region.end, region.start)
+        rows = table.readWhere(qry)
+
+        data = np.zeros(rows.size, dtype=FEATURE_DTYPE)
+        data['start'] = rows['start']
+        data['end'] = rows['end']
+        data['name_idx'] = -1
+
+        fields = rows.dtype.names
+        if 'strand' in fields:
+            data['strand'] = rows['strand']
+        if 'score' in fields:
+            data['score'] = rows['score']
+
+        names = []
+        if 'name' in fields and rows.size:
+            uniq_names, name_idx = np.unique(rows['name'],
+                                             return_inverse=True)
+            data['name_idx'] = name_idx
+            names = [n.decode() if isinstance(n, bytes) else str(n)
+                     for n in uniq_names]
+
+        return cls(data, names)
+
+
+    @classmethod
+    def from_flags(cls, vals, region):
+        """Creates features for each run of positions in the region
+        where vals is non-zero"""
+        flags = np.concatenate([[0], (vals != 0).astype(np.int8), [0]])
+        d = np.diff(flags)
+        starts = np.where(d == 1)[0] + region.start
+        ends = np.where(d == -1)[0] + region.start - 1
+        return cls.from_arrays(starts, ends)
+
+
+    @classmethod
+    def from_runs(cls, vals, region):
+        """Creates a feature for each run of identical values across
+        the region. Returns the features and the value of each run."""
+        if vals.size == 0:
+            return cls.from_arrays([], []), vals
+
+        change = np.where(vals[1:] != vals[:-1])[0] + 1
+        run_starts = np.concatenate([[0], change])
+        run_ends = np.concatenate([change, [vals.size]]) - 1
+
+        features = cls.from_arrays(run_starts + region.start,
+                                   run_ends + region.start)
+        return features, vals[run_starts]
+
+
+    def __len__(self):
+        return self.data.size
+
+
+    @property
+    def start(self):
+        return self.data['start']
+
+    @property
+    def end(self):
+        return self.data['end']
+
+    @property
+    def strand(self):
+        return self.data['strand']
+
+    @property
+    def score(self):
+        return self.data['score']
+
+
+    def by_strand(self, fwd_val, rev_val, other_val):
+        """Returns an array with fwd_val for each forward-strand
+        feature, rev_val for each reverse-strand feature and other_val
+        for features without a strand"""
+        return np.where(self.strand == 1, fwd_val,
+                        np.where(self.strand == -1, rev_val, other_val))
+
+
+    def get_names(self):
+        """Returns an array with the name of each feature"""
+        names = np.array(self.names + [""], dtype=np.str_)
+        return names[self.data['name_idx']]
+
+
+
+def assign_rows(starts, ends, padding=0.0):
+    """Assigns features to rows so that features in the same row do not
+    overlap (after extending each side of each feature by padding).
+    Features are placed in order of their start positions, each into
+    the first row where it fits. Returns an array with the row of each
+    feature and the number of rows."""
+    starts = np.asarray(starts, dtype=np.float64) - padding
+    ends = np.asarray(ends, dtype=np.float64) + padding
+    rows = np.empty(starts.size, dtype=np.int64)
+
+    # end of the last feature placed in each row
+    row_ends = np.empty(starts.size, dtype=np.float64)
+    n_row = 0
+
+    for i in np.argsort(starts, kind='stable'):
+        free = np.flatnonzero(row_ends[:n_row] < starts[i])
+        if free.size:
+            row = free[0]
+        else:
+            row = n_row
+            n_row += 1
+        row_ends[row] = ends[i]
+        rows[i] = row
+
+    return rows, n_row
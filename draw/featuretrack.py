@@ -1,10 +1,13 @@
 
 import sys
 
+import numpy as np
+
 from .track import Track
+from .featureset import FeatureSet
 
-import genome.coord
-import rpy2.robjects as robjects
+import genome.track
+from .rlib import robjects
 
 MIN_FEAT_LEN = 5
 
@@ -13,6 +16,7 @@ class FeatureTrack(Track):
 
     def __init__(self, region, options):        
         super(FeatureTrack, self).__init__(region, options)
+        self.init_collapse(options)
 
         if 'draw_labels' in options:
             self.draw_labels = self.parse_bool_str(options['draw_labels'])
@@ -28,20 +32,11 @@ class FeatureTrack(Track):
         
         
         self.track_name = options['track']
-        self.features = []
 
         # get overlapping features from database
-        gdb = options['gdb']
-        track = gdb.open_track(self.track_name)
+        track = genome.track.Track(self.track_name)
         table = track.h5f.getNode("/" + self.region.chrom.name)
-
-        qry = "(start <= %d) & (end >= %d)" % (self.region.end,
-                                               self.region.start)
-        for row in table.where(qry):
-            feat = genome.coord.Coord(region.chrom, row['start'],
-                                      row['end'], strand=row['strand'],
-                                      score=row['score'], name=row['name'])
-            self.features.append(feat)
+        self.features = FeatureSet.from_table(table, self.region)
 
 
         # set padding here if labels are used...
@@ -49,19 +44,43 @@ class FeatureTrack(Track):
             padding = region.length() * 0.1
         else:
             padding = region.length() * 0.025
-            
-        self.assign_feature_rows(self.features, use_strands=False,
-                                 padding=padding)
+
+        # don't bother assigning rows if there are too many features
+        if not self.check_collapse(len(self.features)):
+            self.assign_feature_rows(self.features, use_strands=False,
+                                     padding=padding)
+            self.check_collapse()
         
         if self.height <= 0.0:
-            # assign height based on how many rows of features
-            # there are
-            self.height = float(self.n_row) * 0.5
+            if self.collapsed:
+                self.height = self.get_collapsed_height()
+            else:
+                # assign height based on how many rows of features
+                # there are
+                self.height = float(self.n_row) * 0.5
 
         track.close()
 
-    
+
+    def get_export_data(self):
+        return {'start' : self.features.start,
+                'end' : self.features.end,
+                'strand' : self.features.strand,
+                'score' : self.features.score,
+                'name' : self.features.get_names()}
+
+
     def draw_track(self, r):
+        feats = self.features
+        colors = feats.by_strand(self.fwd_color, self.rev_color, self.color)
+
+        if self.collapsed:
+            self.draw_collapsed(r, feats.start, feats.end, colors)
+            return
+
+        if len(feats) == 0:
+            return
+
         if self.n_row > 0:
             y_scale = self.height / float(self.n_row)
         else:
@@ -70,33 +89,29 @@ class FeatureTrack(Track):
         margin_height = y_scale - feat_height
         region_len = self.region.end - self.region.start + 1.0
 
-        for feat in self.features:
-            row = self.row_assignment[feat]
-            top = self.top - ((row * feat_height) + (margin_height)*row)
-            bottom = top - feat_height
-
-            if feat.strand == 1:
-                color = self.fwd_color
-                border_color = self.fwd_border_color
-                label = "> %s" % feat.name
-            elif feat.strand == -1:
-                color = self.rev_color
-                border_color = self.rev_border_color
-                label = "< %s" % feat.name
-            else:
-                color = self.color
-                border_color = self.border_color
-                label = feat.name
-                
-            r.rect(feat.start - 0.5, bottom, feat.end + 0.5, top,
-                   col=color, border=border_color)
-
-            if self.draw_labels:     
-                # draw feature label?
-                mid = (top + bottom) * 0.5
-                label_len = float(len(label))
-                offset = (0.0075 * label_len) * region_len
-                r.text(x=(feat.end + offset), y=mid,
-                       labels=r.c(label), col=color, cex=self.cex)
+        rows = self.feature_rows
+        top = self.top - ((rows * feat_height) + margin_height*rows)
+        bottom = top - feat_height
+
+        border_colors = feats.by_strand(self.fwd_border_color,
+                                        self.rev_border_color,
+                                        self.border_color)
 
+        # draw all features with a single call
+        r.rect(robjects.FloatVector(feats.start - 0.5),
+               robjects.FloatVector(bottom),
+               robjects.FloatVector(feats.end + 0.5),
+               robjects.FloatVector(top),
+               col=robjects.StrVector(colors),
+               border=robjects.StrVector(border_colors))
 
+        if self.draw_labels:
+            # draw feature labels
+            prefixes = feats.by_strand("> ", "< ", "")
+            labels = np.char.add(prefixes, feats.get_names())
+            mid = (top + bottom) * 0.5
+            offsets = (0.0075 * np.char.str_len(labels)) * region_len
+            r.text(x=robjects.FloatVector(feats.end + offsets),
+                   y=robjects.FloatVector(mid),
+                   labels=robjects.StrVector(labels),
+                   col=robjects.StrVector(colors), cex=self.cex)
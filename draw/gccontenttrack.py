@@ -7,24 +7,71 @@ from .continuoustrack import ContinuousTrack
 
 class GCContentTrack(ContinuousTrack):
      def __init__(self, region, options):
-          gdb = options['gdb']
-          
-          if 'track' in options:
-               track_name = options['track']
+          if 'gc_index' in options:
+               # compute windowed GC content directly from a cumulative
+               # GC count index (built with make_gc_index.py), which
+               # takes care of smoothing
+               values = self.get_indexed_gc(region, options)
+               options = dict(options)
+               options.pop('smooth', None)
           else:
-               track_name = "seq"
-          
-          track = gdb.open_track(track_name)
+               values = self.get_seq_gc(region, options)
+
+          # plot values as continuous track
+          super_init = super(GCContentTrack, self).__init__
+          super_init(values, region, options)
+
+
+     def get_seq_gc(self, region, options):
+          """Returns 1 for each G or C in the region and 0 for other
+          bases, read from the sequence track given by TRACK (default
+          seq) through the shared block cache"""
+          source = options.get('source', 'gdb').lower()
+          if source != "gdb":
+               # wig and bedGraph files contain values, not sequence
+               raise ValueError("GCContentTrack reads the sequence from a "
+                                "genome database track, SOURCE=%s is not "
+                                "supported" % options['source'])
+
+          seq_options = dict(options)
+          if 'track' not in seq_options:
+               seq_options['track'] = "seq"
 
           # retrieve data from sequence track
-          seq_ascii_vals = track.get_nparray(region.chrom, start=region.start,
-                                             end=region.end)
-          track.close()
+          seq_ascii_vals = self.get_source_values(region, seq_options)
 
           # convert to 0s and 1s, with Gs and Cs as 1s
-          values = (seq_ascii_vals == ord("G")) | (seq_ascii_vals == ord("C"))
+          return (seq_ascii_vals == ord("G")) | (seq_ascii_vals == ord("C"))
 
-          # plot values as continuous track
-          super_init = super(GCContentTrack, self).__init__
-          super_init(values, region, options)
 
+     def get_indexed_gc(self, region, options):
+          """Returns the fraction of G+C in a window (of size given by
+          the SMOOTH option) around each position in the region, using
+          two lookups into the cumulative GC count index per position"""
+          import tables
+
+          if 'smooth' in options:
+               win_sz = max(int(options['smooth']), 1)
+          else:
+               win_sz = 1
+
+          chrom_len = region.chrom.length
+          half_left = (win_sz - 1) // 2
+          half_right = win_sz // 2
+
+          # window around each position, truncated at chromosome ends
+          pos = np.arange(region.start, region.end + 1)
+          win_start = np.clip(pos - half_left, 1, chrom_len)
+          win_end = np.clip(pos + half_right, 1, chrom_len)
+
+          # read cumulative counts covering all windows with one read
+          lo = int(win_start[0]) - 1
+          hi = int(win_end[-1])
+          h5f = tables.openFile(options['gc_index'])
+          node = h5f.getNode("/" + region.chrom.name)
+          cum_gc = node[lo:hi+1].astype(np.int64)
+          h5f.close()
+
+          n_gc = cum_gc[win_end - lo] - cum_gc[win_start - 1 - lo]
+
+          return n_gc / (win_end - win_start + 1).astype(np.float64)
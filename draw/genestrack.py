@@ -1,10 +1,13 @@
 
 import sys
 
+import numpy as np
+
 from genome import coord
 import genome.gene
 from .track import Track
-from .transcripttrack import TranscriptTrack
+from .transcripttrack import TranscriptTrack, MetaGeneTrack
+from .metagene import get_metagene
 
         
 class GenesTrack(Track):
@@ -13,15 +16,21 @@ class GenesTrack(Track):
     def __init__(self, all_genes, region, options):
         # call superclass constructor
         super(GenesTrack, self).__init__(region, options)
+        self.init_collapse(options)
 
         self.genes = all_genes
         self.n_fwd_rows = None
         self.n_rev_rows = None
         self.row_assignment = None
-        self.color = options['color']
-        self.utr_color = options['utr_color']
+        self.color = options['color'].replace('"', '')
+        self.utr_color = options['utr_color'].replace('"', '')
         self.longest_isoform_only = self.parse_bool_str(options['longest_isoform_only'])
 
+        if 'merge_isoforms' in options:
+            self.merge_isoforms = self.parse_bool_str(options['merge_isoforms'])
+        else:
+            self.merge_isoforms = False
+
         if 'draw_label' in options:
             self.draw_label = self.parse_bool_str(options['draw_label'])
         else:
@@ -38,28 +47,52 @@ class GenesTrack(Track):
 
         self.overlap_trs = []
         for g in self.overlap_genes:
-            if self.longest_isoform_only:
+            if self.merge_isoforms:
+                # merge all transcripts into a single meta-gene
+                self.overlap_trs.append(get_metagene(g))
+            elif self.longest_isoform_only:
                 # only longest transcript for each gene
                 self.overlap_trs.append(g.get_longest_transcript())
             else:
                 # use all transcripts
-                self.overlap_trs.extend(gene.transcripts)
-        sys.stderr.write("%d transcripts overlap region" % len(self.overlap_trs))
+                self.overlap_trs.extend(g.transcripts)
+        sys.stderr.write("%d transcripts overlap region\n" % len(self.overlap_trs))
         
         # assign rows to the transcripts
         if self.draw_label:
             padding = region.length() * 0.2
         else:
             padding = region.length() * 0.01
-        self.assign_feature_rows(self.overlap_trs, padding=padding)
+
+        # don't bother assigning rows if there are too many transcripts
+        if not self.check_collapse(len(self.overlap_trs)):
+            self.assign_feature_rows(self.overlap_trs, padding=padding)
+            self.check_collapse()
 
         if self.height <= 0.0:
-            # assign height based on how many rows of transcripts
-            # there are
-            self.height = float(self.n_row) * 0.5
+            if self.collapsed:
+                self.height = self.get_collapsed_height()
+            else:
+                # assign height based on how many rows of transcripts
+                # there are
+                self.height = float(self.n_row) * 0.5
+
+
+    def get_export_data(self):
+        trs = self.overlap_trs
+        return {'start' : np.array([tr.start for tr in trs]),
+                'end' : np.array([tr.end for tr in trs]),
+                'strand' : np.array([tr.strand for tr in trs]),
+                'name' : np.array([str(tr.name) for tr in trs])}
 
 
     def draw_track(self, r):
+        if self.collapsed:
+            self.draw_collapsed(r, [tr.start for tr in self.overlap_trs],
+                                [tr.end for tr in self.overlap_trs],
+                                [self.color] * len(self.overlap_trs))
+            return
+
         # make margin 20% the width of a transcript
         y_scale  = self.height / float(self.n_row)
         tr_height = y_scale * 0.80
@@ -79,7 +112,10 @@ class GenesTrack(Track):
                           'height' : str(tr_height),
                           'draw_label' : draw_label_str}
             
-            tr_track = TranscriptTrack(tr, self.region, tr_options)
+            if self.merge_isoforms:
+                tr_track = MetaGeneTrack(tr, self.region, tr_options)
+            else:
+                tr_track = TranscriptTrack(tr, self.region, tr_options)
 
             # position transcript track
             row = self.row_assignment[tr]
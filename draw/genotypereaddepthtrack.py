@@ -2,15 +2,15 @@ import sys
 
 import numpy as np
 
-import genome.trackstat
-
 from .continuoustrack import ContinuousTrack
 
-import rpy2.robjects as robjects
-
 
 SNP_UNDEF = -1
 
+# SNP positions are looked up in the SNP index track in windows of up
+# to this many bases, with a single read per window
+SNP_LOOKUP_WINDOW = 1000000
+
 
 
 # set default colors for each genotype class
@@ -31,8 +31,163 @@ DEFAULT_ALT_COLOR = "#F47927"
 
 GENO_PROB_THRESH = 0.90
 
+DEFAULT_SNP_INDEX_TRACK = 'impute2/snp_index'
+DEFAULT_GENO_PROB_TRACK = 'impute2/yri_geno_probs'
+
+
+# SNP genotype tables, which are kept open for the whole run, keyed
+# by (snp index track, genotype probability track)
+_snp_tables = {}
+
+# individuals read from each individual file
+_individuals = {}
+
+# total reads of each individual, read from each total reads file
+_total_reads = {}
+
+
+
+class SNPGenotypeTable(object):
+    """Looks up the genotype probabilities of all individuals at SNPs,
+    using a track that gives the index of the SNP at each position and
+    a table (one per chromosome) with a row of genotype probabilities
+    per SNP. Both tracks are opened once, and the genotypes of each SNP
+    are only read once."""
+
+    def __init__(self, snp_index_trackname, geno_prob_trackname):
+        import genome.track
+        self.snp_index_track = genome.track.Track(snp_index_trackname)
+        self.geno_track = genome.track.Track(geno_prob_trackname)
+        self.geno_tabs = {}
+
+        # genotypes keyed by chromosome name, then by SNP position
+        self.genotypes = {}
+
+
+    def load_genotypes(self, chrom, positions):
+        """Reads the genotype probabilities at SNP positions on a
+        chromosome that have not already been read. Positions where
+        there is no SNP are skipped. Nearby positions are looked up
+        together: the SNP index is read once for each window of
+        SNP_LOOKUP_WINDOW bases, and the genotype rows of the SNPs in a
+        window are read with a single read."""
+        if chrom.name not in self.geno_tabs:
+            self.geno_tabs[chrom.name] = \
+              self.geno_track.h5f.getNode("/%s" % chrom.name)
+            self.genotypes[chrom.name] = {}
+        geno_tab = self.geno_tabs[chrom.name]
+        chrom_genotypes = self.genotypes[chrom.name]
+
+        new_pos = np.array(sorted(set(positions) - set(chrom_genotypes)),
+                           dtype=np.int64)
+
+        i = 0
+        while i < new_pos.size:
+            win_start = new_pos[i]
+            j = np.searchsorted(new_pos, win_start + SNP_LOOKUP_WINDOW)
+            win_pos = new_pos[i:j]
+            i = j
+
+            snp_index = self.snp_index_track.get_nparray(chrom,
+                                                         start=int(win_start),
+                                                         end=int(win_pos[-1]))
+            snp_idx = snp_index[win_pos - win_start]
+            is_snp = snp_idx != SNP_UNDEF
+            if not np.any(is_snp):
+                continue
+
+            lo = int(np.min(snp_idx[is_snp]))
+            hi = int(np.max(snp_idx[is_snp]))
+            rows = geno_tab[lo:hi+1]
+            for pos, idx in zip(win_pos[is_snp], snp_idx[is_snp]):
+                chrom_genotypes[int(pos)] = rows[idx - lo]
+
+
+    def get_genotypes(self, chrom, pos):
+        """Returns the genotype probabilities of all individuals at a
+        SNP, as an array with 3 values (ref, het, alt) per individual"""
+        chrom_genotypes = self.genotypes.get(chrom.name, {})
+        if pos not in chrom_genotypes:
+            self.load_genotypes(chrom, [pos])
+            chrom_genotypes = self.genotypes[chrom.name]
+
+        if pos not in chrom_genotypes:
+            raise ValueError("there is no SNP at position %s:%d\n" %
+                             (chrom.name, pos))
+
+        return chrom_genotypes[pos]
+
+
+    def __len__(self):
+        return sum(len(g) for g in self.genotypes.values())
+
+
+
+def get_snp_table(options):
+    """Returns the (shared) SNP genotype table named by the
+    SNP_INDEX_TRACK and GENO_PROB_TRACK options"""
+    if 'snp_index_track' in options:
+        snp_index_trackname = options['snp_index_track']
+    else:
+        sys.stderr.write("no SNP_INDEX_TRACK specified in config, "
+                         "assuming %s\n" % DEFAULT_SNP_INDEX_TRACK)
+        snp_index_trackname = DEFAULT_SNP_INDEX_TRACK
+
+    if 'geno_prob_track' in options:
+        geno_prob_trackname = options['geno_prob_track']
+    else:
+        sys.stderr.write("no GENO_PROB_TRACK specified in config, "
+                         "assuming %s\n" % DEFAULT_GENO_PROB_TRACK)
+        geno_prob_trackname = DEFAULT_GENO_PROB_TRACK
+
+    key = (snp_index_trackname, geno_prob_trackname)
+    if key not in _snp_tables:
+        _snp_tables[key] = SNPGenotypeTable(snp_index_trackname,
+                                            geno_prob_trackname)
+    return _snp_tables[key]
+
+
+
+def get_region_snp(region):
+    """Returns the position of the SNP used to group individuals
+    for a region (the first of its snp_pos attribute)"""
+    snp_positions = [int(x) for x in str(region.snp_pos).split(",")
+                     if x.strip()]
+
+    # just use first snp specified
+    if len(snp_positions) < 1:
+        raise ValueError("regions must specify at least one snp_pos")
+
+    return snp_positions[0]
+
+
+
+def classify_genotypes(genotypes, thresh=GENO_PROB_THRESH):
+    """Classifies individuals from an array with the (ref, het, alt)
+    genotype probabilities of each individual. Returns an array of
+    genotype classes: 0 for ref, 1 for het, 2 for alt, and -1 for
+    individuals with uncertain genotypes or with probabilities that
+    do not add to 1."""
+    probs = np.asarray(genotypes, dtype=np.float64).reshape(-1, 3)
+    tot_prob = probs.sum(axis=1)
+    valid = (tot_prob <= 1.01) & (tot_prob >= 0.99)
+
+    # the first genotype above the threshold is used
+    above = probs > thresh
+    geno_class = np.where(above.any(axis=1), np.argmax(above, axis=1), -1)
+    geno_class[~valid] = -1
+
+    return geno_class, valid
+
 
 class GenotypeReadDepthTrack(ContinuousTrack):     
+    """Sums the read depths of individuals with each genotype at a
+    region's SNP. The TRACK option (or PATH, for wig and bedGraph
+    sources) gives the track of each individual, with @INDIVIDUAL@ in
+    place of the individual's identifier. Summed values are scaled by
+    the total reads of the individuals, which are read from
+    TOTAL_READS_FILE (a file with an individual identifier and total
+    number of reads on each line)."""
         
     def __init__(self, region, options):
         if "individual_file" not in options:
@@ -41,32 +196,31 @@ class GenotypeReadDepthTrack(ContinuousTrack):
 
         self.individual_file = options['individual_file']
 
+        if 'total_reads_file' not in options:
+            sys.stderr.write("  WARNING: not scaling values of "
+                             "GenotypeReadDepthTrack because "
+                             "TOTAL_READS_FILE is not set\n")
+
         # read individuals from file, group by genotype
         inds_by_geno = self.get_individuals_by_geno(region, options)
         
-        ref_tracks = self.get_tracks(inds_by_geno['ref'], options)
-        het_tracks = self.get_tracks(inds_by_geno['het'], options)
-        alt_tracks = self.get_tracks(inds_by_geno['alt'], options)
-
-        gdb = options['gdb']
-
         # TODO: could allow colors to be specified in track options
         self.ref_color = DEFAULT_REF_COLOR
         self.het_color = DEFAULT_HET_COLOR
         self.alt_color = DEFAULT_ALT_COLOR
 
-        ref_vals, ref_total_mapped = \
-          self.get_vals_and_total_mapped(ref_tracks, region, options)
-        het_vals, het_total_mapped = \
-          self.get_vals_and_total_mapped(het_tracks, region, options)
-        alt_vals, alt_total_mapped = \
-          self.get_vals_and_total_mapped(alt_tracks, region, options)
+        ref_vals, ref_n_track, ref_total_mapped = \
+          self.get_vals_and_total_mapped(inds_by_geno['ref'], region, options)
+        het_vals, het_n_track, het_total_mapped = \
+          self.get_vals_and_total_mapped(inds_by_geno['het'], region, options)
+        alt_vals, alt_n_track, alt_total_mapped = \
+          self.get_vals_and_total_mapped(inds_by_geno['alt'], region, options)
 
         sys.stderr.write("individuals, tracks, total_mapped_reads by genotype:\n"
-                         "  %d/%d/%d, %d/%d/%d, %d/%d/%d\n" %
+                         "  %d/%d/%d, %d/%d/%d, %s/%s/%s\n" %
             (len(inds_by_geno['ref']), len(inds_by_geno['het']), 
-             len(inds_by_geno['alt']), len(ref_tracks), len(het_tracks), 
-             len(alt_tracks), ref_total_mapped, het_total_mapped,
+             len(inds_by_geno['alt']), ref_n_track, het_n_track, 
+             alt_n_track, ref_total_mapped, het_total_mapped,
              alt_total_mapped))
 
         ref_vals = self.rescale_values(ref_vals, ref_total_mapped, options)
@@ -109,64 +263,76 @@ class GenotypeReadDepthTrack(ContinuousTrack):
         else:
             self.n_ticks = 3
 
+        self.init_simplify(options)
+
 
 
         
 
         
                   
-    def read_all_individuals(self):
-        ind_list = []
-        f = open(self.individual_file)
-        for l in f:
-            ind = l.split()[0].replace("NA", "")
-            ind_list.append(ind)
-        f.close()
+    @classmethod
+    def prepare_regions(cls, regions, options):
+        """Reads the genotypes of the SNPs of all regions in one pass,
+        so that individuals can be grouped by genotype for each region
+        without further reads"""
+        table = get_snp_table(options)
 
-        return ind_list
+        chrom_positions = {}
+        for region in regions:
+            pos = get_region_snp(region)
+            key = region.chrom.name
+            if key not in chrom_positions:
+                chrom_positions[key] = (region.chrom, [])
+            chrom_positions[key][1].append(pos)
 
+        for chrom, positions in chrom_positions.values():
+            table.load_genotypes(chrom, positions)
 
-    
-    def get_snp_genotypes(self, region, individuals, options):
-        """Retrieves genotypes for all individuals for this 
-        region's SNP"""
-        gdb = options['gdb']
+        sys.stderr.write("read genotypes of %d SNPs\n" % len(table))
 
-        if 'snp_index_track' in options:
-            snp_index_trackname = options['snp_index_track']
-        else:
-            sys.stderr.write("no SNP_INDEX_TRACK specified in config, "
-                             "assuming /impute2/snp_index\n")
-            snp_index_trackname = 'impute2/snp_index'
 
-        if 'geno_prob_track' in options:
-            geno_prob_trackname = options['geno_prob_track']
-        else:
-            sys.stderr.write("no GENO_PROB_TRACK specified in config, "
-                             "assuming /impute2/yri_geno_probs\n")
-            geno_prob_trackname = 'impute2/yri_geno_probs'
-            
-        snp_index_track = gdb.open_track(snp_index_trackname)
-        geno_track = gdb.open_track(geno_prob_trackname)
-        geno_tab = geno_track.h5f.getNode("/%s" % region.chrom.name)
-
-        snp_positions = [int(x) for x in region.snp_pos.split(",")]
-
-        # just use first snp specified
-        if len(snp_positions) < 1:
-            raise ValueError("regions must specify at least one snp_pos")
-        
-        snp_pos = snp_positions[0]
-        
-        i = snp_index_track.get_val(region.chrom, snp_pos)
-
-        if i == SNP_UNDEF:
-            raise ValueError("there is no SNP at position %s:%d\n" %
-                             (region.chrom.name, snp_pos))
+    def read_all_individuals(self):
+        if self.individual_file not in _individuals:
+            ind_list = []
+            f = open(self.individual_file)
+            for l in f:
+                ind = l.split()[0].replace("NA", "")
+                ind_list.append(ind)
+            f.close()
+            _individuals[self.individual_file] = ind_list
+
+        return _individuals[self.individual_file]
+
+
+    def read_total_reads(self, options):
+        """Returns a dictionary with the total number of reads of each
+        individual listed in TOTAL_READS_FILE, or None if the option
+        is not set"""
+        if 'total_reads_file' not in options:
+            return None
+
+        path = options['total_reads_file']
+        if path not in _total_reads:
+            totals = {}
+            f = open(path)
+            for l in f:
+                words = l.split()
+                if len(words) < 2 or words[0].startswith("#"):
+                    continue
+                totals[words[0].replace("NA", "")] = int(words[1])
+            f.close()
+            _total_reads[path] = totals
+
+        return _total_reads[path]
 
-        geno_probs = geno_tab[i,]
 
-        return geno_probs
+    
+    def get_snp_genotypes(self, region, individuals, options):
+        """Retrieves genotypes for all individuals for this 
+        region's SNP"""
+        table = get_snp_table(options)
+        return table.get_genotypes(region.chrom, get_region_snp(region))
 
 
 
@@ -175,82 +341,103 @@ class GenotypeReadDepthTrack(ContinuousTrack):
         'unk'.  The values for each key are lists of individual
         identifiers with the genotypes: homozygous reference,
         heterozygous, homozygous alternative, unknown."""
-        individuals = self.read_all_individuals()
+        individuals = np.array(self.read_all_individuals(), dtype=object)
 
         genotypes = self.get_snp_genotypes(region, individuals, options)
+        geno_class, valid = classify_genotypes(genotypes)
+
+        if geno_class.size != individuals.size:
+            raise ValueError("expected genotypes for %d individuals, got %d"
+                             % (individuals.size, geno_class.size))
+
+        if not np.all(valid):
+            sys.stderr.write("WARNING: genotype probabilities do not add "
+                             "to 1.0 for individuals: %s\n" %
+                             ", ".join(individuals[~valid]))
+
+        return {'ref' : list(individuals[geno_class == 0]),
+                'het' : list(individuals[geno_class == 1]),
+                'alt' : list(individuals[geno_class == 2]),
+                'unk' : list(individuals[geno_class == -1])}
+
 
-        ind_dict = {'ref' : [], 'het' : [], 'alt' : [], 'unk' : []}
-        
-        for i in range(len(individuals)):
-            # look at genotype probs for individual
-            ref_prob = genotypes[i*3]
-            het_prob = genotypes[i*3+1]
-            alt_prob = genotypes[i*3+2]
-
-            tot_prob = ref_prob + het_prob + alt_prob
-
-            if tot_prob > 1.01 or tot_prob < 0.99:
-                sys.stderr.write("WARNING: genotype probabilities for "
-                                 "individual %s do not add to 1.0: "
-                                 "%.2f %.2f %.2f\n" % (individual[i], ref_prob, 
-                                                       het_prob, alt_prob))
-                ind_dict['unk'].append(individuals[i])
-            elif ref_prob > GENO_PROB_THRESH:
-                ind_dict['ref'].append(individuals[i])
-            elif het_prob > GENO_PROB_THRESH:
-                ind_dict['het'].append(individuals[i])
-            elif alt_prob > GENO_PROB_THRESH:
-                ind_dict['alt'].append(individuals[i])
-            else:
-                ind_dict['unk'].append(individuals[i])
-                
-        return ind_dict
 
+    def get_individual_options(self, ind, options):
+        """Returns the options for reading the values of an individual:
+        the track options with @INDIVIDUAL@ in TRACK and PATH replaced
+        by the individual's identifier"""
+        ind_options = dict(options)
+        for key in ('track', 'path'):
+            if key in options:
+                ind_options[key] = options[key].replace("@INDIVIDUAL@", ind)
+        return ind_options
 
 
-    def get_vals_and_total_mapped(self, tracks, region, options):
-        gdb = options['gdb']
+    def get_vals_and_total_mapped(self, individuals, region, options):
+        """Sums the values of the tracks of the individuals over the
+        region, through the shared source reader. Individuals without a
+        track are skipped. Returns the summed values (nan if no
+        individual has a track), the number of tracks and their total
+        number of reads (None if it is not known for every track)."""
+        totals = self.read_total_reads(options)
 
-        # sum values and total mapped reads from all tracks
         values = np.zeros(region.length())        
+        n_track = 0
         total_mapped_reads = 0
         
-        for track in tracks:
-            stat = genome.trackstat.get_stats(gdb, track)
-            total_mapped_reads += stat.sum
-                            
-            values[:] += track.get_nparray(region.chrom,
-                                           start=region.start,
-                                           end=region.end)
-            track.close()
+        for ind in individuals:
+            ind_options = self.get_individual_options(ind, options)
+            try:
+                ind_vals = self.get_source_values(region, ind_options)
+            except (IOError, OSError):
+                # skip individuals that do not have a track
+                continue
+
+            values += ind_vals
+            n_track += 1
+
+            if totals is None or total_mapped_reads is None:
+                total_mapped_reads = None
+            elif ind in totals:
+                total_mapped_reads += totals[ind]
+            else:
+                sys.stderr.write("  WARNING: no total reads for individual "
+                                 "%s in %s\n" % (ind,
+                                                 options['total_reads_file']))
+                total_mapped_reads = None
+
+        if n_track == 0:
+            values[:] = np.nan
 
-        return values, total_mapped_reads
+        return values, n_track, total_mapped_reads
 
 
     def rescale_values(self, values, total_mapped, options):
         # rescale by total number of sequenced reads for these
-        # individuals
-        if total_mapped > 0:
+        # individuals, if it is known
+        if total_mapped:
             # convert to FPKM
             scale = 1e9 / float(total_mapped)
             values *= scale
           
-            log_scale = False
-            if "log_scale" in options:
-                log_scale = self.parse_bool_str(options['log_scale'])
-
-            if log_scale:
-                # add one to values, but avoid possible overflow of
-                # 8 bit values
-                f = values < 255
-                values[f] += 1
-                values = np.log2(values)
-        else:
-            values[:] = np.nan
+        log_scale = False
+        if "log_scale" in options:
+            log_scale = self.parse_bool_str(options['log_scale'])
+
+        if log_scale:
+            # add one to values, but avoid possible overflow of
+            # 8 bit values
+            f = values < 255
+            values[f] += 1
+            values = np.log2(values)
 
         return values
 
 
+    def get_y_values(self):
+        return np.concatenate([self.ref_vals, self.het_vals, self.alt_vals])
+
+
     def set_y_range(self, options):
         """Sets the maximum and minimum values of the
         y-axis. Overrides method from parent class to consider values
@@ -300,23 +487,10 @@ class GenotypeReadDepthTrack(ContinuousTrack):
 
     
 
-    def get_tracks(self, individuals, options):
-        gdb = options['gdb']
-
-        track_list = []
-        for ind in individuals:
-            track_name = options['track'].replace("@INDIVIDUAL@", ind)
-
-            if gdb.has_track(track_name):
-                track_list.append(gdb.open_track(track_name))
-            else:
-                # skip tracks where there are no matching individuals
-                pass
-            
-
-        return track_list
-
-
+    def get_export_data(self):
+        return {'ref' : self.ref_vals,
+                'het' : self.het_vals,
+                'alt' : self.alt_vals}
 
 
     def draw_track(self, r):
@@ -333,29 +507,22 @@ class GenotypeReadDepthTrack(ContinuousTrack):
         else:
             geno_colors = [self.alt_color, self.het_color, self.ref_color]
             geno_vals = [self.alt_vals, self.het_vals, self.ref_vals]
+
+        if self.raster_width:
+            # paint each genotype into the same image, in drawing order
+            img = self.get_raster_image(r)
+            for gcol, gvals in zip(geno_colors, geno_vals):
+                vals = (gvals - self.min_val) * yscale + self.bottom
+                col_min, col_max = img.get_column_range(vals)
+                img.fill_columns(self.bottom, col_max, gcol)
+            img.draw()
+            self.draw_y_axis(r, self.n_ticks)
+            return
             
         for gcol, gvals in zip(geno_colors, geno_vals):
             vals = (gvals - self.min_val) * yscale + self.bottom
 
-            # break region into smaller blocks because
-            # some programs (e.g. illustrator) don't like it when
-            # polygons have too many points
-            block_sz = 10000
-            for block_start in range(0, vals.size, block_sz):
-                block_end = min(block_start + block_sz, vals.size)
-
-                block_vals = vals[block_start:block_end]
-
-                # identify contiguous segments with same values
-                (x1, x2, y) = self.get_segments(block_vals)
-
-                # convert contiguous segments to polygon coordinates
-                (x, y) = self.get_polygon_coords(x1, x2, y)
-
-                if len(x) > 0:
-                    r.polygon(robjects.FloatVector(x + block_start),
-                              robjects.FloatVector(y),
-                              col=gcol, border=gcol)
+            self.draw_step_polygons(r, vals, gcol, gcol)
 
         self.draw_y_axis(r, self.n_ticks)
 
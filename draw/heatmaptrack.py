@@ -0,0 +1,63 @@
+import sys
+
+import numpy as np
+
+from .track import Track
+from .raster import RasterImage
+
+
+
+class HeatmapTrack(Track):
+    """Draws a (rows x columns) matrix of values, such as the signal of
+    one track across many aligned regions, as a single raster image.
+    Values are colored on a linear ramp from LOW_COLOR (default white)
+    at MIN_VAL (default 0) to COLOR at MAX_VAL (default the 99th
+    percentile of the values)."""
+
+    def __init__(self, values, region, options):
+        options = dict(options)
+        if 'height' not in options:
+            options['height'] = "8.0"
+
+        super(HeatmapTrack, self).__init__(region, options)
+
+        self.values = values
+
+        if 'low_color' in options:
+            self.low_color = options['low_color'].replace('"', '')
+        else:
+            self.low_color = "white"
+
+        defined = values[~np.isnan(values)]
+
+        if 'min_val' in options:
+            self.min_val = float(options['min_val'])
+        else:
+            self.min_val = 0.0
+
+        if 'max_val' in options:
+            self.max_val = float(options['max_val'])
+        elif defined.size:
+            self.max_val = float(np.percentile(defined, 99))
+        else:
+            self.max_val = 1.0
+
+        sys.stderr.write("  heatmap color range: %g - %g\n" %
+                         (self.min_val, self.max_val))
+
+        # show the color range in the label
+        self.track_label = ("%s (%g-%g)" % (self.track_label, self.min_val,
+                                            self.max_val)).strip()
+
+
+    def get_export_data(self):
+        return {'values' : self.values}
+
+
+    def draw_track(self, r):
+        n_row, n_col = self.values.shape
+        img = RasterImage(r, self.left, self.right, self.top, self.bottom,
+                          n_col, n_row)
+        img.fill_values(self.values, self.min_val, self.max_val,
+                        self.low_color, self.color)
+        img.draw()
@@ -2,9 +2,7 @@
 import sys
 
 import numpy as np
-import rpy2.robjects as robjects
-
-import genome.track
+from .rlib import robjects
 
 from .continuoustrack import ContinuousTrack
 from .basellrtrack import BaseLLRTrack
@@ -15,31 +13,37 @@ class LLRTrack(BaseLLRTrack):
     Draws negative values below an axis at 0.0 (rather than setting the
     axis at the minimum value for the track and drawing all values above
     it)"""
-    def __init__(self, region, options):
-        source = "gdb"
+    axis_values_by_position = True
 
-        if "source" in options:
-            source = options['source']
+    def __init__(self, region, options):
+        values = self.get_scaled_values(region, options)
 
-        if source == "gdb":
-            track_path = options['track']
-            track = genome.track.Track(track_path)
-            values = track.get_nparray(region.chrom, start=region.start,
-                                       end=region.end)
-            track.close()
+        super_init = super(LLRTrack, self).__init__
+        super_init(values, region, options)
 
-        if source == "wig":
-            path = options['path']
-            values = genome.wig.read_ints(path, region)
 
+    @classmethod
+    def get_scaled_values(cls, region, options):
+        values = cls.get_source_values(region, options)
 
         if "scale" in options:
             scale = float(options['scale'])
             # sys.stderr.write("scaling values by %.2f\n" % scale)
             values = values * scale
 
-        super_init = super(LLRTrack, self).__init__
-        super_init(values, region, options)
+        return values
+
+
+    @classmethod
+    def get_axis_values(cls, region, options):
+        # smoothing is ignored, since averaging cannot widen the
+        # range of the values
+        return cls.get_scaled_values(region, options)
+
+
+    @classmethod
+    def prefetch(cls, region, options):
+        cls.get_source_values(region, options)
         
 
 
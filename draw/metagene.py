@@ -0,0 +1,122 @@
+
+import numpy as np
+
+
+def merge_intervals(starts, ends):
+    """Merges overlapping or adjacent intervals with inclusive start
+    and end coordinates. Returns sorted arrays of the starts and ends
+    of the merged intervals."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if starts.size == 0:
+        return starts, ends
+
+    order = np.argsort(starts, kind='stable')
+    starts = starts[order]
+    ends = ends[order]
+
+    # an interval starts a new group unless it overlaps or abuts the
+    # furthest end of the intervals before it
+    max_end = np.maximum.accumulate(ends)
+    new_group = np.concatenate([[True], starts[1:] > max_end[:-1] + 1])
+    group_idx = np.where(new_group)[0]
+
+    merged_ends = np.maximum.reduceat(ends, group_idx)
+    return starts[group_idx], merged_ends
+
+
+
+def is_covered(pos, starts, ends):
+    """Returns a boolean array indicating which positions fall within
+    the sorted, non-overlapping intervals given by starts and ends"""
+    idx = np.searchsorted(starts, pos, side='right') - 1
+    covered = idx >= 0
+    covered[covered] = pos[covered] <= ends[idx[covered]]
+    return covered
+
+
+
+def get_segments(include, exclude):
+    """Returns the merged intervals that are covered by the include
+    intervals but not by the exclude intervals"""
+    bounds = np.unique(np.concatenate([include[0], include[1] + 1,
+                                       exclude[0], exclude[1] + 1]))
+    if bounds.size < 2:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    # elementary segments between consecutive boundaries
+    seg_starts = bounds[:-1]
+    seg_ends = bounds[1:] - 1
+    keep = is_covered(seg_starts, *include) & \
+           ~is_covered(seg_starts, *exclude)
+
+    return merge_intervals(seg_starts[keep], seg_ends[keep])
+
+
+
+class MetaGene(object):
+    """The union of the exons of all isoforms of a gene. Coding
+    intervals are positions that are coding in any isoform and UTR
+    intervals are the remaining exonic positions. Meta-genes have
+    start, end and strand attributes, so that they can be assigned to
+    rows in the same way as transcripts."""
+
+    def __init__(self, gene):
+        trs = gene.transcripts
+
+        self.chrom = gene.chrom
+        self.strand = gene.strand
+        self.name = getattr(gene, "name", None)
+        self.n_isoform = len(trs)
+
+        ex_starts = np.array([ex.start for tr in trs for ex in tr.exons],
+                             dtype=np.int64)
+        ex_ends = np.array([ex.end for tr in trs for ex in tr.exons],
+                           dtype=np.int64)
+
+        # clip exons of each coding transcript to its CDS
+        cds_start = np.array([tr.cds_start if tr.is_coding() else 0
+                              for tr in trs for ex in tr.exons],
+                             dtype=np.int64)
+        cds_end = np.array([tr.cds_end if tr.is_coding() else -1
+                            for tr in trs for ex in tr.exons],
+                           dtype=np.int64)
+        cod_starts = np.maximum(ex_starts, cds_start)
+        cod_ends = np.minimum(ex_ends, cds_end)
+        f = cod_starts <= cod_ends
+
+        exons = merge_intervals(ex_starts, ex_ends)
+        coding = merge_intervals(cod_starts[f], cod_ends[f])
+
+        self.exon_starts, self.exon_ends = exons
+        self.coding_starts, self.coding_ends = coding
+        self.utr_starts, self.utr_ends = get_segments(exons, coding)
+
+        if self.exon_starts.size:
+            self.start = int(self.exon_starts[0])
+            self.end = int(self.exon_ends[-1])
+        else:
+            self.start = gene.start
+            self.end = gene.end
+
+
+    def get_introns(self):
+        """Returns (start, end) arrays of the gaps between merged
+        exons"""
+        return self.exon_ends[:-1] + 1, self.exon_starts[1:] - 1
+
+
+
+def get_metagene(gene):
+    """Returns the meta-gene for a gene, which is computed the first
+    time it is requested and then reused. The meta-gene is stored on
+    the gene itself, so it is freed along with the gene."""
+    metagene = getattr(gene, '_metagene', None)
+    if metagene is None:
+        metagene = MetaGene(gene)
+        try:
+            gene._metagene = metagene
+        except AttributeError:
+            # genes that do not allow new attributes are not cached
+            pass
+    return metagene
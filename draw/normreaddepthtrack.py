@@ -2,71 +2,67 @@ import sys
 
 import numpy as np
 
-import genome.trackstat
-
 from .continuoustrack import ContinuousTrack
 from .basellrtrack import BaseLLRTrack
 
 class NormReadDepthTrack(BaseLLRTrack):
+     """Draws the log2 ratio of the read depths of two tracks, given by
+     TRACK1 and TRACK2 (or PATH1 and PATH2 with SOURCE=wig or
+     SOURCE=bedgraph), after adding PSEUDOCOUNT to both. With
+     SCALE_FACTOR1 (or SCALE_FACTOR2) the values of a track are scaled
+     by the scale factor divided by TOTAL_READS1 (or TOTAL_READS2)."""
      def __init__(self, region, options):
-          gdb = options['gdb']
-
-          track_name1 = options['track1']
-          track_name2 = options['track2']
-
           pseudo_count = float(options['pseudocount'])
-          
-          track1 = gdb.open_track(track_name1)
-          track2 = gdb.open_track(track_name2)
-          
-          values1 = track1.get_nparray(region.chrom, start=region.start,
-                                      end=region.end)
-          
-          values2 = track2.get_nparray(region.chrom, start=region.start,
-                                      end=region.end)
 
-          if "scale_factor1" in options:
-               scale_factor1 = float(options['scale_factor1'])
-               try:
-                    stat = gdb.get_track_stat(track1)
-                    scale1 = scale_factor1 / float(stat.sum)
-                    values1 = values1 * scale1
-                    sys.stderr.write("  total reads %d, using "
-                                     "scale %.3f\n" % (stat.sum, scale1))
-               except ValueError as err:
-                    sys.stderr.write("  WARNING: cannot scale values for "
-                                     "track %s because track stats have "
-                                     "not been calculated. run "
-                                     "set_track_stats.py first.\n" %
-                                     track.name)
-          track1.close()          
-
-          if "scale_factor2" in options:
-               scale_factor2 = float(options['scale_factor2'])
-               try:
-                    stat = gdb.get_track_stat(track2)
-                    scale2 = scale_factor2 / float(stat.sum)
-                    values2 = values2 * scale2
-                    sys.stderr.write("  total reads %d, using "
-                                     "scale %.3f\n" % (stat.sum, scale2))
-               except ValueError as err:
-                    sys.stderr.write("  WARNING: cannot scale values for "
-                                     "track %s because track stats have "
-                                     "not been calculated. run "
-                                     "set_track_stats.py first.\n" %
-                                     track.name)
-          
-          track2.close()
+          values1 = self.get_scaled_values(region, options, "1")
+          values2 = self.get_scaled_values(region, options, "2")
 
           ratio = np.log2((values1 + pseudo_count) / (values2 + pseudo_count))
-          
+
           sys.stderr.write("  %d > 0; %d < 0; %d == 0\n" %
                            (np.sum(ratio > 0.0), np.sum(ratio < 0.0),
                             np.sum(ratio == 0.0)))
-          
-          
-          
+
           super_init = super(NormReadDepthTrack, self).__init__
           super_init(ratio, region, options)
-          
 
+
+     @classmethod
+     def get_track_options(cls, options, n):
+          """Returns the options for reading the values of track n
+          (1 or 2) with get_source_values"""
+          track_options = dict(options)
+          for key in ('track', 'path'):
+               track_options.pop(key, None)
+               if key + n in options:
+                    track_options[key] = options[key + n]
+          return track_options
+
+
+     def get_scaled_values(self, region, options, n):
+          values = self.get_source_values(region,
+                                          self.get_track_options(options, n))
+
+          if "scale_factor" + n in options:
+               if "total_reads" + n in options:
+                    total_reads = int(options['total_reads' + n])
+                    scale = float(options['scale_factor' + n]) / total_reads
+                    values = values * scale
+                    sys.stderr.write("  total reads %d, using "
+                                     "scale %.3f\n" % (total_reads, scale))
+               else:
+                    sys.stderr.write("  WARNING: cannot scale values for "
+                                     "track %s because TOTAL_READS%s is "
+                                     "not set. downsample_track.py reports "
+                                     "the total number of reads in a "
+                                     "track.\n" %
+                                     (options.get('track' + n,
+                                                  options.get('path' + n)),
+                                      n))
+          return values
+
+
+     @classmethod
+     def prefetch(cls, region, options):
+          cls.get_source_values(region, cls.get_track_options(options, "1"))
+          cls.get_source_values(region, cls.get_track_options(options, "2"))
@@ -2,15 +2,22 @@
 import sys
 import numpy as np
 
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 from .track import Track
+from . import trackcache
 
 
 class NumericTrack(Track):
     """This is an abstract BaseClass containing functions that are in common
     to tracks with numeric data such as drawing and labeling the y axis."""
 
+    # True for track classes whose get_axis_values returns values that
+    # depend only on position (and not on the rest of the region), so
+    # that shared axes can be found by reading the merged regions a
+    # chunk at a time (see draw.sharedaxis)
+    axis_values_by_position = False
+
     
     def __init__(self, values, region, options):
         super(NumericTrack, self).__init__(region, options)
@@ -59,6 +66,48 @@ class NumericTrack(Track):
             self.min_val = float(options['min_val'])
 
 
+
+    @classmethod
+    def get_source_values(cls, region, options, fill=0.0):
+        """Returns values for each position in the region from the data
+        source of this track. With SOURCE=gdb (the default) values are
+        read from the genome database track named by the TRACK option.
+        With SOURCE=wig or SOURCE=bedgraph values are read from the wig
+        or bedGraph file (optionally compressed with bgzip) given by the
+        PATH option, using a block index. Positions that are not present
+        in a wig or bedGraph file are set to fill. Values are read
+        through the shared block cache (see draw.trackcache)."""
+        source = options.get('source', 'gdb').lower()
+
+        if source == "gdb":
+            return trackcache.get_track_values(options['track'], region)
+
+        if source in ("wig", "bedgraph"):
+            return trackcache.get_wig_values(options['path'], region,
+                                             fill=fill)
+
+        raise ValueError("unknown SOURCE '%s', expected one of gdb, wig "
+                         "or bedgraph" % options['source'])
+
+
+    @classmethod
+    def get_axis_values(cls, region, options):
+        """Returns the values that the y-axis of this track would span
+        in a region, used to find an axis range shared across regions
+        (see draw.sharedaxis). By default the track is created; classes
+        that can compute the values more cheaply from their source
+        values override this."""
+        return cls(region, options).get_y_values()
+
+
+    def get_y_values(self):
+        """Returns the values that set_y_range considers"""
+        return self.values
+
+
+    def get_export_data(self):
+        return {'values' : self.values}
+
             
     def draw_y_axis(self, r, n_ticks=3):
         region_len = self.region.end - self.region.start + 1
@@ -0,0 +1,347 @@
+
+import sys
+import os
+import warnings
+
+import numpy as np
+
+from .rlib import robjects
+from .track import Track
+from . import simplify
+
+
+# track types that can be drawn in overview plots, and how their
+# values are summarized in each bin
+SUMMARY_KINDS = {"ReadDepthTrack" : "depth",
+                 "LLRTrack" : "llr",
+                 "PointsTrack" : "points",
+                 "FeatureTrack" : "density"}
+
+# by default the longest chromosome is divided into this many bins
+DEFAULT_N_BIN = 2000
+
+# positions (or feature table rows) are read this many at a time,
+# which bounds the memory used to summarize a chromosome
+DEFAULT_CHUNK_SIZE = 5000000
+
+SUMMARY_SUFFIX = ".summary.npz"
+
+# layout, in units of track height
+TRACK_MARGIN = 0.15
+CHROM_MARGIN = 0.6
+
+
+
+def get_bin_size(chroms, n_bin=DEFAULT_N_BIN):
+    """Returns a bin size (rounded up to a multiple of 1kb) that
+    divides the longest chromosome into about n_bin bins"""
+    max_len = max(chrom.length for chrom in chroms)
+    bin_size = int(np.ceil(max_len / float(n_bin) / 1000.0)) * 1000
+    return max(bin_size, 1000)
+
+
+
+def get_n_bin(chrom, bin_size):
+    return (chrom.length + bin_size - 1) // bin_size
+
+
+
+def summarize_values(track_class, options, chrom, bin_size,
+                     chunk_size=DEFAULT_CHUNK_SIZE, fill=0.0):
+    """Reads the values of a numeric track along a chromosome in chunks
+    and returns the number of defined values, their sum, minimum and
+    maximum in each bin"""
+    import genome.coord
+
+    n_bin = get_n_bin(chrom, bin_size)
+    summary = {'count' : np.zeros(n_bin, dtype=np.int64),
+               'sum' : np.zeros(n_bin, dtype=np.float64),
+               'min' : np.full(n_bin, np.nan),
+               'max' : np.full(n_bin, np.nan)}
+
+    # chunks start at bin boundaries
+    chunk_size = max(chunk_size // bin_size, 1) * bin_size
+
+    for start in range(1, chrom.length + 1, chunk_size):
+        end = min(start + chunk_size - 1, chrom.length)
+        region = genome.coord.Coord(chrom, start, end)
+        vals = track_class.get_source_values(region, options, fill=fill)
+
+        first_bin = (start - 1) // bin_size
+        n = (vals.size + bin_size - 1) // bin_size
+        padded = np.full(n * bin_size, np.nan)
+        padded[:vals.size] = vals
+        m = padded.reshape(n, bin_size)
+        defined = ~np.isnan(m)
+
+        idx = slice(first_bin, first_bin + n)
+        summary['count'][idx] = defined.sum(axis=1)
+        summary['sum'][idx] = np.where(defined, m, 0.0).sum(axis=1)
+        with warnings.catch_warnings():
+            # bins without any defined values are left as nan
+            warnings.simplefilter("ignore", RuntimeWarning)
+            summary['min'][idx] = np.nanmin(m, axis=1)
+            summary['max'][idx] = np.nanmax(m, axis=1)
+
+    return summary
+
+
+
+def summarize_features(options, chrom, bin_size,
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns the number of features of a feature track that overlap
+    each bin of a chromosome, reading the feature table in chunks"""
+    import genome.track
+
+    n_bin = get_n_bin(chrom, bin_size)
+    # number of features starting in each bin minus the number
+    # that ended in the bin before
+    diff = np.zeros(n_bin + 1, dtype=np.int64)
+
+    track = genome.track.Track(options['track'])
+    node_name = "/" + chrom.name
+    if node_name in track.h5f:
+        table = track.h5f.getNode(node_name)
+        for i in range(0, table.nrows, chunk_size):
+            starts = table.read(start=i, stop=i + chunk_size, field='start')
+            ends = table.read(start=i, stop=i + chunk_size, field='end')
+            start_bin = np.clip((starts - 1) // bin_size, 0, n_bin - 1)
+            end_bin = np.clip((ends - 1) // bin_size, 0, n_bin - 1)
+            diff += np.bincount(start_bin, minlength=n_bin + 1)
+            diff -= np.bincount(end_bin + 1, minlength=n_bin + 1)
+    track.close()
+
+    return {'count' : np.cumsum(diff)[:n_bin]}
+
+
+
+def get_source(options):
+    """Returns a description of the data that a track is read from (its
+    type and the genome database track or file), and the size and
+    modification time of the file"""
+    source = options.get('source', 'gdb').lower()
+
+    if options['type'] == "FeatureTrack" or source == "gdb":
+        import genome.track
+        track = genome.track.Track(options['track'])
+        path = track.h5f.filename
+        track.close()
+        desc = "%s gdb:%s" % (options['type'], options['track'])
+    else:
+        path = options['path']
+        desc = "%s %s:%s" % (options['type'], source, os.path.abspath(path))
+
+    st = os.stat(path)
+    return desc, np.array([st.st_size, st.st_mtime])
+
+
+
+def get_summary_path(summary_dir, track_name, chrom, bin_size):
+    return os.path.join(summary_dir, "%s.%s.%d%s" %
+                        (track_name, chrom.name, bin_size, SUMMARY_SUFFIX))
+
+
+
+def get_summary(track_name, track_class, options, chrom, bin_size,
+                chunk_size=DEFAULT_CHUNK_SIZE, summary_dir=None):
+    """Returns the bin summary of a track along a chromosome. When
+    summary_dir is provided, summaries are written there and read back
+    by later runs, so that overviews can be redrawn without reading the
+    track again. A saved summary is only used if the track is still
+    read from the same genome database track or file, and that file
+    has not changed."""
+    kind = SUMMARY_KINDS[options['type']]
+
+    path = None
+    if summary_dir:
+        source, stat = get_source(options)
+        path = get_summary_path(summary_dir, track_name, chrom, bin_size)
+        if os.path.exists(path):
+            summary = dict(np.load(path))
+            saved_source = str(summary.pop('source', None))
+            saved_stat = summary.pop('source_stat', None)
+            if saved_source == source and np.array_equal(saved_stat, stat):
+                return summary
+            sys.stderr.write("summary %s is out of date\n" % path)
+
+    sys.stderr.write("  summarizing %s on %s\n" % (track_name, chrom.name))
+    if kind == "density":
+        summary = summarize_features(options, chrom, bin_size, chunk_size)
+    elif kind == "points":
+        summary = summarize_values(track_class, options, chrom, bin_size,
+                                   chunk_size, fill=np.nan)
+    else:
+        summary = summarize_values(track_class, options, chrom, bin_size,
+                                   chunk_size)
+
+    if path is not None:
+        # write to temporary file first so that a partially written
+        # summary is never read
+        tmp_path = path + ".tmp.npz"
+        try:
+            np.savez(tmp_path, source=np.array(source), source_stat=stat,
+                     **summary)
+            os.replace(tmp_path, path)
+        except (IOError, OSError) as err:
+            sys.stderr.write("WARNING: could not write summary %s: %s\n" %
+                             (path, str(err)))
+
+    return summary
+
+
+
+class OverviewTrack(Track):
+    """The binned values of a track along each chromosome of an
+    overview plot, computed from bin summaries keyed by chromosome
+    name. The y-axis is the same on every chromosome."""
+
+    def __init__(self, track_name, options, bin_size, summaries):
+        self.kind = SUMMARY_KINDS[options['type']]
+        self.bin_size = bin_size
+
+        self.set_colors(options)
+        self.pos_color = options.get('pos_color', self.color).replace('"', '')
+        self.neg_color = options.get('neg_color', self.color).replace('"', '')
+        self.label = options.get('track_label', track_name).rstrip()
+
+        self.chrom_values = {}
+        for chrom_name, summary in summaries.items():
+            self.chrom_values[chrom_name] = self.get_bin_values(summary,
+                                                                options)
+
+        self.set_y_range(options)
+
+
+    def get_bin_values(self, summary, options):
+        """Returns the value drawn for each bin from a bin summary,
+        applying the same scaling and transforms as the track type"""
+        if self.kind == "density":
+            return summary['count'].astype(np.float64)
+
+        if self.kind == "points":
+            if self.parse_bool_str(options.get('neg_log_transform',
+                                               'false')):
+                # the smallest p-value in each bin
+                return -np.log10(np.maximum(summary['min'], 1e-30))
+            return summary['max']
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vals = summary['sum'] / summary['count']
+
+        if self.kind == "llr":
+            if "scale" in options:
+                vals = vals * float(options['scale'])
+            return vals
+
+        # read depth
+        if "scale_factor" in options and "total_reads" in options:
+            vals = vals * float(options['scale_factor']) / \
+                   float(options['total_reads'])
+        if self.parse_bool_str(options.get('log_scale', 'false')):
+            vals = np.log2(vals + 1.0)
+        return vals
+
+
+    def set_y_range(self, options):
+        defined = [v[~np.isnan(v)] for v in self.chrom_values.values()]
+        defined = np.concatenate(defined) if defined else np.array([])
+
+        if defined.size:
+            self.max_val = float(np.max(defined))
+            self.min_val = float(np.min(defined))
+        else:
+            self.max_val = self.min_val = 0.0
+
+        if self.kind != "points":
+            # bars are drawn from an axis at 0
+            self.min_val = min(self.min_val, 0.0)
+            self.max_val = max(self.max_val, 0.0)
+
+        if 'max_val' in options:
+            self.max_val = float(options['max_val'])
+        if 'min_val' in options:
+            self.min_val = float(options['min_val'])
+
+
+    def scale(self, vals, top, bottom):
+        if self.max_val == self.min_val:
+            yscale = 0.0
+        else:
+            yscale = (top - bottom) / (self.max_val - self.min_val)
+        return (np.clip(vals, self.min_val, self.max_val) -
+                self.min_val) * yscale + bottom
+
+
+    def draw_bars(self, r, vals, axis, color):
+        p_x, p_y = simplify.get_step_polygons(vals, 0, axis)
+        if p_x.size:
+            r.polygon(robjects.FloatVector(p_x * self.bin_size),
+                      robjects.FloatVector(p_y), col=color, border=color)
+
+
+    def draw(self, r, chrom, top, bottom):
+        vals = self.scale(self.chrom_values[chrom.name], top, bottom)
+
+        if self.kind == "points":
+            defined = np.where(~np.isnan(vals))[0]
+            x = (defined + 0.5) * self.bin_size
+            r.points(robjects.FloatVector(x),
+                     robjects.FloatVector(vals[defined]),
+                     pch=20, cex=0.25, col=self.color)
+            return
+
+        axis = float(self.scale(np.array([0.0]), top, bottom)[0])
+        if self.kind == "llr":
+            self.draw_bars(r, np.where(vals >= axis, vals, np.nan), axis,
+                           self.pos_color)
+            self.draw_bars(r, np.where(vals < axis, vals, np.nan), axis,
+                           self.neg_color)
+        else:
+            self.draw_bars(r, vals, axis, self.color)
+
+
+
+def draw_overview(r, chroms, tracks, cex=1.0):
+    """Draws tracks along chromosomes that are stacked from top to
+    bottom and drawn to the same scale (karyogram-style), or along a
+    single chromosome from end to end"""
+    n_track = len(tracks)
+    chrom_height = n_track + (n_track - 1) * TRACK_MARGIN
+    max_len = max(chrom.length for chrom in chroms)
+
+    bottom = -(len(chroms) * (chrom_height + CHROM_MARGIN) - CHROM_MARGIN)
+
+    # leave room for chromosome names on the left and track labels on
+    # the right
+    r.par(mar=r.c(5.1, 6.1, 0.1, 8.1))
+    r.plot(r.c(0), r.c(0), type="n", xlim=r.c(0, max_len),
+           ylim=r.c(bottom, 0), yaxt="n", xaxt="n", bty="n", ylab="",
+           xlab="position (Mb)", xaxs="i")
+
+    at = np.array(r.pretty(r.c(0, max_len)))
+    at = at[at <= max_len]
+    r.axis(1, at=robjects.FloatVector(at),
+           labels=robjects.StrVector(["%g" % (x / 1e6) for x in at]),
+           **{"cex.axis" : cex})
+
+    chrom_top = 0.0
+    for chrom in chroms:
+        chrom_bottom = chrom_top - chrom_height
+
+        # outline of the chromosome
+        r.rect(0, chrom_bottom, chrom.length, chrom_top, border="grey70",
+               lwd=0.5)
+        r.text(0, (chrom_top + chrom_bottom) * 0.5, labels=chrom.name,
+               pos=2, cex=cex * 0.75, xpd=True)
+
+        track_top = chrom_top
+        for track in tracks:
+            track_bottom = track_top - 1.0
+            track.draw(r, chrom, track_top, track_bottom)
+
+            if chrom is chroms[0] or len(chroms) == 1:
+                r.text(max_len, (track_top + track_bottom) * 0.5,
+                       labels=track.label, pos=4, cex=cex * 0.6, xpd=True)
+            track_top = track_bottom - TRACK_MARGIN
+
+        chrom_top = chrom_bottom - CHROM_MARGIN
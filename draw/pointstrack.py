@@ -1,27 +1,27 @@
 import numpy as np
-import rpy2.robjects as robjects
+from .rlib import robjects
 import sys
 
 from .track import Track
 from .numerictrack import NumericTrack
 
 
+# by default points are decimated when there are more than this many
+DECIMATE_MIN_POINTS = 10000
+
+
 class PointsTrack(NumericTrack):
     """This class is for drawing points defined at a subset of genomic
     positions. Sites in the track that are set to nan are ignored.
     This track can be used to display p-values for SNPs etc.
     """
+    axis_values_by_position = True
 
     def __init__(self, region, options):
 
-        # retrieve values from genome db. If desired could later
-        # modify this to have 'source' option and allow values to be
-        # read from other file types
-        track_name = options['track']
-        gdb = options['gdb']
-        track = gdb.open_track(track_name)
-        values = track.get_nparray(region.chrom, start=region.start,
-                                   end=region.end)
+        # retrieve values from genome db or from a wig/bedGraph file;
+        # positions that are missing from the file are undefined
+        values = self.get_source_values(region, options, fill=np.nan)
 
         # get positions of defined values:
         defined_idx = np.where(~np.isnan(values))[0]
@@ -61,6 +61,24 @@ class PointsTrack(NumericTrack):
             self.above_thresh_color = self.color
             self.draw_thresh_line = False
             
+        # when there are many points, only draw one point in each cell
+        # of the output device's resolution
+        if 'decimate' in options:
+            self.decimate = self.parse_bool_str(options['decimate'])
+        else:
+            self.decimate = True
+
+        if 'decimate_min_points' in options:
+            self.decimate_min_points = int(options['decimate_min_points'])
+        else:
+            self.decimate_min_points = DECIMATE_MIN_POINTS
+
+        # size of cells in device units (pixels for PNG, 1/72 inch for PDF)
+        if 'decimate_cell_size' in options:
+            self.decimate_cell_size = float(options['decimate_cell_size'])
+        else:
+            self.decimate_cell_size = 1.0
+            
         if 'neg_log_transform' in options:
             self.neg_log_transform = self.parse_bool_str(options['neg_log_transform'])
         else:
@@ -77,21 +95,121 @@ class PointsTrack(NumericTrack):
         self.set_y_range(options)
 
 
+    @classmethod
+    def prefetch(cls, region, options):
+        cls.get_source_values(region, options, fill=np.nan)
+
+
+    @classmethod
+    def get_axis_values(cls, region, options):
+        """Returns the defined values of a region, transformed as they
+        are drawn, without creating a track"""
+        values = cls.get_source_values(region, options, fill=np.nan)
+        values = values[~np.isnan(values)]
+        values[values < 1e-30] = 1e-30
+
+        if 'neg_log_transform' in options and \
+           cls.parse_bool_str(options['neg_log_transform']):
+            values = -np.log10(values)
+
+        return values
+
+
+    def get_export_data(self):
+        return {'pos' : self.pos, 'values' : self.values}
+
         
-    def draw_track(self, r):
+    def get_above_thresh(self):
+        """Returns boolean arrays indicating which points are below
+        and above threshold"""
+        if self.neg_log_transform:
+            below_thresh = self.values >= self.threshold
+            above_thresh = self.values <= self.threshold
+        else:
+            below_thresh = self.values <= self.threshold
+            above_thresh = self.values >= self.threshold
+
+        return below_thresh, above_thresh
+
+
+    def get_past_thresh(self):
+        """Returns a boolean array indicating which points are drawn
+        past the threshold line. These are the points above threshold,
+        or the points below threshold when NEG_LOG_TRANSFORM is used
+        (e.g. significant p-values)."""
+        if self.threshold is None:
+            return np.zeros(len(self.values), dtype=np.bool_)
+
+        # values and threshold have already been transformed
+        return self.values >= self.threshold
 
-        sys.stderr.write("DRAWING POINTS\n")
+    
+    def get_point_colors(self):
+        """Returns an array with the color of each point. Points that
+        are exactly at the threshold are drawn as above threshold."""
+        colors = np.empty(len(self.values), dtype=object)
+        colors[:] = self.color
         
+        if self.threshold is not None:
+            below_thresh, above_thresh = self.get_above_thresh()
+            colors[below_thresh] = self.below_thresh_color
+            colors[above_thresh] = self.above_thresh_color
+
+        return colors
+
+
+    def decimate_points(self, r, x, y, keep):
+        """Bins points into cells at the resolution of the output
+        device and returns indices of the points to draw: one point
+        from each occupied cell, plus all points flagged by keep."""
+        unit_x, unit_y = self.get_device_units(r)
+
+        cell_x = np.floor((x - self.region.start) /
+                          (unit_x * self.decimate_cell_size)).astype(np.int64)
+        cell_y = np.floor((y - self.bottom) /
+                          (unit_y * self.decimate_cell_size)).astype(np.int64)
+
+        # find first point in each distinct cell
+        cell_x -= cell_x.min()
+        cell_y -= cell_y.min()
+        cell = cell_x * (cell_y.max() + 1) + cell_y
+        cell[keep] = -1 - np.where(keep)[0]
+        idx = np.unique(cell, return_index=True)[1]
+
+        sys.stderr.write("  decimated %d points to %d\n" %
+                         (len(x), len(idx)))
+
+        return idx
+
+
+    def get_draw_order(self, r, vals):
+        """Returns the indices of the points to draw, in the order they
+        should be drawn. Points past the threshold line are always
+        drawn, and are drawn last so that they are on top."""
+        past_thresh = self.get_past_thresh()
+
+        if self.decimate and len(self.values) > self.decimate_min_points:
+            idx = self.decimate_points(r, self.pos, vals, past_thresh)
+        else:
+            idx = np.arange(len(self.values))
+
+        return idx[np.argsort(past_thresh[idx], kind='stable')]
+
+        
+    def draw_track(self, r):
         yscale = self.height / (self.max_val - self.min_val)
 
         vals = (self.values - self.min_val) * yscale + self.bottom
 
         if len(self.values) > 0:
-            r.points(robjects.FloatVector(self.pos),
-                     robjects.FloatVector(vals),
-                     col=self.color,
-                     bg=self.color, cex=0.5,
-                     pch=21)
+            colors = self.get_point_colors()
+            idx = self.get_draw_order(r, vals)
+
+            # draw all points with a single call
+            col = robjects.StrVector(list(colors[idx]))
+            r.points(robjects.FloatVector(self.pos[idx]),
+                     robjects.FloatVector(vals[idx]),
+                     col=col, bg=col, cex=0.5, pch=21)
 
             # draw line at 0
             zero_val = -self.min_val * yscale + self.bottom
@@ -99,43 +217,11 @@ class PointsTrack(NumericTrack):
                     robjects.FloatVector([zero_val, zero_val]),
                     col="grey50")
 
-            if self.threshold is not None:
-                if self.draw_thresh_line:
-                    # draw line showing threshold
-                    thresh_val = (self.threshold - self.min_val) * yscale + self.bottom
-                    r.lines(robjects.FloatVector([self.region.start, self.region.end]),
-                            robjects.FloatVector([thresh_val, thresh_val]),
-                            lty=2, col="red")
-
-                # redraw points below threshold a different color
-                if self.neg_log_transform:
-                    below_thresh = self.values >= self.threshold
-                    above_thresh = self.values <= self.threshold
-                else:
-                    below_thresh = self.values <= self.threshold
-                    above_thresh = self.values >= self.threshold
-
-                if np.any(below_thresh):
-                    r.points(robjects.FloatVector(self.pos[below_thresh]),
-                             robjects.FloatVector(vals[below_thresh]),
-                             col=self.below_thresh_color,
-                             bg=self.below_thresh_color, cex=0.5,
-                             pch=21)
-                    
-                if np.any(above_thresh):
-                    r.points(robjects.FloatVector(self.pos[above_thresh]),
-                             robjects.FloatVector(vals[above_thresh]),
-                             col=self.above_thresh_color,
-                             bg=self.above_thresh_color, cex=0.5,
-                             pch=21)
-                    
+            if self.threshold is not None and self.draw_thresh_line:
+                # draw line showing threshold
+                thresh_val = (self.threshold - self.min_val) * yscale + self.bottom
+                r.lines(robjects.FloatVector([self.region.start, self.region.end]),
+                        robjects.FloatVector([thresh_val, thresh_val]),
+                        lty=2, col="red")
 
         self.draw_y_axis(r, self.n_ticks)
-        
-                              
-        
-
-                    
-
-        
-    
@@ -0,0 +1,159 @@
+
+import numpy as np
+from .rlib import robjects
+
+
+class RasterImage(object):
+    """An RGBA pixel buffer covering the area of a single track. When
+    output is a raster format (e.g. PNG) tracks can paint directly into
+    this buffer and then draw it with a single call to rasterImage,
+    rather than sending very large polygons to R to be rasterized."""
+
+    def __init__(self, r, left, right, top, bottom, n_col, n_row):
+        self.r = r
+        self.left = left
+        self.right = right
+        self.top = top
+        self.bottom = bottom
+        self.n_col = max(int(n_col), 1)
+        self.n_row = max(int(n_row), 1)
+
+        # start with fully transparent image, row 0 is top of track
+        self.buf = np.zeros((self.n_row, self.n_col, 4), dtype=np.float32)
+        self.rgba_cache = {}
+
+
+    def get_rgba(self, color):
+        """Returns RGBA components of an R color, scaled to 0-1"""
+        if color not in self.rgba_cache:
+            rgba = self.r['col2rgb'](color, alpha=True)
+            self.rgba_cache[color] = \
+                np.array(list(rgba), dtype=np.float32) / 255.0
+        return self.rgba_cache[color]
+
+
+    def get_column_range(self, vals):
+        """Reduces an array of per-base values to pixel columns. Returns
+        arrays giving the minimum and maximum defined value in each
+        column. Columns without any defined values are set to nan."""
+        vals = np.asarray(vals, dtype=np.float64)
+        if vals.size == 0:
+            nan_cols = np.empty(self.n_col)
+            nan_cols[:] = np.nan
+            return nan_cols, nan_cols
+
+        # index of first value that falls in each column; when there are
+        # fewer values than columns indices repeat and reduceat simply
+        # returns the value at that index
+        idx = (np.arange(self.n_col, dtype=np.int64) * vals.size) // self.n_col
+
+        col_min = np.fmin.reduceat(vals, idx)
+        col_max = np.fmax.reduceat(vals, idx)
+
+        return col_min, col_max
+
+
+    def y_to_row(self, y):
+        """converts y coordinates to (fractional) pixel rows"""
+        return (self.top - y) / (self.top - self.bottom) * self.n_row
+
+
+    def fill_columns(self, y1, y2, color):
+        """Fills each pixel column between the y coordinates given by
+        the arrays y1 and y2. Columns where either value is nan are
+        left unpainted."""
+        row1, row2 = np.broadcast_arrays(
+            self.y_to_row(np.asarray(y1, dtype=np.float64)),
+            self.y_to_row(np.asarray(y2, dtype=np.float64)))
+        row1 = row1.copy()
+        row2 = row2.copy()
+
+        undef = np.isnan(row1) | np.isnan(row2)
+        row1[undef] = 0.0
+        row2[undef] = 0.0
+
+        lo = np.clip(np.floor(np.minimum(row1, row2)), 0, self.n_row)
+        hi = np.clip(np.ceil(np.maximum(row1, row2)), 0, self.n_row)
+
+        # always paint at least one row for defined columns so that
+        # small values are still visible, as they are with polygons
+        hi[~undef] = np.maximum(hi[~undef], np.minimum(lo[~undef] + 1,
+                                                       self.n_row))
+
+        rows = np.arange(self.n_row)[:, None]
+        mask = (rows >= lo[None, :]) & (rows < hi[None, :])
+        self.buf[mask] = self.get_rgba(color)
+
+
+    def fill_runs(self, starts, ends, colors, y1, y2):
+        """Paints runs of columns spanned by features with the given
+        start and end coordinates (which should be non-overlapping).
+        Colors is a list of R colors, one per
+        feature. Every feature paints at least one column."""
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+
+        if starts.size == 0:
+            return
+
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        ends = ends[order]
+        rgba = np.array([self.get_rgba(c) for c in colors],
+                        dtype=np.float32)[order]
+
+        # genomic position at center of each pixel column
+        span = float(self.right - self.left + 1)
+        col_pos = self.left + (np.arange(self.n_col) + 0.5) * \
+                  (span / self.n_col)
+
+        # find feature that covers each column
+        owner = np.searchsorted(starts, col_pos, side='right') - 1
+        owner[(owner >= 0) & (col_pos > ends[np.maximum(owner, 0)] + 1)] = -1
+
+        # make sure that features narrower than a pixel are still drawn
+        start_col = ((starts - self.left) / span * self.n_col).astype(np.int64)
+        in_range = (start_col >= 0) & (start_col < self.n_col)
+        owner[start_col[in_range]] = np.where(in_range)[0]
+
+        row_lo, row_hi = sorted([self.y_to_row(y1), self.y_to_row(y2)])
+        row_lo = int(np.clip(np.floor(row_lo), 0, self.n_row))
+        row_hi = int(np.clip(np.ceil(row_hi), 0, self.n_row))
+
+        cols = np.where(owner >= 0)[0]
+        self.buf[row_lo:row_hi, cols] = rgba[owner[cols]][None, :, :]
+
+
+    def fill_values(self, values, min_val, max_val, low_color, high_color):
+        """Colors every pixel from a (n_row x n_col) array of values,
+        using a linear ramp from low_color at min_val to high_color at
+        max_val. Values outside this range are given the color at the
+        end of the ramp and pixels with nan values are left
+        transparent."""
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (self.n_row, self.n_col):
+            raise ValueError("expected %d x %d values" %
+                             (self.n_row, self.n_col))
+
+        if max_val > min_val:
+            frac = (values - min_val) / (max_val - min_val)
+        else:
+            frac = np.where(values > min_val, 1.0, 0.0)
+        undef = np.isnan(frac)
+        frac = np.clip(np.where(undef, 0.0, frac), 0.0, 1.0)
+
+        low = self.get_rgba(low_color)
+        high = self.get_rgba(high_color)
+        self.buf[:] = low + frac[:, :, None] * (high - low)
+        self.buf[undef] = 0.0
+
+
+    def draw(self):
+        """Draws the image into the track area with a single call
+        to rasterImage"""
+        r = self.r
+        # R arrays are stored in column-major order
+        img = r.array(robjects.FloatVector(self.buf.ravel(order='F')),
+                      dim=robjects.IntVector([self.n_row, self.n_col, 4]))
+        r.rasterImage(img, self.left, self.bottom, self.right + 1, self.top,
+                      interpolate=False)
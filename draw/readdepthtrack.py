@@ -1,26 +1,15 @@
 import sys
 
 import numpy as np
-import scipy
-
-import genome.trackstat
-import genome.track
 
 from .continuoustrack import ContinuousTrack
 
 class ReadDepthTrack(ContinuousTrack):     
-    def __init__(self, region, options):
-        track_name = options['track']
-        
-        track = genome.track.Track(track_name)
-        
-        values = track.get_nparray(region.chrom, 
-                                   start=region.start,
-                                   end=region.end)
-
+    axis_values_by_position = True
 
+    def __init__(self, region, options):
         if "scale_factor" in options or "downsample" in options:
-            total_reads = self.get_total_reads(gdb, track)
+            total_reads = self.get_total_reads(options)
         else:
             total_reads = None
 
@@ -32,25 +21,46 @@ class ReadDepthTrack(ContinuousTrack):
                                  "reads (%d) > desired reads"
                                  "(%d)\n" % (total_reads, 
                                              desired_total))
-            else:                
-                # perform in-place downsampling of reads
-                self.downsample_reads(values, total_reads, 
-                                      desired_total)
-                total_reads = desired_total       
+                values = self.get_source_values(region, options)
+            else:
+                values = self.get_downsampled_values(region, options,
+                                                     total_reads,
+                                                     desired_total)
+                total_reads = desired_total
+        else:
+            values = self.get_source_values(region, options)
 
-        if total_reads and ("scale_factor" in options):
-            scale_factor = float(options['scale_factor'])
-            scale = scale_factor / float(total_reads)
-            values = values * scale
+        scale = self.get_scale(total_reads, options)
+        if scale is not None:
             sys.stderr.write("  total reads %d, using "
                              "scale %.3f\n" % (total_reads, scale))
 
+        values = self.scale_values(values, total_reads, options)
+
+        super_init = super(ReadDepthTrack, self).__init__
+        super_init(values, region, options)
+
+
+    @classmethod
+    def get_scale(cls, total_reads, options):
+        """Returns SCALE_FACTOR / total_reads, or None if the values
+        are not scaled"""
+        if total_reads and ("scale_factor" in options):
+            return float(options['scale_factor']) / float(total_reads)
+        return None
+
+
+    @classmethod
+    def scale_values(cls, values, total_reads, options):
+        """Scales read counts by SCALE_FACTOR / total_reads (when the
+        total is known) and log2 transforms them if LOG_SCALE is set"""
+        scale = cls.get_scale(total_reads, options)
+        if scale is not None:
+            values = values * scale
 
-        track.close()
-          
         log_scale = False
         if "log_scale" in options:
-            log_scale = self.parse_bool_str(options['log_scale'])
+            log_scale = cls.parse_bool_str(options['log_scale'])
 
         if log_scale:
             # add one to values, but avoid possible overflow of
@@ -59,39 +69,85 @@ class ReadDepthTrack(ContinuousTrack):
             values[f] += 1
             values = np.log2(values)
 
-        super_init = super(ReadDepthTrack, self).__init__
-        super_init(values, region, options)
+        return values
+
 
+    @classmethod
+    def get_axis_values(cls, region, options):
+        """Returns the scaled values of a region without creating a
+        track. Downsampling is approximated by scaling the counts by
+        the downsampling ratio. Smoothing is ignored, since averaging
+        cannot widen the range of the values."""
+        values = cls.get_source_values(region, options).astype(np.float64)
+
+        total_reads = None
+        if "total_reads" in options:
+            total_reads = int(options['total_reads'])
+
+        if total_reads and ("downsample" in options):
+            desired_total = int(options['downsample'])
+            if desired_total < total_reads:
+                values *= float(desired_total) / float(total_reads)
+                total_reads = desired_total
 
-    def get_total_reads(self, gdb, track):
-        try:
-            stat = gdb.get_track_stat(track)
-            return stat.sum
-        except ValueError as err:
-            sys.stderr.write("  WARNING: cannot scale or resample "
-                             "values for "
-                             "track %s because track stats have "
-                             "not been calculated. run "
-                             "set_track_stats.py first.\n" % track.name)
+        return cls.scale_values(values, total_reads, options)
 
+
+    @classmethod
+    def prefetch(cls, region, options):
+        cls.get_source_values(region, options)
+
+
+    def get_total_reads(self, options):
+        if "total_reads" in options:
+            return int(options['total_reads'])
+
+        sys.stderr.write("  WARNING: cannot scale or downsample "
+                         "values for track %s because TOTAL_READS "
+                         "is not set. downsample_track.py reports the "
+                         "total number of reads in a track.\n" %
+                         options.get('track', options.get('path')))
         return None
 
-    
-    def downsample_reads(self, read_counts, total_reads, desired_total):
-        nonzero = np.where(read_counts > 0)[0]
 
-        p = float(desired_total) / float(total_reads)        
-        downsamp = scipy.random.binomial(read_counts[nonzero], p)
+    def get_downsampled_values(self, region, options, total_reads,
+                               desired_total):
+        """Returns read counts for the region after downsampling to
+        approximately desired_total reads. Counts are read and
+        downsampled over whole blocks of positions, using a random
+        number generator for each block that is seeded by
+        DOWNSAMPLE_SEED, so that a position gets the same count in
+        every region that contains it. These are also the counts that
+        are written by downsample_track.py."""
+        import genome.coord
+        from . import downsample
+
+        if "downsample_seed" in options:
+            seed = int(options['downsample_seed'])
+        else:
+            seed = downsample.DEFAULT_SEED
+
+        if "downsample_block_size" in options:
+            block_size = int(options['downsample_block_size'])
+        else:
+            block_size = downsample.DEFAULT_BLOCK_SIZE
+
+        block_start, block_end = \
+            downsample.get_block_bounds(region.start, region.end,
+                                        region.chrom.length, block_size)
+        block_region = genome.coord.Coord(region.chrom, block_start,
+                                          block_end)
+        counts = self.get_source_values(block_region, options)
+
+        p = float(desired_total) / float(total_reads)
+        counts = downsample.downsample_blocks(counts, region.chrom.name,
+                                              block_start, p, seed=seed,
+                                              block_size=block_size)
+
+        values = counts[region.start - block_start:
+                        region.end - block_start + 1]
         sys.stderr.write("  total: %d, desired_total: %d -- "
-                         "downsampled %d reads to %d\n" % 
-                         (total_reads, desired_total, 
-                          np.sum(read_counts[nonzero]), 
-                          np.sum(downsamp)))
-        
-        read_counts[nonzero] = downsamp.astype(read_counts.dtype)
-        
-        
-        
-        
-          
+                         "downsampled region to %d reads\n" %
+                         (total_reads, desired_total, np.sum(values)))
 
+        return values
@@ -0,0 +1,58 @@
+
+import importlib
+
+
+# Modules that define each of the track types that can be named by
+# the TYPE option in the configuration file. Modules are only imported
+# when a track of that type is first created, so that runs do not pay
+# for importing modules (and their dependencies) that they do not use.
+TRACK_MODULES = {"GenesTrack" : "draw.genestrack",
+                 "LLRTrack" : "draw.llrtrack",
+                 "FeatureTrack" : "draw.featuretrack",
+                 "ReadDepthTrack" : "draw.readdepthtrack",
+                 "GenotypeReadDepthTrack" : "draw.genotypereaddepthtrack",
+                 "StateTrack" : "draw.statetrack",
+                 "ErnstStateTrack" : "draw.ernststatetrack",
+                 "SegmentTrack" : "draw.segmenttrack",
+                 "GCContentTrack" : "draw.gccontenttrack",
+                 "NormReadDepthTrack" : "draw.normreaddepthtrack",
+                 "PointsTrack" : "draw.pointstrack",
+                 "ExpressionTrack" : "draw.expressiontrack"}
+
+_track_classes = {}
+
+
+def get_track_type_names():
+    """Returns a sorted list of the names of the known track types"""
+    return sorted(TRACK_MODULES.keys())
+
+
+def get_track_class(track_type):
+    """Returns the class used to draw tracks of the provided type.
+    The type is either the name of a registered track class
+    (e.g. ReadDepthTrack) or a fully qualified class name
+    (e.g. mymodule.MyTrack). None is returned if the type is
+    unknown, including a fully qualified name whose module cannot
+    be imported."""
+    if track_type in _track_classes:
+        return _track_classes[track_type]
+
+    if track_type in TRACK_MODULES:
+        module_name = TRACK_MODULES[track_type]
+        class_name = track_type
+        module = importlib.import_module(module_name)
+    elif "." in track_type:
+        module_name, class_name = track_type.rsplit(".", 1)
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            return None
+    else:
+        return None
+
+    track_class = getattr(module, class_name, None)
+    if track_class is not None:
+        # misses are not cached, so that they are looked up again
+        _track_classes[track_type] = track_class
+
+    return track_class
@@ -0,0 +1,31 @@
+
+import sys
+
+
+class LazyRObjects(object):
+    """Stands in for the rpy2.robjects module. The module (and the
+    embedded R session that importing it starts) is only loaded the
+    first time one of its attributes is used, so tracks can be created
+    without R when nothing is going to be drawn."""
+
+    def __getattr__(self, name):
+        import rpy2.robjects
+        return getattr(rpy2.robjects, name)
+
+
+robjects = LazyRObjects()
+
+_grdevices = None
+
+
+def get_grdevices():
+    """Returns the R grDevices package, starting R if it has not
+    already been started"""
+    global _grdevices
+
+    if _grdevices is None:
+        from rpy2.robjects.packages import importr
+        sys.stderr.write("starting R\n")
+        _grdevices = importr('grDevices')
+
+    return _grdevices
@@ -0,0 +1,91 @@
+
+import sys
+
+from .rlib import robjects, get_grdevices
+
+
+# incremented when the layout of scene files changes
+SCENE_VERSION = 2
+
+
+
+def open_scene_device(width, height):
+    """Opens a graphics device that draws to memory only, with its
+    display list enabled so that the drawing commands of each page can
+    be recorded. Width and height are in inches. Returns the R instance
+    that should be used for drawing."""
+    grdevices = get_grdevices()
+    grdevices.pdf(file=robjects.NULL, width=width, height=height)
+    grdevices.dev_control(displaylist="enable")
+    return robjects.r
+
+
+
+def record_page(r):
+    """Returns the recorded drawing commands of the current page"""
+    return r.recordPlot()
+
+
+
+def get_r_version():
+    return str(robjects.r("R.version.string")[0])
+
+
+
+def write_scene(filename, pages, width, height):
+    """Writes recorded pages to a compressed binary scene file. Scene
+    files hold every drawing primitive of each page with its
+    coordinates, styles and text, so they can be rendered to any
+    output format or size without reading the genome data again.
+    R only supports replaying recorded pages with the R version that
+    recorded them, so the version is stored in the file."""
+    r = robjects.r
+    scene = r.list(version=SCENE_VERSION, r_version=get_r_version(),
+                   width=width, height=height, pages=r.list(*pages))
+    r.saveRDS(scene, file=filename)
+
+
+
+def read_scene(filename, allow_other_r=False):
+    """Reads a scene file, returning (width, height, pages). Raises a
+    ValueError if the scene was recorded by a different version of R,
+    unless allow_other_r is True, in which case a warning is written."""
+    r = robjects.r
+    scene = r.readRDS(filename)
+
+    version = int(scene.rx2("version")[0])
+    if version != SCENE_VERSION:
+        raise ValueError("%s: unsupported scene file version %d" %
+                         (filename, version))
+
+    r_version = str(scene.rx2("r_version")[0])
+    if r_version != get_r_version():
+        msg = ("%s was recorded with %s, but this is %s. Recorded plots "
+               "are not reliable across R versions" %
+               (filename, r_version, get_r_version()))
+        if not allow_other_r:
+            raise ValueError(msg + "; draw the regions again with this "
+                             "version of R")
+        sys.stderr.write("WARNING: %s\n" % msg)
+
+    width = float(scene.rx2("width")[0])
+    height = float(scene.rx2("height")[0])
+    pages = list(scene.rx2("pages"))
+
+    return width, height, pages
+
+
+
+def replay_page(page):
+    """Draws a recorded page on the current device"""
+    # pages recorded by another R process (as all pages read from scene
+    # files are) trigger a harmless warning about the session, which is
+    # muffled. Other warnings, such as for a different R version, are
+    # passed on.
+    replay = robjects.r("""function(p) withCallingHandlers(
+        replayPlot(p, reloadPkgs=TRUE),
+        warning=function(w) {
+            if (grepl("different session", conditionMessage(w)))
+                invokeRestart("muffleWarning")
+        })""")
+    replay(page)
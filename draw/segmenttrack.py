@@ -2,10 +2,12 @@
 import sys
 
 from .track import Track
+from .featureset import FeatureSet
+from . import trackcache
 
-import rpy2.robjects as robjects
+from .rlib import robjects
 
-import numpy as np
+import genome.track
 
 class SegmentTrack(Track):
     """Class for drawing a single transcript"""
@@ -20,69 +22,39 @@ class SegmentTrack(Track):
             self.color = "black"
 
         self.track_name = options['track']
-        self.features = []
-
-        # get overlapping features from database
-        gdb = options['gdb']
-        track = gdb.open_track(self.track_name)
 
         if 'track_type' in options:
             track_type = options['track_type']
         else:
             track_type = 'table'
 
+        # get overlapping features from database
         if track_type == 'table':
-            self.add_table_features(track)
+            track = genome.track.Track(self.track_name)
+            table = track.h5f.getNode("/" + self.region.chrom.name)
+            self.features = FeatureSet.from_table(table, self.region)
+            track.close()
         elif track_type == 'flags':
-            self.add_flag_features(track)
+            vals = trackcache.get_track_values(self.track_name, self.region)
+            self.features = FeatureSet.from_flags(vals, self.region)
         else:
-            raise ValueError("unknown track type '%s' expected 'table' or 'flags'")
+            raise ValueError("unknown track type '%s' expected "
+                             "'table' or 'flags'" % track_type)
 
 
         if self.height <= 0.0:
             self.height = 1.0
 
 
-    def add_table_features(self, track):        
-        table = track.h5f.getNode("/" + self.region.chrom.name)
-
-        qry = "(start <= %d) & (end >= %d)" % (self.region.end,
-                                               self.region.start)
-        for row in table.where(qry):
-            feat = genome.coord.Coord(self.region.chrom, row['start'], row['end'])
-            self.features.append(feat)
-
-
-    
-    def add_flag_features(self, track):
-        vals = track.get_nparray(self.region.chrom, self.region.start, self.region.end)
-
-        if vals[0] == 1:
-            # record start of region as start of first segment
-            starts = [self.region.start]
-        else:
-            starts = []
-
-        d = np.diff(vals.astype(np.int8))
-        # starts are at transitions from 0 => 1 
-        starts.extend(np.where(d == 1.0)[0] + self.region.start + 1)
-        # and ends are at transitions from 1 => 0
-        ends = list(np.where(d == -1.0)[0] + self.region.start + 1)
-
-        if vals[-1] == 1:
-            ends.append(self.region.end)
+    @classmethod
+    def prefetch(cls, region, options):
+        if options.get('track_type', 'table') == 'flags':
+            trackcache.get_track_values(options['track'], region)
 
-        if len(starts) != len(ends):
-            raise ValueError("Expected same number of starts "
-                             "(%d) and ends (%d)" % (len(starts), len(ends)))
 
-        for s, e in zip(starts, ends):
-            feat = genome.coord.Coord(self.region.chrom, s, e)
-            self.features.append(feat)
-        
-            
-        
-        
+    def get_export_data(self):
+        return {'start' : self.features.start,
+                'end' : self.features.end}
             
     
     def draw_track(self, r):
@@ -93,15 +65,21 @@ class SegmentTrack(Track):
             # no features
             return
 
-        feat_left = []
-        feat_right = []
-        for feat in self.features:
-            feat_left.append(feat.start)
-            feat_right.append(feat.end)
+        feat_left = self.features.start
+        feat_right = self.features.end
 
         feat_top = self.top - margin_height/2
         feat_bottom = feat_top - feat_height
 
+        if self.raster_width:
+            # paint column runs directly into an image
+            img = self.get_raster_image(r)
+            img.fill_runs(feat_left, feat_right,
+                          [self.color] * len(feat_left),
+                          feat_top, feat_bottom)
+            img.draw()
+            return
+
         # draw rectangle for each feature
         r.rect(robjects.FloatVector(feat_left),
                feat_bottom,
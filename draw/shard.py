@@ -0,0 +1,87 @@
+
+import json
+
+import numpy as np
+
+
+
+def parse_shard(shard_str):
+    """Parses a shard specification of the form i/N, where shards are
+    numbered from 1 to N (like SGE task ids). Returns (i, N)."""
+    try:
+        i, n = [int(x) for x in shard_str.split("/")]
+    except ValueError:
+        raise ValueError("expected shard of the form i/N, got '%s'" %
+                         shard_str)
+
+    if n < 1 or i < 1 or i > n:
+        raise ValueError("shard %d/%d is not in the range 1/%d to %d/%d" %
+                         (i, n, n, n, n))
+    return i, n
+
+
+
+def get_region_costs(regions, n_track):
+    """Estimates the cost of drawing each region as its length times
+    the number of tracks drawn"""
+    lengths = np.array([reg.end - reg.start + 1 for reg in regions],
+                       dtype=np.float64)
+    return lengths * max(n_track, 1)
+
+
+
+def assign_shards(costs, n_shard):
+    """Assigns regions to shards so that the total cost of each shard
+    is balanced, by placing regions from most to least costly on the
+    shard with the lowest total so far (ties are broken by region
+    index and shard number, so the assignment is deterministic).
+    Returns an array with the shard (from 1 to n_shard) of each
+    region."""
+    costs = np.asarray(costs, dtype=np.float64)
+    order = np.lexsort((np.arange(costs.size), -costs))
+
+    totals = np.zeros(n_shard, dtype=np.float64)
+    shards = np.empty(costs.size, dtype=np.int64)
+    for i in order:
+        s = np.argmin(totals)
+        shards[i] = s + 1
+        totals[s] += costs[i]
+
+    return shards
+
+
+
+def get_shard_indices(costs, shard, n_shard):
+    """Returns the sorted indices of the regions drawn by a shard"""
+    return np.where(assign_shards(costs, n_shard) == shard)[0]
+
+
+
+def get_manifest_path(output_prefix, shard=None, n_shard=None):
+    if shard is None:
+        return "%s.manifest.json" % output_prefix
+    return "%s.shard%dof%d.manifest.json" % (output_prefix, shard, n_shard)
+
+
+
+def get_single_file_path(output_prefix, output_format, shard=None,
+                         n_shard=None):
+    if shard is None:
+        return "%s.%s" % (output_prefix, output_format)
+    return "%s.shard%dof%d.%s" % (output_prefix, shard, n_shard,
+                                  output_format)
+
+
+
+def write_manifest(path, manifest):
+    f = open(path, "w")
+    json.dump(manifest, f, indent=2)
+    f.write("\n")
+    f.close()
+
+
+def read_manifest(path):
+    f = open(path)
+    manifest = json.load(f)
+    f.close()
+    return manifest
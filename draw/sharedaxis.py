@@ -0,0 +1,237 @@
+
+import sys
+import os
+import json
+import hashlib
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+# quantiles estimated by ValueSketch are within this fraction of the
+# true value
+DEFAULT_RELATIVE_ACCURACY = 0.01
+
+# values with a smaller magnitude than this are counted as 0
+MIN_MAGNITUDE = 1e-12
+
+# merged regions are read this many bases at a time
+DEFAULT_CHUNK_SIZE = 1000000
+
+
+
+class ValueSketch(object):
+    """A streaming sketch of a distribution of values, from which
+    quantiles can be estimated with bounded relative error. Values are
+    counted in logarithmically spaced buckets (as in DDSketch), so
+    memory use depends on the range of the values rather than on how
+    many are added. The exact minimum and maximum are also kept.
+    Undefined (nan) values are ignored."""
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+
+        # counts keyed by bucket. Buckets are numbered 2*i for
+        # positive values and 2*i+1 for negative values, where i is
+        # the bucket of the magnitude of the value
+        self.counts = {}
+        self.n_zero = 0
+        self.n = 0
+        self.min_val = np.inf
+        self.max_val = -np.inf
+
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return
+
+        self.n += values.size
+        self.min_val = min(self.min_val, float(np.min(values)))
+        self.max_val = max(self.max_val, float(np.max(values)))
+
+        mag = np.abs(values)
+        nonzero = mag > MIN_MAGNITUDE
+        self.n_zero += int(values.size - np.sum(nonzero))
+
+        idx = np.ceil(np.log(mag[nonzero]) / self.log_gamma).astype(np.int64)
+        keys = idx * 2 + (values[nonzero] < 0)
+        uniq_keys, key_counts = np.unique(keys, return_counts=True)
+        for key, count in zip(uniq_keys.tolist(), key_counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+
+
+    def get_bucket_value(self, key):
+        idx = key // 2
+        mag = 2.0 * self.gamma ** idx / (self.gamma + 1.0)
+        if key % 2:
+            return -mag
+        return mag
+
+
+    def get_quantile(self, q):
+        """Returns an estimate of the q quantile of the values added so
+        far (the exact minimum and maximum for q of 0 and 1)"""
+        if self.n == 0:
+            return np.nan
+        if q >= 1.0:
+            return self.max_val
+        if q <= 0.0:
+            return self.min_val
+
+        keys = list(self.counts.keys())
+        vals = np.array([self.get_bucket_value(k) for k in keys] + [0.0])
+        counts = np.array([self.counts[k] for k in keys] + [self.n_zero])
+
+        order = np.argsort(vals, kind='stable')
+        cum = np.cumsum(counts[order])
+        rank = q * (self.n - 1)
+        val = vals[order][np.searchsorted(cum, rank, side='right')]
+
+        return float(np.clip(val, self.min_val, self.max_val))
+
+
+
+def get_region_chunks(regions, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Merges overlapping regions on each chromosome and splits the
+    merged intervals into chunks of at most chunk_size bases. Returns a
+    list of (chrom, start, end) tuples."""
+    from .metagene import merge_intervals
+
+    chrom_intervals = OrderedDict()
+    for i in range(len(regions)):
+        reg = regions[i]
+        if reg.chrom.name not in chrom_intervals:
+            chrom_intervals[reg.chrom.name] = (reg.chrom, [], [])
+        chrom, starts, ends = chrom_intervals[reg.chrom.name]
+        starts.append(reg.start)
+        ends.append(reg.end)
+
+    chunks = []
+    for chrom, starts, ends in chrom_intervals.values():
+        for start, end in zip(*merge_intervals(starts, ends)):
+            for chunk_start in range(int(start), int(end) + 1, chunk_size):
+                chunks.append((chrom, chunk_start,
+                               min(chunk_start + chunk_size - 1, int(end))))
+
+    return chunks
+
+
+
+def add_axis_values(sketch, track_spec, region):
+    """Adds the axis values of a track in a region to a sketch. Returns
+    False (after writing a warning) if the track cannot be read there,
+    in the same cases where creating the track would fail."""
+    track_name, track_class, options = track_spec
+    try:
+        values = track_class.get_axis_values(region, options)
+    except (TypeError, ValueError) as err:
+        sys.stderr.write("WARNING: could not read track %s in %s for "
+                         "shared axis: %s\n" % (track_name, str(region),
+                                                str(err)))
+        return False
+
+    sketch.add(values)
+    return True
+
+
+
+def get_shared_range(track_specs, regions, quantile=1.0,
+                     chunk_size=DEFAULT_CHUNK_SIZE):
+    """Computes a y-axis range shared by tracks across all regions, in
+    a single streaming pass. track_specs is a list of (track_name,
+    track_class, options) tuples. Tracks with axis_values_by_position
+    are read over the merged regions a chunk at a time, from their
+    source values and without creating tracks, so positions covered
+    by several regions are only read once. Other tracks are created
+    for each region. Regions where a track cannot be read are skipped
+    with a warning. Returns (min_val, max_val), which are the quantile
+    and 1-quantile of the values of all of the tracks (or the exact
+    maximum and minimum when quantile is 1)."""
+    import genome.coord
+
+    sketch = ValueSketch()
+
+    by_position = [spec for spec in track_specs
+                   if getattr(spec[1], "axis_values_by_position", False)]
+    by_region = [spec for spec in track_specs
+                 if not getattr(spec[1], "axis_values_by_position", False)]
+
+    if by_position:
+        chunks = get_region_chunks(regions, chunk_size)
+        for i, (chrom, start, end) in enumerate(chunks):
+            region = genome.coord.Coord(chrom, start, end)
+            for spec in by_position:
+                add_axis_values(sketch, spec, region)
+
+            if (i + 1) % 100 == 0:
+                sys.stderr.write("  %d/%d chunks\n" % (i + 1, len(chunks)))
+
+    if by_region:
+        for i in range(len(regions)):
+            for spec in by_region:
+                add_axis_values(sketch, spec, regions[i])
+
+            if (i + 1) % 100 == 0:
+                sys.stderr.write("  %d/%d regions\n" % (i + 1, len(regions)))
+
+    if sketch.n == 0:
+        return 0.0, 0.0
+
+    return sketch.get_quantile(1.0 - quantile), sketch.get_quantile(quantile)
+
+
+
+def get_axes_key(groups, regions):
+    """Returns a hash of the tracks of each axis group (and their
+    options) and of the regions, so that saved axes are only reused by
+    runs that would compute the same axes"""
+    h = hashlib.sha1()
+    for group_name, track_specs in groups.items():
+        h.update(("group %s\n" % group_name).encode())
+        for track_name, track_class, options in track_specs:
+            h.update(("track %s\n" % track_name).encode())
+            for key, val in sorted(options.items()):
+                h.update(("%s=%s\n" % (key, val)).encode())
+
+    for i in range(len(regions)):
+        reg = regions[i]
+        h.update(("%s:%d-%d\n" % (reg.chrom.name, reg.start,
+                                  reg.end)).encode())
+
+    return h.hexdigest()
+
+
+
+def read_axes(path, key):
+    """Returns the axis ranges saved by write_axes, keyed by group
+    name, or None if there are none for this key"""
+    if not os.path.exists(path):
+        return None
+
+    f = open(path)
+    saved = json.load(f)
+    f.close()
+
+    if saved.get('key') != key:
+        sys.stderr.write("shared axes in %s are for different tracks or "
+                         "regions\n" % path)
+        return None
+    return saved['axes']
+
+
+
+def write_axes(path, key, axes):
+    # write to temporary file first so that other runs (e.g. other
+    # shards) never read a partially written file. Each writer uses its
+    # own temporary file, since shards may write at the same time.
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+    f = os.fdopen(fd, "w")
+    json.dump({'key' : key, 'axes' : axes}, f, indent=2)
+    f.write("\n")
+    f.close()
+    os.replace(tmp_path, path)
@@ -0,0 +1,153 @@
+
+import numpy as np
+
+
+# by default paths are simplified until they are within this many
+# device units (1/72 inch on PDF and SVG devices) of the original
+DEFAULT_TOLERANCE = 0.25
+
+
+
+def get_step_polygons(vals, first_pos, axis):
+    """Returns the x and y coordinates of filled step outlines between
+    the axis and the values, where vals[i] is the value at position
+    first_pos + i. Runs of identical values become single steps and
+    separate polygons are divided by nan coordinates (which R uses to
+    separate polygons drawn with a single call). As in earlier versions,
+    a single undefined position does not break a polygon."""
+    vals = np.asarray(vals, dtype=np.float64)
+    defined = ~np.isnan(vals)
+    if not np.any(defined):
+        return np.array([]), np.array([])
+
+    idx = np.arange(vals.size)
+    prev_defined = np.concatenate([[False], defined[:-1]])
+    prev_vals = np.concatenate([[np.nan], vals[:-1]])
+    seg_start = defined & (~prev_defined | (vals != prev_vals))
+
+    # segments end where the next segment starts or where
+    # undefined values start
+    starts = idx[seg_start]
+    next_undef = np.concatenate([idx[~defined], [vals.size]])
+    next_start = np.concatenate([starts[1:], [vals.size]])
+    ends = np.minimum(next_start,
+                      next_undef[np.searchsorted(next_undef, starts)])
+
+    x1 = (starts + first_pos).astype(np.float64)
+    # add 1 because drawn coordinates are "between" start and end
+    x2 = (ends + first_pos).astype(np.float64)
+    y = vals[starts]
+
+    # a new polygon is started after gaps of more than one position
+    new_poly = np.concatenate([[True], x1[1:] > x2[:-1] + 1])
+    first = np.where(new_poly)[0]
+    last = np.concatenate([first[1:] - 1, [x1.size - 1]])
+
+    p_x = np.column_stack([x1, x2]).ravel()
+    p_y = np.column_stack([y, y]).ravel()
+
+    # add points on the axis at the start and end of each polygon,
+    # followed by a separator
+    n_poly = first.size
+    ins_idx = np.column_stack([first * 2, last * 2 + 2,
+                               last * 2 + 2]).ravel()
+    ins_x = np.column_stack([x1[first], x2[last],
+                             np.full(n_poly, np.nan)]).ravel()
+    ins_y = np.column_stack([np.full(n_poly, axis), np.full(n_poly, axis),
+                             np.full(n_poly, np.nan)]).ravel()
+
+    p_x = np.insert(p_x, ins_idx, ins_x)[:-1]
+    p_y = np.insert(p_y, ins_idx, ins_y)[:-1]
+
+    return p_x, p_y
+
+
+
+def decimate_columns(x, y, col_width):
+    """Keeps only the first, last, lowest and highest points in each
+    column of width col_width of a path with non-decreasing x
+    coordinates. The shape of the path is unchanged when drawn at a
+    resolution of one column. Returns the indices of kept points."""
+    col = np.floor((x - x[0]) / col_width).astype(np.int64)
+
+    is_first = np.concatenate([[True], col[1:] != col[:-1]])
+    is_last = np.concatenate([col[1:] != col[:-1], [True]])
+
+    # points sorted by y within each column
+    order = np.lexsort((y, col))
+    col_sorted = col[order]
+    lowest = order[np.concatenate([[True], col_sorted[1:] != col_sorted[:-1]])]
+    highest = order[np.concatenate([col_sorted[1:] != col_sorted[:-1], [True]])]
+
+    keep = is_first | is_last
+    keep[lowest] = True
+    keep[highest] = True
+
+    return np.where(keep)[0]
+
+
+
+def douglas_peucker(x, y, tol):
+    """Douglas-Peucker simplification of a path. Returns a boolean
+    array flagging the points to keep so that no removed point is
+    further than tol from the simplified path."""
+    n = x.size
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+
+        dx = x[j] - x[i]
+        dy = y[j] - y[i]
+        px = x[i+1:j] - x[i]
+        py = y[i+1:j] - y[i]
+        norm = np.hypot(dx, dy)
+        if norm > 0:
+            dist = np.abs(dy * px - dx * py) / norm
+        else:
+            dist = np.hypot(px, py)
+
+        k = np.argmax(dist)
+        if dist[k] > tol:
+            m = i + 1 + k
+            keep[m] = True
+            stack.append((i, m))
+            stack.append((m, j))
+
+    return keep
+
+
+
+def simplify_path(x, y, tol_x, tol_y):
+    """Simplifies a path (or several paths separated by nan coordinates)
+    with non-decreasing x coordinates, so that it differs from the
+    original by no more than tol_x horizontally and tol_y vertically.
+    Returns the simplified x and y coordinates."""
+    if x.size == 0 or tol_x <= 0 or tol_y <= 0:
+        return x, y
+
+    sep = np.where(np.isnan(x))[0]
+    piece_starts = np.concatenate([[0], sep + 1])
+    piece_ends = np.concatenate([sep, [x.size]])
+
+    out_x = []
+    out_y = []
+    for s, e in zip(piece_starts, piece_ends):
+        px = x[s:e]
+        py = y[s:e]
+        if px.size > 3:
+            idx = decimate_columns(px, py, tol_x)
+            # simplify in units of the tolerance
+            keep = douglas_peucker(px[idx] / tol_x, py[idx] / tol_y, 1.0)
+            px = px[idx][keep]
+            py = py[idx][keep]
+        out_x.extend([px, [np.nan]])
+        out_y.extend([py, [np.nan]])
+
+    return np.concatenate(out_x[:-1]), np.concatenate(out_y[:-1])
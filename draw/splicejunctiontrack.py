@@ -2,7 +2,7 @@ import sys
 import math
 
 import numpy as np
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 from .track import Track
 
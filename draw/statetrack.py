@@ -1,10 +1,14 @@
 
 import sys
 
+import numpy as np
+
 from .track import Track
+from .featureset import FeatureSet
+from . import trackcache
 
 
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 
 
@@ -38,47 +42,28 @@ class StateTrack(Track):
                 self.state_labels[i] = ""
         
         self.track_name = options['track']
-        self.features = []
 
-        # get GenomeDB instance
-        gdb = options['gdb']
-        track = gdb.open_track(self.track_name)
+        vals = trackcache.get_track_values(self.track_name, region)
 
-        self.features = self.__create_features(region, track)
+        # one feature for each run of the same state
+        self.features, self.state_ids = FeatureSet.from_runs(vals, region)
 
-        track.close()
 
+    @classmethod
+    def prefetch(cls, region, options):
+        trackcache.get_track_values(options['track'], region)
 
-    def __create_features(self, region, track):
-        vals = track.get_nparray(region.chrom, region.start, region.end)
 
-        region_len = region.end - region.start + 1
-        
-        features = []
-
-        cur_feat = None
-        for i in range(region_len):
-            if (cur_feat is None) or (vals[i] != cur_feat.state_id):
-                if cur_feat:
-                    # update end of previous feature
-                    cur_feat.end = region.start + i - 1
-                
-                cur_feat = genome.coord.Coord(region.chrom,
-                                              region.start + i,
-                                              region.start + i)
-                cur_feat.state_id = vals[i]
-
-                features.append(cur_feat)
-
-        if cur_feat:
-            # update end of last feature
-            cur_feat.end = region.end
-
-        return features
-        
-            
+    def get_state_colors(self):
+        return [self.state_colors.get(state_id, "grey50")
+                for state_id in self.state_ids.tolist()]
 
 
+    def get_export_data(self):
+        return {'start' : self.features.start,
+                'end' : self.features.end,
+                'state' : self.state_ids}
+
 
     def draw_track(self, r):
         feat_height = 0.5 * self.height
@@ -86,39 +71,45 @@ class StateTrack(Track):
 
         region_len = self.region.end - self.region.start + 1.0
 
-        for feat in self.features:
-            top = self.top - margin_height/2
-            bottom = top - feat_height
+        top = self.top - margin_height/2
+        bottom = top - feat_height
+
+        starts = self.features.start
+        ends = self.features.end
+        colors = self.get_state_colors()
 
+        if self.raster_width:
+            # paint column color runs directly into an image
+            img = self.get_raster_image(r)
+            img.fill_runs(starts, ends, colors, top, bottom)
+            img.draw()
+        elif len(self.features):
             # color based on state number of feature
-            if feat.state_id in self.state_colors:
-                color = self.state_colors[feat.state_id]
-            else:
-                color = "grey50"
-            
-            r.rect(feat.start, bottom, feat.end, top, col=color,
-                   border=color)
+            r.rect(robjects.FloatVector(starts), bottom,
+                   robjects.FloatVector(ends), top,
+                   col=robjects.StrVector(colors),
+                   border=robjects.StrVector(colors))
 
         # draw a label for the entire track
         self.draw_track_label(r)
-        
-        # now draw labels on top of features            
-        label_offsets = (0.5, 0.0, -0.5)
-        offset_idx = 0
-
-        for feat in self.features:
-            label_offset = label_offsets[offset_idx]
-            offset_idx += 1
-            if offset_idx >= len(label_offsets):
-                offset_idx = 0
-        
-            if feat.state_id in self.state_labels:
-                # add label to state
-                label = self.state_labels[feat.state_id]
-                mid_y = (top + bottom) * 0.5 + label_offset
-                mid_x = (feat.start + feat.end) * 0.5
-                r.text(x=mid_x, y=mid_y, labels=r.c(label),
-                       cex=self.cex)
+
+        if len(self.features) == 0:
+            return
+
+        # now draw labels on top of features, cycling through offsets
+        label_offsets = np.array([0.5, 0.0, -0.5])
+        mid_y = (top + bottom) * 0.5 + \
+                label_offsets[np.arange(len(self.features)) %
+                              label_offsets.size]
+        mid_x = (starts + ends) * 0.5
+
+        labels = []
+        for state_id in self.state_ids.tolist():
+            if state_id in self.state_labels:
+                labels.append(self.state_labels[state_id])
             else:
-                sys.stderr.write("no label for state %d\n" % feat.state_id)
-            
+                sys.stderr.write("no label for state %d\n" % state_id)
+                labels.append("")
+
+        r.text(x=robjects.FloatVector(mid_x), y=robjects.FloatVector(mid_y),
+               labels=robjects.StrVector(labels), cex=self.cex)
@@ -0,0 +1,249 @@
+
+import sys
+import os
+import hashlib
+import threading
+import collections
+
+
+# number of bases spanned by a tile at zoom level 0; each zoom level
+# above 0 doubles the span of a tile
+DEFAULT_BASE_BP = 1024
+
+DEFAULT_TILE_WIDTH = 256
+
+# changed when the way tiles are drawn changes, so that tiles cached
+# by earlier versions are not reused
+TILE_VERSION = 3
+
+# options of the TILES section that do not change how tiles are drawn
+TILE_CACHE_OPTIONS = ("cache_dir", "cache_mb", "prefetch")
+
+
+
+class TileSet(object):
+    """Describes a set of fixed-width tiles drawn for a fixed set of
+    tracks. Tiles are identified by chromosome, zoom level and index
+    along the chromosome. At zoom level z each tile spans
+    base_bp * 2^z bases, except for the last tile of each chromosome,
+    which is narrower."""
+
+    def __init__(self, track_names, config, base_bp=DEFAULT_BASE_BP,
+                 tile_width=DEFAULT_TILE_WIDTH):
+        self.track_names = track_names
+        self.base_bp = base_bp
+        self.tile_width = tile_width
+        self.hash = self.get_hash(config)
+
+
+    def get_hash(self, config):
+        """Returns a hash of every config option that affects how tiles
+        are drawn, so that cached tiles are not reused if they change:
+        the MAIN section (drawing options such as DRAW_GRID, CEX and
+        WINDOW_MARGIN, vertical lines and genes), the TILES section
+        (except the options of the cache itself), and the GENE_ and
+        TRACK_ sections of the genes and tracks that are drawn"""
+        h = hashlib.sha1()
+        h.update(("%d:%d:%d\n" % (TILE_VERSION, self.base_bp,
+                                  self.tile_width)).encode())
+
+        section_names = ["MAIN", "TILES"]
+        if config.has_option("MAIN", "GENES"):
+            section_names.extend("GENE_" + x for x in
+                                 config.get("MAIN", "GENES").split(","))
+        section_names.extend("TRACK_" + x for x in self.track_names)
+
+        for section_name in section_names:
+            h.update(("[%s]\n" % section_name).encode())
+            if not config.has_section(section_name):
+                continue
+            for key, val in sorted(config.items(section_name)):
+                if section_name == "TILES" and \
+                   key.lower() in TILE_CACHE_OPTIONS:
+                    continue
+                h.update(("%s=%s\n" % (key, val)).encode())
+
+        return h.hexdigest()[:12]
+
+
+    def get_span(self, zoom):
+        """Returns number of bases spanned by a tile at a zoom level"""
+        return self.base_bp * (2 ** zoom)
+
+
+    def get_tile_coords(self, chrom, zoom, index):
+        """Returns the start and end coordinates of a tile. The last
+        tile of a chromosome ends at the end of the chromosome, so it
+        spans fewer bases than the others (see get_tile_width). Raises
+        a ValueError if the tile is not on the chromosome."""
+        if zoom < 0:
+            raise ValueError("zoom level must be >= 0")
+
+        span = self.get_span(zoom)
+        start = index * span + 1
+
+        if index < 0 or start > chrom.length:
+            raise ValueError("tile %d at zoom %d is not on %s" %
+                             (index, zoom, chrom.name))
+
+        end = min(start + span - 1, chrom.length)
+
+        return start, end
+
+
+    def get_tile_width(self, zoom, start, end):
+        """Returns the width in pixels of a tile from start to end, so
+        that a tile that is cut short by the end of a chromosome is drawn
+        at the same scale as the other tiles at its zoom level"""
+        frac = float(end - start + 1) / self.get_span(zoom)
+        return max(int(round(self.tile_width * frac)), 1)
+
+
+    def get_key(self, chrom_name, zoom, index):
+        return (chrom_name, zoom, index, self.hash)
+
+
+    def get_neighbours(self, chrom, zoom, index, n_neighbour=1):
+        """Returns keys of the tiles on either side of this tile at the
+        same zoom level, nearest first"""
+        n_tile = (chrom.length + self.get_span(zoom) - 1) // \
+                 self.get_span(zoom)
+
+        keys = []
+        for offset in range(1, n_neighbour + 1):
+            for i in (index + offset, index - offset):
+                if i >= 0 and i < n_tile:
+                    keys.append(self.get_key(chrom.name, zoom, i))
+
+        return keys
+
+
+
+class TileCache(object):
+    """A size-bounded on-disk cache of rendered tiles. When the total
+    size of the cached tiles exceeds max_bytes, the least recently used
+    tiles are removed. Existing tiles in the cache directory are reused
+    (in order of modification time) when the cache is created."""
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+        # maps tile path to size, ordered from least to most
+        # recently used
+        self.entries = collections.OrderedDict()
+        self.total_bytes = 0
+
+        self.n_hit = 0
+        self.n_miss = 0
+
+        self.scan()
+
+
+    def scan(self):
+        """Records tiles already present in the cache directory"""
+        found = []
+        for dir_path, dir_names, file_names in os.walk(self.cache_dir):
+            for name in file_names:
+                if name.endswith(".png"):
+                    path = os.path.join(dir_path, name)
+                    st = os.stat(path)
+                    found.append((st.st_mtime, path, st.st_size))
+
+        for mtime, path, size in sorted(found):
+            self.entries[path] = size
+            self.total_bytes += size
+
+        if found:
+            sys.stderr.write("tile cache: found %d tiles (%.1f MB)\n" %
+                             (len(found), self.total_bytes / 1e6))
+        self.evict()
+
+
+    def get_path(self, key):
+        chrom_name, zoom, index, track_set_hash = key
+        return os.path.join(self.cache_dir, track_set_hash, chrom_name,
+                            str(zoom), "%d.png" % index)
+
+
+    def contains(self, key):
+        with self.lock:
+            return self.get_path(key) in self.entries
+
+
+    def get(self, key):
+        """Returns contents of a cached tile, or None if the tile is not
+        in the cache"""
+        path = self.get_path(key)
+
+        with self.lock:
+            if path not in self.entries:
+                self.n_miss += 1
+                return None
+
+            # mark as most recently used
+            self.entries.move_to_end(path)
+            self.n_hit += 1
+
+        try:
+            f = open(path, "rb")
+            data = f.read()
+            f.close()
+            # update modification time so that recency is kept
+            # if the cache is reloaded
+            os.utime(path, None)
+        except (IOError, OSError):
+            # tile was removed from disk by someone else
+            with self.lock:
+                if path in self.entries:
+                    self.total_bytes -= self.entries.pop(path)
+            return None
+
+        return data
+
+
+    def put(self, key, data):
+        """Adds a rendered tile to the cache"""
+        path = self.get_path(key)
+        tile_dir = os.path.dirname(path)
+        if not os.path.exists(tile_dir):
+            os.makedirs(tile_dir)
+
+        # write to temporary file first so that partially written
+        # tiles are never read
+        tmp_path = path + ".tmp"
+        f = open(tmp_path, "wb")
+        f.write(data)
+        f.close()
+        os.replace(tmp_path, path)
+
+        with self.lock:
+            if path in self.entries:
+                self.total_bytes -= self.entries.pop(path)
+            self.entries[path] = len(data)
+            self.total_bytes += len(data)
+
+        self.evict()
+
+
+    def evict(self):
+        """Removes least recently used tiles until the cache is
+        within its size limit"""
+        with self.lock:
+            while self.total_bytes > self.max_bytes and self.entries:
+                path, size = self.entries.popitem(last=False)
+                self.total_bytes -= size
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+    def get_stats(self):
+        with self.lock:
+            return {'n_tile' : len(self.entries),
+                    'bytes' : self.total_bytes,
+                    'max_bytes' : self.max_bytes,
+                    'hits' : self.n_hit,
+                    'misses' : self.n_miss}
@@ -1,95 +1,25 @@
 import sys
 
-import rpy2.robjects as robjects
+import numpy as np
 
+from .rlib import robjects
 
-class RowElement(object):
-    def __init__(self, feature, prev=None, next=None, padding=0.0):
-        self.feature = feature
-        self.start = feature.start - padding
-        self.end = feature.end + padding
-        self.prev = prev
-        self.next = next
+from .raster import RasterImage
+from .featureset import FeatureSet, assign_rows
 
 
-class Row(object):
-    def __init__(self, id):
-        self.id = id
-        self.elements = []
-        self.first = None
-        self.last = None
+# By default, feature tracks with more than this many features or rows
+# are drawn in a collapsed form
+DEFAULT_COLLAPSE_MAX_FEATURES = 2000
+DEFAULT_COLLAPSE_MAX_ROWS = 50
 
+# number of bins used for density histograms of collapsed tracks
+DEFAULT_DENSITY_BINS = 500
 
-    def add_element(self, new_elem):
-        """adds a feature to this row, returns True on success
-        or False if there was no room for the feature"""
+# number of rows used by 'squish' layouts of collapsed tracks
+DEFAULT_SQUISH_ROWS = 8
 
-        if self.first is None:
-            # create a new element
-            #sys.stderr.write("added feat %d-%d as only element of row %d\n" %
-            #                 (new_elem.start, new_elem.end, self.id))
-            new_elem.prev = None
-            new_elem.next = None
-            self.first = self.last = new_elem
-            return True
-
-        cur = self.first
-        while(cur and cur.start < new_elem.start):
-            cur = cur.next
-
-        if cur is None:
-            if self.last.end < new_elem.start:
-                # add feature to end of list
-                # sys.stderr.write("added feat %d-%d to end of row %d\n" %
-                #                 (new_elem.start, new_elem.end, self.id))
-                new_elem.prev = self.last
-                new_elem.next = None
-                self.last.next = new_elem
-                self.last = new_elem
-                return True
-            else:
-                # last element overlaps with this one
-                return False
-
-        prev = cur.prev
-        if prev is None:
-            if new_elem.end < cur.start:
-                # can insert feature at start of list
-                # sys.stderr.write("added feat %d-%d to start of row %d "
-                #                 "(before %d-%d)\n" %
-                #                 (new_elem.start, new_elem.end, self.id,
-                #                 cur.start, cur.end))
-                new_elem.prev = None
-                new_elem.next = cur
-                cur.prev = new_elem
-                self.first = new_elem
-                return True
-            else:
-                # first feature overlaps with this one
-                return False
-        
-        if prev.end < new_elem.start and cur.start > new_elem.end:
-            # can insert feature between these two elements
-            #sys.stderr.write("added feat %d-%d between %d-%d and %d-%d "
-            #                 "in row %d\n" %
-            #                 (new_elem.start, new_elem.end,
-            #                  prev.start, prev.end,
-            #                  cur.start, cur.end, self.id))
-            
-            new_elem.prev = prev
-            new_elem.next = cur
-            prev.next = new_elem
-            cur.prev = new_elem
-            return True
 
-        # could not find place to insert new element in this row
-        return False
-            
-        
-        
-        
-        
-        
 class Track(object):
     """An abstract base class for all genome tracks that can be added
     to a Window and drawn. Subclasses should provide an implementation
@@ -124,10 +54,15 @@ class Track(object):
         self.top = None
         self.bottom = None
 
+        # size in pixels when drawn to a raster device
+        self.raster_width = None
+        self.raster_height = None
+
         self.n_fwd_row = 0
         self.n_rev_row = 0
         self.n_row = 0
         self.row_assignment = {}
+        self.feature_rows = None
         
         
 
@@ -180,15 +115,17 @@ class Track(object):
             else:
                 self.rev_border_color = self.rev_color
         else:
-            # no not draw any border
-            self.border_color = robjects.r("NA")
-            self.rev_border_color = robjects.r("NA")
-            self.fwd_border_color = robjects.r("NA")
+            # no not draw any border (R treats the color "NA" as
+            # transparent)
+            self.border_color = "NA"
+            self.rev_border_color = "NA"
+            self.fwd_border_color = "NA"
                 
 
         
 
-    def parse_bool_str(self, bool_str):
+    @staticmethod
+    def parse_bool_str(bool_str):
         """Utility method for parsing boolean option strings"""
         if bool_str.lower() in ('on', 'yes', 'true', '1'):
             return True
@@ -207,6 +144,29 @@ class Track(object):
         self.bottom = bottom
 
 
+    def set_raster_size(self, width, height):
+        """Sets the size of this track in pixels. This is only set
+        when output is to a raster device, and tracks that support it
+        can then paint directly into an image of this size instead
+        of drawing polygons"""
+        self.raster_width = width
+        self.raster_height = height
+
+
+    def get_raster_image(self, r):
+        """Returns an empty RasterImage covering the area of this track"""
+        return RasterImage(r, self.left, self.right, self.top, self.bottom,
+                           self.raster_width, self.raster_height)
+
+
+    def get_device_units(self, r):
+        """Returns the width and height of one device unit (1/72 inch
+        on PDF and SVG devices) in user coordinates"""
+        x = r.grconvertX(robjects.FloatVector([0.0, 1.0]), "device", "user")
+        y = r.grconvertY(robjects.FloatVector([0.0, 1.0]), "device", "user")
+        return abs(x[1] - x[0]), abs(y[1] - y[0])
+
+
     def draw_track_label(self, r, color="black"):
         """draws a label on the left side of the track"""
         
@@ -227,6 +187,32 @@ class Track(object):
         pass
 
 
+    @classmethod
+    def prefetch(cls, region, options):
+        """Reads the data that a track of this class will need for the
+        region into the block cache (see draw.trackcache). This is
+        called from worker threads before the tracks of a region are
+        created, so that reads for several tracks can overlap. By
+        default nothing is read."""
+        pass
+
+
+    @classmethod
+    def prepare_regions(cls, regions, options):
+        """Called once with all of the regions that are going to be
+        drawn, before any tracks are created, so that tracks of this
+        class can look up data for every region in a single pass. By
+        default nothing is done."""
+        pass
+
+
+    def get_export_data(self):
+        """Returns a dictionary of the processed data that this track
+        draws, keyed by name. This is used to export data instead
+        of drawing it."""
+        return {}
+
+
     def draw(self, r):
         self.draw_track(r)
 
@@ -234,55 +220,168 @@ class Track(object):
             self.draw_track_label(r)
 
 
-    def assign_feature_rows(self, features, use_strands=True,
-                            padding=0.0):
-        fwd_rows = []
-        rev_rows = []
+    def init_collapse(self, options):
+        """Sets options that control when and how tracks with many
+        overlapping features are collapsed. Collapsed tracks are
+        drawn either as a histogram of feature density (the default)
+        or with a fixed number of 'squished' rows, so that the
+        height and drawing cost of the track are bounded."""
+        if 'collapse_max_features' in options:
+            self.collapse_max_features = int(options['collapse_max_features'])
+        else:
+            self.collapse_max_features = DEFAULT_COLLAPSE_MAX_FEATURES
 
-        self.n_row = 0
-        self.n_rev_row = 0
-        self.n_fwd_row = 0
+        if 'collapse_max_rows' in options:
+            self.collapse_max_rows = int(options['collapse_max_rows'])
+        else:
+            self.collapse_max_rows = DEFAULT_COLLAPSE_MAX_ROWS
 
-        row_ids = {}
+        if 'collapse_mode' in options:
+            self.collapse_mode = options['collapse_mode'].lower()
+        else:
+            self.collapse_mode = 'density'
 
-        for feat in features:
-            row_elem = RowElement(feat, padding=padding)
-            
-            if use_strands and feat.strand == -1:
-                placed_elem = False
-                for row in rev_rows:
-                    if(row.add_element(row_elem)):
-                        # managed to fit feature into this row
-                        placed_elem = True
-                        row_ids[feat] = row.id
-                        break
-
-                if not placed_elem:
-                    # create a new row
-                    self.n_rev_row += 1
-                    row = Row(id = -self.n_rev_row)
-                    rev_rows.append(row)
-                    row_ids[feat] = row.id
-                    if not row.add_element(row_elem):
-                        raise Exception("could not place feature in new row")
+        if self.collapse_mode not in ('density', 'squish'):
+            raise ValueError("unknown collapse_mode '%s', expected "
+                             "'density' or 'squish'" % self.collapse_mode)
 
-            else:
-                placed_elem = False
-                for row in fwd_rows:
-                    if(row.add_element(row_elem)):
-                        # managed to fit feature into this row
-                        placed_elem = True
-                        row_ids[feat] = row.id
-                        break
-
-                if not placed_elem:
-                    # create a new row
-                    self.n_fwd_row += 1
-                    row = Row(id = self.n_fwd_row)
-                    fwd_rows.append(row)
-                    row_ids[feat] = row.id
-                    if not row.add_element(row_elem):
-                        raise Exception("could not place feature in new row")
+        if 'density_bins' in options:
+            self.density_bins = int(options['density_bins'])
+        else:
+            self.density_bins = DEFAULT_DENSITY_BINS
+
+        if 'squish_rows' in options:
+            self.squish_rows = int(options['squish_rows'])
+        else:
+            self.squish_rows = DEFAULT_SQUISH_ROWS
+
+        self.collapsed = False
+
+
+    def check_collapse(self, n_feature=None):
+        """Collapses this track if the number of features (if
+        provided) or number of assigned rows is over the threshold.
+        Returns True if the track is collapsed."""
+        if n_feature is not None and self.collapse_max_features > 0 and \
+           n_feature > self.collapse_max_features:
+            sys.stderr.write("  %d features, drawing collapsed track\n" %
+                             n_feature)
+            self.collapsed = True
+        elif self.collapse_max_rows > 0 and \
+             self.n_row > self.collapse_max_rows:
+            sys.stderr.write("  %d rows, drawing collapsed track\n" %
+                             self.n_row)
+            self.collapsed = True
+
+        return self.collapsed
+
+
+    def get_collapsed_height(self):
+        if self.collapse_mode == 'squish':
+            return self.squish_rows * 0.2
+        return 1.0
+
+
+    def get_feature_density(self, starts, ends, n_bin):
+        """Returns the number of features that overlap each of n_bin
+        equal-sized bins across the region"""
+        region_len = float(self.region.end - self.region.start + 1)
+
+        start_bin = np.floor((starts - self.region.start) / region_len * n_bin)
+        end_bin = np.floor((ends - self.region.start) / region_len * n_bin)
+        start_bin = np.clip(start_bin, 0, n_bin-1).astype(np.int64)
+        end_bin = np.clip(end_bin, 0, n_bin-1).astype(np.int64)
+
+        # count features starting in each bin, minus those ending
+        # in previous bin, and take cumulative sum
+        counts = np.bincount(start_bin, minlength=n_bin+1) - \
+                 np.bincount(end_bin + 1, minlength=n_bin+1)
+
+        return np.cumsum(counts)[:n_bin]
+
+
+    def draw_collapsed(self, r, starts, ends, colors):
+        """Draws features with the provided start and end coordinates
+        in collapsed form. Colors is a list with a color for each
+        feature, which is used by squish layouts; density histograms
+        are drawn with the track color."""
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+
+        if starts.size == 0:
+            return
+
+        if self.collapse_mode == 'squish':
+            # assign features to a fixed number of rows in order
+            # of their start position
+            order = np.argsort(starts, kind='stable')
+            rows = np.empty(starts.size, dtype=np.int64)
+            rows[order] = np.arange(starts.size) % self.squish_rows
+
+            row_height = self.height / float(self.squish_rows)
+            top = self.top - rows * row_height
+            bottom = top - row_height * 0.8
+
+            r.rect(robjects.FloatVector(starts - 0.5),
+                   robjects.FloatVector(bottom),
+                   robjects.FloatVector(ends + 0.5),
+                   robjects.FloatVector(top),
+                   col=robjects.StrVector(colors), border="NA")
+        else:
+            n_bin = self.density_bins
+            density = self.get_feature_density(starts, ends, n_bin)
+            max_density = float(max(np.max(density), 1))
+
+            region_len = float(self.region.end - self.region.start + 1)
+            bin_sz = region_len / n_bin
+            left = self.region.start + np.arange(n_bin) * bin_sz
+            right = left + bin_sz
+
+            f = density > 0
+            heights = density[f] / max_density * self.height
+
+            r.rect(robjects.FloatVector(left[f]),
+                   self.bottom,
+                   robjects.FloatVector(right[f]),
+                   robjects.FloatVector(self.bottom + heights),
+                   col=self.color, border="NA")
+
+            # label with maximum number of overlapping features
+            r.text(x=self.region.end, y=self.top, pos=2,
+                   labels="max %d per bin" % int(max_density),
+                   cex=self.cex * 0.75)
+
+
+    def assign_feature_rows(self, features, use_strands=True,
+                            padding=0.0):
+        """Assigns features to non-overlapping rows. Features may be
+        a FeatureSet, in which case the row of each feature is stored
+        in the feature_rows array, or a list of objects with start,
+        end and strand attributes, in which case rows are stored in the
+        row_assignment dictionary. When use_strands is True,
+        reverse-strand features are placed in rows after the
+        forward-strand rows, separated by an empty row."""
+        if isinstance(features, FeatureSet):
+            starts = features.start
+            ends = features.end
+            strands = features.strand
+        else:
+            starts = np.array([f.start for f in features], dtype=np.int64)
+            ends = np.array([f.end for f in features], dtype=np.int64)
+            strands = np.array([f.strand for f in features], dtype=np.int8)
+
+        if use_strands:
+            is_rev = strands == -1
+        else:
+            is_rev = np.zeros(starts.size, dtype=bool)
+
+        rows = np.empty(starts.size, dtype=np.int64)
+        rows[~is_rev], self.n_fwd_row = assign_rows(starts[~is_rev],
+                                                    ends[~is_rev], padding)
+        rev_rows, self.n_rev_row = assign_rows(starts[is_rev],
+                                               ends[is_rev], padding)
+        # reverse strand rows come after forward strand rows
+        rows[is_rev] = rev_rows + self.n_fwd_row + 1
 
         self.n_row = self.n_fwd_row + self.n_rev_row
 
@@ -290,15 +389,12 @@ class Track(object):
             # add extra row for separation between fwd/rev strands
             self.n_row += 1
 
-        self.row_assignment = {}
-        for feat, row_id in list(row_ids.items()):
-            # update assignment of reverse-strand features so that
-            # all numbers are positive (they just come after
-            # fwd strand rows)
-            if row_id < 0:
-                self.row_assignment[feat] = -row_id + self.n_fwd_row
-            else:
-                self.row_assignment[feat] = row_id - 1
+        self.feature_rows = rows
+
+        if isinstance(features, FeatureSet):
+            self.row_assignment = {}
+        else:
+            self.row_assignment = dict(zip(features, rows.tolist()))
 
             
                     
@@ -0,0 +1,141 @@
+
+import sys
+import threading
+import functools
+from collections import OrderedDict
+
+import numpy as np
+
+
+# size of the blocks that track values are read and cached in
+DEFAULT_BLOCK_SIZE = 1000000
+
+# total size of cached blocks before the least recently used are
+# discarded. A budget of 0 turns off caching.
+DEFAULT_CACHE_MB = 256
+
+
+
+class BlockCache(object):
+    """A read-through cache of track values. Values are read in fixed
+    size blocks for each (source, chromosome), so that overlapping and
+    nearby regions are served from memory. When the total size of the
+    cached blocks exceeds the budget, the least recently used blocks are
+    discarded. The cache can be shared by several threads."""
+
+    def __init__(self, max_mb=DEFAULT_CACHE_MB,
+                 block_size=DEFAULT_BLOCK_SIZE):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.block_size = block_size
+        self.blocks = OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+
+    def get_block(self, key, chrom, start, end, read_func):
+        with self.lock:
+            if key in self.blocks:
+                self.hits += 1
+                self.blocks.move_to_end(key)
+                return self.blocks[key]
+            self.misses += 1
+
+        # read without holding the lock, so that other threads can
+        # read other blocks at the same time
+        block = read_func(chrom, start, end)
+
+        with self.lock:
+            if key not in self.blocks and block.nbytes <= self.max_bytes:
+                self.blocks[key] = block
+                self.n_bytes += block.nbytes
+
+                while self.n_bytes > self.max_bytes:
+                    old_key, old_block = self.blocks.popitem(last=False)
+                    self.n_bytes -= old_block.nbytes
+
+        return block
+
+
+    def get_values(self, source_key, chrom, start, end, read_func):
+        """Returns a new array of the values from start to end on a
+        chromosome. Values that are not cached are read with
+        read_func(chrom, start, end) a block at a time."""
+        if self.max_bytes <= 0:
+            return read_func(chrom, start, end)
+
+        bs = self.block_size
+        pieces = []
+        for b in range((start - 1) // bs, (end - 1) // bs + 1):
+            block_start = b * bs + 1
+            block_end = min(block_start + bs - 1, chrom.length)
+            key = (source_key, chrom.name, b)
+            block = self.get_block(key, chrom, block_start, block_end,
+                                   read_func)
+
+            lo = max(start, block_start) - block_start
+            hi = min(end, block_end) - block_start + 1
+            pieces.append(block[lo:hi])
+
+        # always copy, so that callers can modify the values
+        return np.concatenate(pieces)
+
+
+    def write_stats(self, out=sys.stderr):
+        with self.lock:
+            n_req = self.hits + self.misses
+            if n_req == 0:
+                return
+            out.write("  block cache: %d hits, %d misses (%.1f%% hits), "
+                      "%d blocks, %.1f MB\n" %
+                      (self.hits, self.misses, 100.0 * self.hits / n_req,
+                       len(self.blocks), self.n_bytes / (1024.0 * 1024.0)))
+
+
+
+_cache = BlockCache()
+
+
+
+def configure(max_mb=DEFAULT_CACHE_MB, block_size=DEFAULT_BLOCK_SIZE):
+    """Replaces the shared cache with an empty cache with the provided
+    memory budget and block size"""
+    global _cache
+    _cache = BlockCache(max_mb, block_size)
+
+
+def get_cache():
+    return _cache
+
+
+
+def read_gdb_values(track_name, chrom, start, end):
+    import genome.track
+    track = genome.track.Track(track_name)
+    values = track.get_nparray(chrom, start=start, end=end)
+    track.close()
+    return values
+
+
+def read_wig_values(path, fill, chrom, start, end):
+    from . import wigindex
+    from genome.coord import Coord
+    return wigindex.read_values(path, Coord(chrom, start, end), fill=fill)
+
+
+
+def get_track_values(track_name, region):
+    """Returns the values of a genome database track over a region,
+    through the shared block cache"""
+    read_func = functools.partial(read_gdb_values, track_name)
+    return _cache.get_values(("gdb", track_name), region.chrom,
+                             region.start, region.end, read_func)
+
+
+def get_wig_values(path, region, fill=0.0):
+    """Returns the values of a wig or bedGraph file over a region,
+    through the shared block cache"""
+    read_func = functools.partial(read_wig_values, path, fill)
+    return _cache.get_values(("wig", path, fill), region.chrom,
+                             region.start, region.end, read_func)
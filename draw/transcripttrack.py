@@ -3,7 +3,7 @@ from .track import Track
 
 
 import numpy as np
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 
 class TranscriptTrack(Track):
@@ -178,3 +178,46 @@ class TranscriptTrack(Track):
         if self.do_label:
             self.draw_label(r)
 
+
+
+
+class MetaGeneTrack(TranscriptTrack):
+    """Class for drawing all isoforms of a gene merged into a single
+    glyph (see draw.metagene.MetaGene). Positions that are coding in
+    any isoform are drawn as coding and the remaining exonic positions
+    are drawn as UTRs."""
+
+    def draw_intervals(self, r, starts, ends, top, bottom, color):
+        if starts.size == 0:
+            return
+        # add 1 because drawn coordinates are "between" start and end
+        r.rect(robjects.FloatVector(starts), bottom,
+               robjects.FloatVector(ends + 1), top,
+               col=color, border=self.color)
+
+
+    def draw_track(self, r):
+        mg = self.transcript
+
+        h = self.top - self.bottom
+        mid = (self.top + self.bottom) * 0.5
+        self.draw_intervals(r, mg.utr_starts, mg.utr_ends,
+                            mid + h*0.33, mid - h*0.33, self.utr_color)
+        self.draw_intervals(r, mg.coding_starts, mg.coding_ends,
+                            self.top, self.bottom, self.color)
+
+        intron_starts, intron_ends = mg.get_introns()
+        for start, end in zip(intron_starts.tolist(), intron_ends.tolist()):
+            self.draw_intron(r, Interval(start, end))
+
+        if self.do_label:
+            self.draw_label(r)
+
+
+
+class Interval(object):
+    __slots__ = ('start', 'end')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
@@ -0,0 +1,115 @@
+
+import sys
+import os
+import pickle
+
+
+# indexes are written next to the transcript file with this suffix
+INDEX_SUFFIX = ".tridx.pkl"
+
+# indexes written with a different version are rebuilt
+INDEX_VERSION = 1
+
+
+
+def get_index_path(path):
+    return path + INDEX_SUFFIX
+
+
+
+def get_file_stat(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime)
+
+
+
+def build_index(tr_path, chrom_info_path):
+    """Reads all of the transcripts in a file and returns an index of
+    them keyed by name, which records the size and modification time of
+    the files it was built from"""
+    import genome.chrom
+    import genome.transcript
+
+    chrom_dict = genome.chrom.parse_chromosomes_dict(chrom_info_path)
+    trs = genome.transcript.read_transcripts(tr_path, chrom_dict)
+
+    return {'version' : INDEX_VERSION,
+            'tr_stat' : get_file_stat(tr_path),
+            'chrom_info_path' : os.path.abspath(chrom_info_path),
+            'chrom_info_stat' : get_file_stat(chrom_info_path),
+            'transcripts' : dict((tr.name, tr) for tr in trs)}
+
+
+
+def write_index(index, index_path):
+    # write to temporary file first so that a partially written index
+    # is never read
+    tmp_path = index_path + ".tmp"
+    f = open(tmp_path, "wb")
+    pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.close()
+    os.replace(tmp_path, index_path)
+
+
+
+def read_index(index_path):
+    f = open(index_path, "rb")
+    index = pickle.load(f)
+    f.close()
+    return index
+
+
+
+def is_stale(index, tr_path, chrom_info_path):
+    return (index.get('version') != INDEX_VERSION or
+            index['tr_stat'] != get_file_stat(tr_path) or
+            index['chrom_info_path'] != os.path.abspath(chrom_info_path) or
+            index['chrom_info_stat'] != get_file_stat(chrom_info_path))
+
+
+
+class TranscriptIndex(object):
+    """Provides the transcripts of a transcript file by name. Parsing a
+    large transcript file is slow, so the parsed transcripts are written
+    next to the file the first time it is used, and are read from there
+    until the transcript file or chromosome info file change."""
+
+    def __init__(self, tr_path, chrom_info_path):
+        self.path = tr_path
+        index_path = get_index_path(tr_path)
+
+        index = None
+        if os.path.exists(index_path):
+            try:
+                index = read_index(index_path)
+            except (IOError, OSError, EOFError, pickle.UnpicklingError,
+                    AttributeError, ImportError) as err:
+                sys.stderr.write("WARNING: could not read index %s: %s\n"
+                                 % (index_path, str(err)))
+                index = None
+
+            if index is not None and is_stale(index, tr_path,
+                                              chrom_info_path):
+                sys.stderr.write("index %s is out of date\n" % index_path)
+                index = None
+
+        if index is None:
+            sys.stderr.write("reading transcripts from %s\n" % tr_path)
+            index = build_index(tr_path, chrom_info_path)
+            try:
+                write_index(index, index_path)
+            except (IOError, OSError) as err:
+                sys.stderr.write("WARNING: could not write index %s: %s\n"
+                                 % (index_path, str(err)))
+
+        self.transcripts = index['transcripts']
+
+
+    def get_transcript(self, name):
+        """Returns the transcript with the provided name, or None if
+        there is no such transcript"""
+        return self.transcripts.get(name)
+
+
+    def __len__(self):
+        return len(self.transcripts)
@@ -0,0 +1,441 @@
+
+import sys
+import os
+import struct
+import zlib
+import threading
+
+import numpy as np
+
+
+# maximum number of data lines in each indexed block
+BLOCK_LINES = 10000
+
+# index files are written next to the data file with this suffix
+INDEX_SUFFIX = ".idx.npz"
+
+FMT_BEDGRAPH = 0
+FMT_VARIABLE_STEP = 1
+FMT_FIXED_STEP = 2
+
+# file name extensions that are read with a block index
+WIG_EXTENSIONS = (".wig", ".wig.gz", ".bedgraph", ".bedgraph.gz",
+                  ".bg", ".bg.gz")
+
+
+# open indexes, keyed by path of data file
+_indexes = {}
+
+# locks held while an index is loaded or built, keyed by path of data
+# file, so that threads (e.g. FETCH_WORKERS) build each index once
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+
+class PlainReader(object):
+    """Reads an uncompressed text file. Offsets are byte offsets
+    into the file."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+
+
+    def seek(self, offset):
+        self.f.seek(offset)
+
+
+    def read(self, n_bytes):
+        return self.f.read(n_bytes)
+
+
+    def iter_lines(self):
+        """Yields (offset, line) for each line in the file"""
+        self.f.seek(0)
+        offset = 0
+        for line in self.f:
+            yield offset, line
+            offset += len(line)
+
+
+    def close(self):
+        self.f.close()
+
+
+
+class BgzfReader(object):
+    """Reads a BGZF (bgzip) compressed file. Offsets are 'virtual'
+    offsets: the file offset of a compressed block shifted left 16
+    bits, plus an offset into the uncompressed data of the block."""
+
+    def __init__(self, path):
+        self.f = open(path, "rb")
+        self.block_offset = 0
+        self.next_offset = 0
+        self.data = b""
+        self.pos = 0
+
+
+    def load_block(self, block_offset):
+        """Reads and decompresses the block at the provided file offset.
+        Returns False if there are no more blocks."""
+        self.f.seek(block_offset)
+        header = self.f.read(12)
+        if len(header) < 12:
+            self.data = b""
+            self.pos = 0
+            return False
+
+        if header[:4] != b"\x1f\x8b\x08\x04":
+            raise ValueError("%s is not BGZF compressed: gzipped files "
+                             "must be compressed with bgzip" % self.f.name)
+
+        xlen = struct.unpack("<H", header[10:12])[0]
+        extra = self.f.read(xlen)
+        block_size = None
+        i = 0
+        while i < xlen:
+            si1, si2, slen = struct.unpack("<BBH", extra[i:i+4])
+            if si1 == 66 and si2 == 67:
+                block_size = struct.unpack("<H", extra[i+4:i+6])[0] + 1
+            i += 4 + slen
+
+        if block_size is None:
+            raise ValueError("%s is not BGZF compressed: gzipped files "
+                             "must be compressed with bgzip" % self.f.name)
+
+        cdata = self.f.read(block_size - xlen - 20)
+        self.data = zlib.decompress(cdata, -15)
+        self.block_offset = block_offset
+        self.next_offset = block_offset + block_size
+        self.pos = 0
+        return True
+
+
+    def seek(self, offset):
+        self.load_block(offset >> 16)
+        self.pos = offset & 0xffff
+
+
+    def read(self, n_bytes):
+        parts = []
+        while n_bytes > 0:
+            if self.pos >= len(self.data):
+                if not self.load_block(self.next_offset):
+                    break
+                continue
+            part = self.data[self.pos:self.pos + n_bytes]
+            self.pos += len(part)
+            n_bytes -= len(part)
+            parts.append(part)
+
+        return b"".join(parts)
+
+
+    def iter_lines(self):
+        """Yields (virtual offset, line) for each line in the file"""
+        partial = b""
+        partial_offset = None
+        has_block = self.load_block(0)
+
+        while has_block:
+            data = self.data
+            pos = 0
+            while True:
+                nl = data.find(b"\n", pos)
+                if nl == -1:
+                    break
+                if partial:
+                    yield partial_offset, partial + data[pos:nl+1]
+                    partial = b""
+                else:
+                    yield (self.block_offset << 16) | pos, data[pos:nl+1]
+                pos = nl + 1
+
+            if pos < len(data):
+                # line continues in the next block
+                if not partial:
+                    partial_offset = (self.block_offset << 16) | pos
+                partial += data[pos:]
+
+            has_block = self.load_block(self.next_offset)
+
+        if partial:
+            yield partial_offset, partial
+
+
+    def close(self):
+        self.f.close()
+
+
+
+def open_reader(path):
+    f = open(path, "rb")
+    magic = f.read(2)
+    f.close()
+
+    if magic == b"\x1f\x8b":
+        return BgzfReader(path)
+
+    return PlainReader(path)
+
+
+
+def is_wig_path(path):
+    """Returns True if the path looks like a wig or bedGraph file"""
+    return path.lower().endswith(WIG_EXTENSIONS)
+
+
+
+def parse_header(line):
+    """Parses a variableStep or fixedStep declaration line, returning
+    a tuple of (format, chrom, span, step, start)"""
+    words = line.split()
+    if words[0] == b"variableStep":
+        fmt = FMT_VARIABLE_STEP
+    else:
+        fmt = FMT_FIXED_STEP
+
+    attrs = dict(w.split(b"=", 1) for w in words[1:])
+    chrom = attrs[b"chrom"].decode()
+    span = int(attrs.get(b"span", 1))
+    step = int(attrs.get(b"step", 1))
+    start = int(attrs.get(b"start", 1))
+
+    return (fmt, chrom, span, step, start)
+
+
+
+def parse_block(text, fmt, span=1, step=1, first_pos=1):
+    """Parses the data lines of a block, returning arrays of start
+    and (inclusive) end positions, in 1-based coordinates, and values"""
+    tokens = np.array(text.split())
+
+    if fmt == FMT_BEDGRAPH:
+        cols = tokens.reshape(-1, 4)
+        starts = cols[:,1].astype(np.int64) + 1
+        ends = cols[:,2].astype(np.int64)
+        vals = cols[:,3].astype(np.float64)
+    elif fmt == FMT_VARIABLE_STEP:
+        cols = tokens.reshape(-1, 2)
+        starts = cols[:,0].astype(np.int64)
+        ends = starts + span - 1
+        vals = cols[:,1].astype(np.float64)
+    else:
+        vals = tokens.astype(np.float64)
+        starts = first_pos + step * np.arange(vals.size, dtype=np.int64)
+        ends = starts + span - 1
+
+    return starts, ends, vals
+
+
+
+def get_index_path(path):
+    return path + INDEX_SUFFIX
+
+
+
+def build_index(path):
+    """Reads a wig or bedGraph file and returns a dictionary of arrays
+    describing blocks of up to BLOCK_LINES data lines. Each block
+    records the chromosome, range of positions, offset and length of
+    the data lines, and the declaration that applies to them."""
+    reader = open_reader(path)
+
+    cols = dict((k, []) for k in ("chrom", "start", "end", "offset",
+                                  "n_bytes", "fmt", "span", "step",
+                                  "first_pos"))
+    # current block as [chrom, fmt, span, step, first_pos, offset, lines]
+    block = [None]
+    # current wig declaration and number of lines read since it
+    header = [None, 0]
+
+    def flush():
+        if block[0] is None:
+            return
+        chrom, fmt, span, step, first_pos, offset, lines = block
+        text = b"".join(lines)
+        starts, ends, vals = parse_block(text, fmt, span, step, first_pos)
+        cols['chrom'].append(chrom)
+        cols['start'].append(starts.min())
+        cols['end'].append(ends.max())
+        cols['offset'].append(offset)
+        cols['n_bytes'].append(len(text))
+        cols['fmt'].append(fmt)
+        cols['span'].append(span)
+        cols['step'].append(step)
+        cols['first_pos'].append(first_pos)
+        block[:] = [None]
+
+    for offset, line in reader.iter_lines():
+        stripped = line.strip()
+
+        if (not stripped or stripped.startswith(b"#") or
+            stripped.startswith(b"track") or
+            stripped.startswith(b"browser")):
+            flush()
+            continue
+
+        if (stripped.startswith(b"variableStep") or
+            stripped.startswith(b"fixedStep")):
+            flush()
+            header[:] = [parse_header(stripped), 0]
+            continue
+
+        if header[0] is None:
+            # bedGraph line, blocks are split when chromosome changes
+            chrom = stripped.split(None, 1)[0].decode()
+            if block[0] is not None and (block[0] != chrom or
+                                         len(block[6]) >= BLOCK_LINES):
+                flush()
+            if block[0] is None:
+                block[:] = [chrom, FMT_BEDGRAPH, 1, 1, 1, offset, []]
+        else:
+            fmt, chrom, span, step, start = header[0]
+            if block[0] is not None and len(block[6]) >= BLOCK_LINES:
+                flush()
+            if block[0] is None:
+                first_pos = start + header[1] * step
+                block[:] = [chrom, fmt, span, step, first_pos, offset, []]
+            header[1] += 1
+
+        if not line.endswith(b"\n"):
+            line += b"\n"
+        block[6].append(line)
+
+    flush()
+    reader.close()
+
+    st = os.stat(path)
+    return {'chrom' : np.array(cols['chrom'], dtype=np.str_),
+            'start' : np.array(cols['start'], dtype=np.int64),
+            'end' : np.array(cols['end'], dtype=np.int64),
+            'offset' : np.array(cols['offset'], dtype=np.uint64),
+            'n_bytes' : np.array(cols['n_bytes'], dtype=np.int64),
+            'fmt' : np.array(cols['fmt'], dtype=np.int8),
+            'span' : np.array(cols['span'], dtype=np.int64),
+            'step' : np.array(cols['step'], dtype=np.int64),
+            'first_pos' : np.array(cols['first_pos'], dtype=np.int64),
+            'file_size' : np.array(st.st_size, dtype=np.int64),
+            'file_mtime' : np.array(st.st_mtime)}
+
+
+
+def write_index(index, index_path):
+    # write to temporary file first so that a partially written index
+    # is never read. Other processes may be writing the same index.
+    tmp_path = "%s.%d.tmp.npz" % (index_path, os.getpid())
+    np.savez(tmp_path, **index)
+    os.replace(tmp_path, index_path)
+
+
+
+def is_stale(index, path):
+    st = os.stat(path)
+    return (int(index['file_size']) != st.st_size or
+            float(index['file_mtime']) != st.st_mtime)
+
+
+
+class WigIndex(object):
+    """Provides random access to a wig or bedGraph file (optionally
+    compressed with bgzip) using a block index. The index is written
+    next to the file the first time that it is used (or can be built
+    ahead of time with index_wig.py) and is rebuilt if the file
+    changes."""
+
+    def __init__(self, path):
+        self.path = path
+        index_path = get_index_path(path)
+
+        index = None
+        if os.path.exists(index_path):
+            index = dict(np.load(index_path))
+            if is_stale(index, path):
+                sys.stderr.write("index %s is out of date\n" % index_path)
+                index = None
+
+        if index is None:
+            sys.stderr.write("indexing %s\n" % path)
+            index = build_index(path)
+            try:
+                write_index(index, index_path)
+            except (IOError, OSError) as err:
+                sys.stderr.write("WARNING: could not write index %s: %s\n"
+                                 % (index_path, str(err)))
+
+        self.index = index
+
+
+    def get_blocks(self, chrom_name, start, end):
+        """Returns indices of blocks that overlap the provided
+        region, in file order"""
+        idx = self.index
+        overlap = np.where((idx['chrom'] == chrom_name) &
+                           (idx['start'] <= end) & (idx['end'] >= start))[0]
+        return overlap[np.argsort(idx['offset'][overlap], kind='stable')]
+
+
+    def get_values(self, region, fill=0.0):
+        """Returns an array of values for each position in the region.
+        Positions that are not covered by the file are set to fill."""
+        length = region.end - region.start + 1
+        values = np.empty(length, dtype=np.float32)
+        values[:] = fill
+
+        idx = self.index
+        blocks = self.get_blocks(region.chrom.name, region.start, region.end)
+        if blocks.size == 0:
+            return values
+
+        reader = open_reader(self.path)
+
+        for i in blocks:
+            reader.seek(int(idx['offset'][i]))
+            text = reader.read(int(idx['n_bytes'][i]))
+            starts, ends, vals = parse_block(text, idx['fmt'][i],
+                                             idx['span'][i], idx['step'][i],
+                                             idx['first_pos'][i])
+
+            # clip intervals to region and convert to array offsets
+            s = np.maximum(starts, region.start) - region.start
+            e = np.minimum(ends, region.end) - region.start + 1
+            keep = e > s
+            s, e, vals = s[keep], e[keep], vals[keep]
+            if s.size == 0:
+                continue
+
+            # expand intervals to the positions that they cover
+            lens = e - s
+            first = np.repeat(np.cumsum(lens) - lens, lens)
+            pos = np.repeat(s, lens) + np.arange(first.size) - first
+            values[pos] = np.repeat(vals, lens)
+
+        reader.close()
+
+        return values
+
+
+
+def get_index(path):
+    """Returns the WigIndex for a file, loading (or building) it only
+    once, even when several threads ask for it at the same time"""
+    with _index_locks_lock:
+        if path in _indexes:
+            return _indexes[path]
+        if path not in _index_locks:
+            _index_locks[path] = threading.Lock()
+        lock = _index_locks[path]
+
+    with lock:
+        if path not in _indexes:
+            _indexes[path] = WigIndex(path)
+
+    return _indexes[path]
+
+
+
+def read_values(path, region, fill=0.0):
+    """Returns an array of values from a wig or bedGraph file for each
+    position in the region"""
+    return get_index(path).get_values(region, fill=fill)
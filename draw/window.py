@@ -1,7 +1,7 @@
 
 import numpy as np
 import re
-import rpy2.robjects as robjects
+from .rlib import robjects
 
 
 
@@ -30,7 +30,8 @@ class Window(object):
     
     def __init__(self, region, margin=0.10, draw_grid=True,
                  vert_lines=[], vert_lines_col=[], 
-                 draw_midline=False, cex=1.0):
+                 draw_midline=False, cex=1.0, raster=False, axes=True,
+                 x_label=None, x_offset=0):
         self.region = region
         self.margin = margin
         self.draw_grid = draw_grid
@@ -38,6 +39,11 @@ class Window(object):
         self.vert_lines = vert_lines
         self.vert_lines_col = vert_lines_col
         self.cex = cex
+        self.raster = raster
+        self.axes = axes
+        # x-axis positions are labeled relative to x_offset
+        self.x_label = x_label
+        self.x_offset = x_offset
         self.tracks = []
 
     def add_track(self, track):
@@ -71,7 +77,7 @@ class Window(object):
                    robjects.FloatVector(x_right),
                    bottom,
                    col="grey90",
-                   border=robjects.r("NA"))
+                   border="NA")
     
         
     def draw_axis(self, r):
@@ -88,9 +94,9 @@ class Window(object):
 
         step_size = (10.0 ** n_dec) * 2
         
-        start = np.around(self.region.start, decimals=-n_dec)
-        end = self.region.end + step_size
-        ticks = np.arange(start, end, step_size, dtype=np.uint32)
+        start = np.around(self.region.start - self.x_offset, decimals=-n_dec)
+        end = self.region.end - self.x_offset + step_size
+        ticks = np.arange(start, end, step_size, dtype=np.int64)
 
         label_dec = 6 - n_dig
         if label_dec < 0:
@@ -98,12 +104,31 @@ class Window(object):
 
         labels = [add_commas(x) for x in ticks]
             
-        r.axis(r.c(1), at=robjects.IntVector(ticks),
+        at = [int(x) + self.x_offset for x in ticks]
+        r.axis(r.c(1), at=robjects.IntVector(at),
                labels=labels, **{'cex.axis' : self.cex} )
             
             
 
 
+    def set_raster_sizes(self, r):
+        """Works out how many pixels each track covers on the
+        current (raster) device"""
+        # images span from the start of the first base to the end of
+        # the last base
+        x = r.grconvertX(robjects.FloatVector([self.region.start,
+                                               self.region.end + 1]),
+                         "user", "device")
+        y = r.grconvertY(robjects.FloatVector([0.0, 1.0]),
+                         "user", "device")
+        px_width = abs(x[1] - x[0])
+        px_per_unit = abs(y[1] - y[0])
+
+        for track in self.tracks:
+            track.set_raster_size(int(round(px_width)),
+                                  int(round(track.height * px_per_unit)))
+        
+
     def get_height(self):
         height = 0
         for track in self.tracks:
@@ -134,13 +159,29 @@ class Window(object):
         bottom = cur_y
         ylim = r.c(bottom, top)
 
-        xlab = self.region.chrom.name + " position"
-
-        r.plot(r.c(0), r.c(0), type="n", xlim=xlim, ylim=ylim,
-               yaxt="n", xaxt="n", xlab=xlab, ylab="", bty="n",
-               **{"mar" : r.c(5.1, 0.1, 0.1, 0.1)})
-
-        self.draw_axis(r)
+        if self.axes:
+            if self.x_label is None:
+                xlab = self.region.chrom.name + " position"
+            else:
+                xlab = self.x_label
+
+            r.plot(r.c(0), r.c(0), type="n", xlim=xlim, ylim=ylim,
+                   yaxt="n", xaxt="n", xlab=xlab, ylab="", bty="n",
+                   **{"mar" : r.c(5.1, 0.1, 0.1, 0.1)})
+
+            self.draw_axis(r)
+        else:
+            # region fills the entire device, with no margins or axes
+            # (e.g. for tiles that are placed side by side). Each base
+            # is drawn from its position to the next, so the device
+            # ends where the next tile's first base starts.
+            xlim = r.c(self.region.start, self.region.end + 1)
+            r.par(mar=r.c(0, 0, 0, 0))
+            r.plot(r.c(0), r.c(0), type="n", xlim=xlim, ylim=ylim,
+                   axes=False, xlab="", ylab="", xaxs="i", yaxs="i")
+
+        if self.raster:
+            self.set_raster_sizes(r)
         
         if self.draw_grid:
             self.draw_gridlines(r, top, bottom)
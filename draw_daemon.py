@@ -0,0 +1,507 @@
+#
+# Long-running render server for draw_genes.py. Configuration files,
+# gene models and the R session are loaded once at startup, so that
+# interactive requests for single regions do not pay for them on every
+# plot.
+#
+# Requests are made over HTTP on a local port:
+#
+#   POST /render   body is a JSON object such as
+#                    {"region" : "chr22:37231000-37232000",
+#                     "tracks" : ["DNASE_SMOOTH10", "MNASE_SMOOTH30"],
+#                     "format" : "png"}
+#                  "tracks" and "format" are optional and default to the
+#                  TRACKS and OUTPUT_FORMAT options in the config. "width"
+#                  and "height" can also be given. The rendered file
+#                  is returned as the response body.
+#
+#   GET /tile/<chrom>/<zoom>/<index>.png
+#                  returns a PNG tile of the tracks named by the TRACKS
+#                  option of the [TILES] config section. At zoom level z
+#                  a tile spans BASE_BP * 2^z bases, and tiles are
+#                  numbered from the start of the chromosome. Tiles are
+#                  kept in an LRU cache on disk, and neighbouring tiles
+#                  are rendered in the background after each request.
+#
+#   GET /metrics   returns a JSON object with the job queue depth and
+#                  latencies of each phase of rendering
+#
+# R is not thread-safe, so jobs are rendered one at a time by the main
+# thread. Requests are accepted concurrently and wait in a bounded
+# queue; when the queue is full requests are rejected with status 503.
+# Background tile prefetches are only run when no requests are waiting.
+#
+
+import sys
+import os
+import re
+import json
+import time
+import queue
+import argparse
+import tempfile
+import threading
+import traceback
+
+from configparser import ConfigParser
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+
+import draw_genes
+from draw.rlib import get_grdevices
+from draw.tiles import TileSet, TileCache, DEFAULT_BASE_BP, DEFAULT_TILE_WIDTH
+
+
+CONTENT_TYPES = {"pdf" : "application/pdf",
+                 "png" : "image/png",
+                 "svg" : "image/svg+xml"}
+
+PHASES = ["queue", "tracks", "render", "total"]
+
+# jobs with lower values are run first
+PRIORITY_REQUEST = 0
+PRIORITY_PREFETCH = 1
+
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+
+class RenderError(Exception):
+    """Raised for requests that cannot be rendered"""
+    pass
+
+
+
+class Job(object):
+    """A single render request waiting in the job queue. Tile jobs
+    have a tile key instead of a request."""
+    def __init__(self, request=None, tile_key=None):
+        self.request = request
+        self.tile_key = tile_key
+        self.done = threading.Event()
+        self.result = None
+        self.content_type = None
+        self.error = None
+        self.submit_time = time.time()
+
+
+
+class Metrics(object):
+    """Keeps counts of jobs and latencies of each rendering phase"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.n_done = 0
+        self.n_failed = 0
+        self.n_rejected = 0
+        self.phase_count = dict([(p, 0) for p in PHASES])
+        self.phase_total = dict([(p, 0.0) for p in PHASES])
+        self.phase_max = dict([(p, 0.0) for p in PHASES])
+        self.phase_last = dict([(p, 0.0) for p in PHASES])
+
+
+    def add_phase_time(self, phase, elapsed):
+        with self.lock:
+            self.phase_count[phase] += 1
+            self.phase_total[phase] += elapsed
+            self.phase_last[phase] = elapsed
+            if elapsed > self.phase_max[phase]:
+                self.phase_max[phase] = elapsed
+
+
+    def count(self, attr):
+        with self.lock:
+            setattr(self, attr, getattr(self, attr) + 1)
+
+
+    def get_summary(self, job_queue):
+        with self.lock:
+            phases = {}
+            for p in PHASES:
+                n = self.phase_count[p]
+                if n > 0:
+                    mean = self.phase_total[p] / n
+                else:
+                    mean = 0.0
+                phases[p] = {'count' : n,
+                             'mean_sec' : mean,
+                             'max_sec' : self.phase_max[p],
+                             'last_sec' : self.phase_last[p]}
+
+            return {'queue_depth' : job_queue.qsize(),
+                    'max_queue' : job_queue.maxsize,
+                    'jobs_done' : self.n_done,
+                    'jobs_failed' : self.n_failed,
+                    'jobs_rejected' : self.n_rejected,
+                    'phases' : phases}
+
+
+
+class RenderServer(object):
+    """Holds the state that is kept warm between requests: configuration,
+    chromosomes, gene models and the R session"""
+
+    def __init__(self, config, max_queue):
+        import genome.chrom
+
+        self.config = config
+        self.chrom_dict = \
+          genome.chrom.parse_chromosomes_dict(config.get("MAIN",
+                                                         "CHROM_INFO"))
+        self.gene_types, self.gene_dict = \
+          draw_genes.load_genes(config, self.chrom_dict)
+
+        self.job_queue = queue.PriorityQueue(maxsize=max_queue)
+        self.job_count = 0
+        self.job_lock = threading.Lock()
+        self.metrics = Metrics()
+
+        self.init_tiles(config)
+
+        # start R now, rather than on first request
+        get_grdevices()
+
+
+    def init_tiles(self, config):
+        """Sets up tile rendering from the [TILES] config section"""
+        def get_opt(name, default):
+            if config.has_option("TILES", name):
+                return config.get("TILES", name)
+            return default
+
+        track_names = get_opt("TRACKS", config.get("MAIN", "TRACKS"))
+        track_names = [x for x in track_names.split(",") if x.strip()]
+
+        self.tile_set = TileSet(track_names, config,
+                                base_bp=int(get_opt("BASE_BP",
+                                                    DEFAULT_BASE_BP)),
+                                tile_width=int(get_opt("TILE_WIDTH",
+                                                       DEFAULT_TILE_WIDTH)))
+        self.tile_px_per_unit = float(get_opt("PX_PER_UNIT", 40))
+        self.n_prefetch = int(get_opt("PREFETCH", 2))
+
+        cache_dir = get_opt("CACHE_DIR", os.path.join(tempfile.gettempdir(),
+                                                      "draw_genes_tiles"))
+        cache_mb = float(get_opt("CACHE_MB", 512))
+        self.tile_cache = TileCache(cache_dir, int(cache_mb * 1e6))
+
+
+    def parse_region(self, region_str):
+        """Parses a region string of the form chr:start-end"""
+        import genome.coord
+
+        m = re.match(r"^\s*([^:\s]+):([\d,]+)-([\d,]+)\s*$", region_str)
+        if m is None:
+            raise RenderError("expected region of form chrom:start-end, "
+                              "got '%s'" % region_str)
+
+        chrom_name = m.group(1)
+        if chrom_name not in self.chrom_dict:
+            raise RenderError("unknown chromosome '%s'" % chrom_name)
+
+        start = int(m.group(2).replace(",", ""))
+        end = int(m.group(3).replace(",", ""))
+        if end < start:
+            raise RenderError("region end is before start")
+
+        return genome.coord.Coord(self.chrom_dict[chrom_name], start, end)
+
+
+    def enqueue(self, job, priority):
+        """Adds a job to the queue without waiting for it. Raises
+        queue.Full if the queue is full."""
+        with self.job_lock:
+            # count is used to keep jobs of the same priority in order
+            self.job_count += 1
+            self.job_queue.put((priority, self.job_count, job), block=False)
+
+
+    def submit(self, job):
+        """Adds a job to the queue and waits for it to be
+        rendered. Raises queue.Full if the queue is full."""
+        self.enqueue(job, PRIORITY_REQUEST)
+        job.done.wait()
+        return job
+
+
+    def get_tile(self, chrom_name, zoom, index):
+        """Returns a tile from the cache, rendering it first if
+        necessary, and queues neighbouring tiles to be rendered in
+        the background"""
+        if chrom_name not in self.chrom_dict:
+            raise RenderError("unknown chromosome '%s'" % chrom_name)
+        chrom = self.chrom_dict[chrom_name]
+
+        try:
+            self.tile_set.get_tile_coords(chrom, zoom, index)
+        except ValueError as err:
+            raise RenderError(str(err))
+
+        key = self.tile_set.get_key(chrom_name, zoom, index)
+        data = self.tile_cache.get(key)
+
+        if data is None:
+            job = self.submit(Job(tile_key=key))
+            if job.error:
+                raise RenderError(job.error)
+            data = job.result
+
+        # prefetch neighbouring tiles so that panning is fast
+        for neighbour_key in self.tile_set.get_neighbours(chrom, zoom, index,
+                                                          self.n_prefetch):
+            # leave room in the queue for requests that are waited on
+            if self.job_queue.qsize() >= self.job_queue.maxsize // 2:
+                break
+            if not self.tile_cache.contains(neighbour_key):
+                try:
+                    self.enqueue(Job(tile_key=neighbour_key),
+                                 PRIORITY_PREFETCH)
+                except queue.Full:
+                    break
+
+        return data
+
+
+    def render_tile(self, key):
+        """Renders a single tile, adds it to the cache and returns
+        its contents"""
+        import genome.coord
+
+        data = self.tile_cache.get(key)
+        if data is not None:
+            # already rendered (e.g. by an earlier prefetch)
+            return data
+
+        chrom_name, zoom, index, track_set_hash = key
+        chrom = self.chrom_dict[chrom_name]
+        start, end = self.tile_set.get_tile_coords(chrom, zoom, index)
+        reg = genome.coord.Coord(chrom, start, end)
+
+        tracks = draw_genes.create_tracks(self.config, reg, self.gene_types,
+                                          self.gene_dict,
+                                          track_names=self.tile_set.track_names)
+        for track_name, track in tracks:
+            # labels would be repeated on every tile
+            track.track_label = ""
+        window = draw_genes.create_window(self.config, reg, tracks,
+                                          raster=True, axes=False)
+
+        width = self.tile_set.get_tile_width(zoom, start, end)
+        height = max(int(window.get_height() * self.tile_px_per_unit), 1)
+
+        fd, filename = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        try:
+            draw_genes.draw_window_file(window, filename, "png",
+                                        width, height)
+            f = open(filename, "rb")
+            data = f.read()
+            f.close()
+        finally:
+            os.remove(filename)
+
+        self.tile_cache.put(key, data)
+
+        return data
+
+
+    def render(self, job):
+        """Renders a single job, returning the rendered file contents"""
+        config = self.config
+        request = job.request
+
+        if 'region' not in request:
+            raise RenderError("request does not specify region")
+        reg = self.parse_region(request['region'])
+
+        output_format = request.get('format',
+                                    config.get("MAIN", "OUTPUT_FORMAT"))
+        output_format = output_format.lower()
+        if output_format not in CONTENT_TYPES:
+            raise RenderError("unknown output format %s" % output_format)
+
+        track_names = request.get('tracks', None)
+
+        start = time.time()
+        tracks = draw_genes.create_tracks(config, reg, self.gene_types,
+                                          self.gene_dict,
+                                          track_names=track_names)
+        window = draw_genes.create_window(config, reg, tracks,
+                                          raster=(output_format == "png"))
+        self.metrics.add_phase_time("tracks", time.time() - start)
+
+        if 'width' in request:
+            width = float(request['width'])
+        else:
+            width = config.getfloat("MAIN", "WINDOW_WIDTH")
+
+        if 'height' in request:
+            height = float(request['height'])
+        else:
+            height = draw_genes.get_window_height(config, window)
+
+        start = time.time()
+        fd, filename = tempfile.mkstemp(suffix="." + output_format)
+        os.close(fd)
+        try:
+            draw_genes.draw_window_file(window, filename, output_format,
+                                        width, height)
+            f = open(filename, "rb")
+            data = f.read()
+            f.close()
+        finally:
+            os.remove(filename)
+        self.metrics.add_phase_time("render", time.time() - start)
+
+        return data, CONTENT_TYPES[output_format]
+
+
+    def run_jobs(self):
+        """Renders queued jobs one at a time. This must be run from
+        the main thread because R is not thread-safe."""
+        while True:
+            priority, count, job = self.job_queue.get()
+            self.metrics.add_phase_time("queue",
+                                        time.time() - job.submit_time)
+            try:
+                if job.tile_key:
+                    job.result = self.render_tile(job.tile_key)
+                    job.content_type = CONTENT_TYPES["png"]
+                else:
+                    job.result, job.content_type = self.render(job)
+                self.metrics.count("n_done")
+            except Exception as err:
+                traceback.print_exc()
+                job.error = str(err)
+                self.metrics.count("n_failed")
+
+            self.metrics.add_phase_time("total",
+                                        time.time() - job.submit_time)
+            job.done.set()
+            self.job_queue.task_done()
+
+
+
+def make_handler(server):
+    class RequestHandler(BaseHTTPRequestHandler):
+        def send_data(self, status, data, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+
+        def send_json(self, status, obj):
+            data = json.dumps(obj, indent=2).encode()
+            self.send_data(status, data, "application/json")
+
+
+        def do_GET(self):
+            m = re.match(r"^/tile/([^/]+)/(\d+)/(\d+)\.png$", self.path)
+
+            if self.path.rstrip("/") == "/metrics":
+                summary = server.metrics.get_summary(server.job_queue)
+                summary['tile_cache'] = server.tile_cache.get_stats()
+                self.send_json(200, summary)
+            elif m:
+                try:
+                    data = server.get_tile(m.group(1), int(m.group(2)),
+                                           int(m.group(3)))
+                except queue.Full:
+                    server.metrics.count("n_rejected")
+                    self.send_json(503, {'error' : "job queue is full"})
+                    return
+                except RenderError as err:
+                    self.send_json(400, {'error' : str(err)})
+                    return
+                self.send_data(200, data, CONTENT_TYPES["png"])
+            else:
+                self.send_json(404, {'error' : "unknown path %s" % self.path})
+
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/render":
+                self.send_json(404, {'error' : "unknown path %s" % self.path})
+                return
+
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length).decode())
+            except ValueError as err:
+                self.send_json(400, {'error' : "invalid request: %s" % err})
+                return
+
+            try:
+                job = server.submit(Job(request=request))
+            except queue.Full:
+                server.metrics.count("n_rejected")
+                self.send_json(503, {'error' : "job queue is full"})
+                return
+
+            if job.error:
+                self.send_json(400, {'error' : job.error})
+            else:
+                self.send_data(200, job.result, job.content_type)
+
+
+        def log_message(self, fmt, *args):
+            sys.stderr.write("%s - %s\n" % (self.address_string(),
+                                            fmt % args))
+
+    return RequestHandler
+
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="runs a local server "
+                                     "that renders plots of genomic regions")
+
+    parser.add_argument("--tracks_file", help="path to file containing "
+                        "configuration information for drawing tracks",
+                        default="conf/tracks.conf")
+
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on")
+
+    parser.add_argument("--port", type=int, default=8765,
+                        help="port to listen on")
+
+    parser.add_argument("--max_queue", type=int, default=16,
+                        help="maximum number of jobs waiting to be rendered")
+
+    parser.add_argument("config_file", help="path to file containing "
+                        "all other config information, including which "
+                        "tracks to draw by default")
+
+    return parser.parse_args()
+
+
+
+def main():
+    args = parse_args()
+
+    config = ConfigParser()
+    config.read([args.tracks_file, args.config_file])
+    draw_genes.configure_cache(config)
+
+    server = RenderServer(config, args.max_queue)
+
+    httpd = ThreadingHTTPServer((args.host, args.port), make_handler(server))
+    http_thread = threading.Thread(target=httpd.serve_forever)
+    http_thread.daemon = True
+    http_thread.start()
+
+    sys.stderr.write("listening on http://%s:%d/\n" % (args.host, args.port))
+
+    try:
+        server.run_jobs()
+    except KeyboardInterrupt:
+        sys.stderr.write("shutting down\n")
+        httpd.shutdown()
+
+
+main()
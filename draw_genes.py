@@ -5,62 +5,30 @@
 #    chromosomes specified by tracks??
 #  - why are gene tracks treated differently, and not just added
 #    as another track?
-#  - should instantiate tracks just based on class name from config
-#    should not require import or get_track_types() function
 #
 
 import sys
 
 from configparser import ConfigParser
 
-import numpy as np
-import rpy2.robjects as robjects
-from rpy2.robjects.packages import importr
 import argparse
 import traceback
+import multiprocessing
+from collections import OrderedDict
+
+from draw.rlib import robjects, get_grdevices
+from draw import registry
+from draw import scene
+
+# Other modules (genome, numpy, the track modules and R) are imported
+# when they are first needed, so that --help, configuration errors
+# and runs that only use a few track types start quickly.
 
-import genome.track
-import genome.transcript
-import genome.gene
-import genome.coord
-import genome.chrom
-import genome.gtf
-
-import region
-
-from draw.window import Window
-from draw.genestrack import GenesTrack
-from draw.llrtrack import LLRTrack
-from draw.featuretrack import FeatureTrack
-from draw.readdepthtrack import ReadDepthTrack
-from draw.genotypereaddepthtrack import GenotypeReadDepthTrack
-from draw.statetrack import StateTrack
-from draw.ernststatetrack import ErnstStateTrack
-from draw.segmenttrack import SegmentTrack
-from draw.gccontenttrack import GCContentTrack
-from draw.normreaddepthtrack import NormReadDepthTrack
-from draw.pointstrack import PointsTrack
-
-grdevices = importr('grDevices')
-
-
-def get_track_types():
-    return {"GenesTrack" : GenesTrack,
-            "LLRTrack" : LLRTrack,
-            "FeatureTrack" : FeatureTrack,
-            "ReadDepthTrack" : ReadDepthTrack,
-            "GenotypeReadDepthTrack" : GenotypeReadDepthTrack,
-            "StateTrack" : StateTrack,
-            "ErnstStateTrack" : ErnstStateTrack,
-            "SegmentTrack" : SegmentTrack,
-            "GCContentTrack" : GCContentTrack,
-            "NormReadDepthTrack" : NormReadDepthTrack,
-            "PointsTrack" : PointsTrack}
-
-
-                
 
 def get_genes(config, chrom_dict):
+    import genome.gtf
+    import genome.coord
+
     genes_str = config.get("MAIN", "GENES")
     gene_types = genes_str.split(",")
 
@@ -80,6 +48,30 @@ def get_genes(config, chrom_dict):
 
 
 
+def load_genes(config, chrom_dict):
+    """Returns the list of gene types to draw and a dictionary of genes
+    keyed by gene type label"""
+    gene_types = []
+    if config.getboolean("MAIN", "DRAW_GENES"):
+        genes_str = config.get("MAIN", "GENES")
+        gene_types = genes_str.split(",")
+        gene_dict = get_genes(config, chrom_dict)
+    else:
+        gene_dict = {}
+
+    return gene_types, gene_dict
+
+
+
+def parse_shard_arg(shard_str):
+    from draw.shard import parse_shard
+    try:
+        return parse_shard(shard_str)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+
 def parse_args():
     parser = argparse.ArgumentParser(description="makes plots of genomic regions")
 
@@ -87,46 +79,1003 @@ def parse_args():
                         "configuration information for drawing tracks",
                         default="conf/tracks.conf")
 
+    parser.add_argument("--export", action="store_true", default=False,
+                        help="instead of drawing, write the processed "
+                        "values of each track to a compressed .npz file "
+                        "for each region. R is not used in this mode")
+
+    parser.add_argument("--aggregate", action="store_true", default=False,
+                        help="instead of drawing each region, draw the "
+                        "average of each track across all regions, aligned "
+                        "on their centers (see the AGGREGATE section of "
+                        "the config file)")
+
+    parser.add_argument("--heatmap", action="store_true", default=False,
+                        help="instead of drawing each region, draw one "
+                        "track across all regions as the rows of a single "
+                        "heatmap (see the HEATMAP section of the config "
+                        "file)")
+
+    parser.add_argument("--overview", action="store_true", default=False,
+                        help="instead of drawing regions, draw tracks along "
+                        "whole chromosomes, stacked karyogram-style or "
+                        "along a single chromosome (see the OVERVIEW "
+                        "section of the config file)")
+
+    parser.add_argument("--shared_axes_only", action="store_true",
+                        default=False, help="only find the y-axis ranges of "
+                        "tracks with shared axes, and save them to "
+                        "<prefix>.axes.json for later runs (e.g. before "
+                        "starting the shards of a run)")
+
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes to use when exporting "
+                        "regions")
+
+    parser.add_argument("--shard", default=None, metavar="i/N",
+                        type=parse_shard_arg,
+                        help="only draw (or export) shard i of N, where "
+                        "regions are split between shards 1 to N so that "
+                        "they take about the same time. Plots keep the "
+                        "numbering of an unsharded run, and merge_shards.py "
+                        "combines the outputs of all shards")
+
     parser.add_argument("config_file", help="path to file containing "
                         "all other config information, including which tracks to draw")
 
     return parser.parse_args()
-    
 
 
-def main():
-    args = parse_args()
-        
-    config = ConfigParser()
-    config.read([args.tracks_file, args.config_file])
 
-    r = robjects.r
-    
-    chrom_dict = genome.chrom.parse_chromosomes_dict(config.get("MAIN",
-                                                                "CHROM_INFO"))
-
-    gene_types = []
-    if config.getboolean("MAIN", "DRAW_GENES"):
-        genes_str = config.get("MAIN", "GENES")
-        gene_types = genes_str.split(",")
-        gene_dict = get_genes(config, chrom_dict)
-    else:
-        gene_dict = {}
-    
-    regions = region.get_regions(config, gene_dict, chrom_dict)
-    track_types = get_track_types()
-    
+def get_output_prefix(config):
     output_prefix = config.get("MAIN", "OUTPUT_PREFIX")
     output_dir = config.get("MAIN", "OUTPUT_DIR")
-    single_file = config.getboolean("MAIN", "SINGLE_FILE")
-    width = config.getfloat("MAIN", "WINDOW_WIDTH")
-    output_format = config.get("MAIN", "OUTPUT_FORMAT").lower()
 
     if output_dir:
         if not output_dir.endswith("/"):
             output_dir = output_dir + "/"
         output_prefix = "%s%s" % (output_dir, output_prefix)
 
+    return output_prefix
+
+
+
+def get_regions(config, gene_dict, chrom_dict):
+    """Returns the regions to draw. When REGION_TYPE=BEDFILE and the
+    REGION_BEDFILE section sets LOADER=columnar, regions are read into a
+    columnar RegionTable (see regiontable.py) instead of a list of
+    region objects."""
+    section = "REGION_BEDFILE"
+    if (config.get("MAIN", "REGION_TYPE").upper() == "BEDFILE" and
+        config.has_option(section, "LOADER") and
+        config.get(section, "LOADER").lower() == "columnar"):
+
+        if config.has_option(section, "LINKED_ATTRIBUTES"):
+            sys.stderr.write("WARNING: LINKED_ATTRIBUTES are not supported "
+                             "by the columnar region loader, using the "
+                             "default loader\n")
+        else:
+            import regiontable
+            return regiontable.read_bed_regions(config, chrom_dict)
+
+    import region
+    return region.get_regions(config, gene_dict, chrom_dict)
+
+
+
+def get_vert_lines(config, reg):
+    """Returns lists of positions and colors of vertical lines
+    to be drawn for this region"""
+    
+    # draw some vertical lines on this plot?
+    if config.has_option("MAIN", "DRAW_VERTLINES"):
+        vert_lines = [float(x) for x in config.get("MAIN","DRAW_VERTLINES").split(",")]
+        vert_lines_col = ["black"] * len(vert_lines)
+    else:
+        vert_lines = []
+        vert_lines_col = []
+
+    # region attributes can also be used to specify locations of
+    # vertical lines
+    if config.has_option("MAIN", "VERTLINES_ATTRIBUTES"):
+        attr_names = config.get("MAIN", "VERTLINES_ATTRIBUTES").split(",")
+
+        sys.stderr.write("drawing vertical lines corresponding to "
+                         "region attrs %s\n" %",".join(attr_names))
+
+        for a in attr_names:
+            if hasattr(reg, a):
+                pos = int(getattr(reg, a))
+                vert_lines.append(pos)
+            else:
+                sys.stderr.write("region is missing attribute %s\n" % a)
+
+        # colors can be specified for these lines
+        if config.has_option("MAIN", "VERTLINES_COLORS"):
+            cols = config.get("MAIN", "VERTLINES_COLORS").split(",")
+            vert_lines_col.extend(cols)
+
+    if len(vert_lines_col) < len(vert_lines):
+        # set extra lines to color black
+        diff = len(vert_lines) - len(vert_lines_col)
+        vert_lines_col.extend(["black"] * diff)
+
+    # sys.stderr.write("vert_lines: %s\n" % repr(vert_lines))
+    # sys.stderr.write("vert_lines_col: %s\n" % repr(vert_lines_col))
+
+    return vert_lines, vert_lines_col
+
+
+
+def configure_cache(config):
+    """Sets up the shared block cache that track values are read
+    through, using the BLOCK_CACHE_MB (memory budget, 0 to turn off
+    caching) and BLOCK_CACHE_BLOCK_SIZE options of the MAIN section"""
+    from draw import trackcache
+
+    max_mb = trackcache.DEFAULT_CACHE_MB
+    if config.has_option("MAIN", "BLOCK_CACHE_MB"):
+        max_mb = config.getfloat("MAIN", "BLOCK_CACHE_MB")
+
+    block_size = trackcache.DEFAULT_BLOCK_SIZE
+    if config.has_option("MAIN", "BLOCK_CACHE_BLOCK_SIZE"):
+        block_size = config.getint("MAIN", "BLOCK_CACHE_BLOCK_SIZE")
+
+    trackcache.configure(max_mb, block_size)
+
+
+
+def get_track_specs(config, track_names):
+    """Returns a list of (track_name, track_class, options) tuples
+    for the named tracks, skipping tracks that are not configured
+    correctly"""
+    track_specs = []
+
+    for track_name in track_names:
+        if track_name.strip() == "":
+            continue
+        section_name = "TRACK_" + track_name
+        if not config.has_section(section_name):
+            sys.stderr.write("WARNING: no config section '%s' for "
+                             "track '%s'\n" % (section_name, track_name))
+            continue
+
+        options = dict(config.items(section_name))
+
+        if 'type' not in options:
+            sys.stderr.write("WARNING: track %s does not define "
+                             "TYPE in configuration file\n" % track_name)
+            continue
+
+        track_type = options['type']
+        track_class = registry.get_track_class(track_type)
+
+        if track_class is None:
+            sys.stderr.write("WARNING: don't how to create "
+                             "track %s with type %s.\n"
+                             "         Known types are %s\n"
+                             % (track_name, track_type,
+                                ", ".join(registry.get_track_type_names())))
+            continue
+
+        track_specs.append((track_name, track_class, options))
+
+    return track_specs
+
+
+
+def prepare_tracks(config, regions):
+    """Lets each type of track that is drawn look up data for all of
+    the regions before drawing starts (see Track.prepare_regions)"""
+    track_names = config.get("MAIN", "TRACKS").split(",")
+    for track_name, track_class, options in get_track_specs(config,
+                                                            track_names):
+        if not hasattr(track_class, "prepare_regions"):
+            continue
+        try:
+            track_class.prepare_regions(regions, options)
+        except ValueError as err:
+            # the error is reported again when the track is created
+            sys.stderr.write("WARNING: could not prepare track %s for "
+                             "all regions: %s\n" % (track_name, str(err)))
+
+
+
+def get_axis_groups(config, track_specs):
+    """Returns a dictionary keyed by axis group name of the
+    (track_name, track_class, options) of the tracks whose y-axis is
+    shared across regions. Tracks with the same AXIS_GROUP option share
+    an axis with each other, and a track with SHARED_AXIS=true shares
+    an axis only with itself in other regions."""
+    groups = OrderedDict()
+
+    for track_name, track_class, options in track_specs:
+        if 'axis_group' in options:
+            group_name = options['axis_group'].strip()
+        elif config.getboolean("TRACK_" + track_name, "SHARED_AXIS",
+                               fallback=False):
+            group_name = track_name
+        else:
+            continue
+
+        if not hasattr(track_class, "get_axis_values"):
+            sys.stderr.write("WARNING: track %s of type %s does not "
+                             "have a y-axis to share\n" %
+                             (track_name, options['type']))
+            continue
+
+        groups.setdefault(group_name, []).append((track_name, track_class,
+                                                  options))
+
+    return groups
+
+
+
+def set_shared_axes(config, regions):
+    """Finds a y-axis range for each group of tracks with a shared axis
+    (see get_axis_groups) from their values in all of the regions, and
+    sets it as the MAX_VAL and MIN_VAL of the tracks, unless these are
+    already set. By default the axis spans the full range of values;
+    with AXIS_QUANTILE=q it spans the q and 1-q quantiles instead, so
+    that a few extreme values do not flatten every plot.
+
+    The ranges are saved to <prefix>.axes.json and reused by later
+    runs (such as the other shards of a sharded run) with the same
+    tracks and regions."""
+    from draw import sharedaxis
+
+    track_names = config.get("MAIN", "TRACKS").split(",")
+    groups = get_axis_groups(config, get_track_specs(config, track_names))
+    if not groups:
+        return
+
+    axes_path = "%s.axes.json" % get_output_prefix(config)
+    key = sharedaxis.get_axes_key(groups, regions)
+    axes = sharedaxis.read_axes(axes_path, key)
+
+    if axes is not None:
+        sys.stderr.write("using shared axes from %s\n" % axes_path)
+    else:
+        axes = {}
+        for group_name, track_specs in groups.items():
+            quantile = 1.0
+            for track_name, track_class, options in track_specs:
+                if 'axis_quantile' in options:
+                    quantile = float(options['axis_quantile'])
+
+            sys.stderr.write("finding shared axis for %s over %d "
+                             "regions\n" % (group_name, len(regions)))
+            axes[group_name] = sharedaxis.get_shared_range(track_specs,
+                                                           regions, quantile)
+        sys.stderr.write("writing shared axes to %s\n" % axes_path)
+        sharedaxis.write_axes(axes_path, key, axes)
+
+    for group_name, track_specs in groups.items():
+        min_val, max_val = axes[group_name]
+        sys.stderr.write("  axis range of %s: %g to %g\n" %
+                         (group_name, min_val, max_val))
+
+        for track_name, track_class, options in track_specs:
+            section_name = "TRACK_" + track_name
+            if 'max_val' not in options:
+                config.set(section_name, "MAX_VAL", repr(max_val))
+            if 'min_val' not in options:
+                config.set(section_name, "MIN_VAL", repr(min_val))
+
+
+
+def create_tracks(config, reg, gene_types, gene_dict, track_names=None):
+    """Creates the tracks for a region, returning a list of
+    (track_name, track) tuples in the order they should be drawn.
+    By default the tracks named by the TRACKS option are created."""
+    tracks = []
+
+    # add gene tracks
+    for genes_type in gene_types:
+        gene_label = "GENE_" + genes_type 
+        sys.stderr.write("  adding genes track %s\n" % gene_label)
+        options = dict(config.items(gene_label))
+        track_class = registry.get_track_class(options['type'])
+        genes_track = track_class(gene_dict[gene_label], reg, options)
+        tracks.append((gene_label, genes_track))
+
+    # add other tracks
+    if track_names is None:
+        track_names = config.get("MAIN", "TRACKS").split(",")
+    track_specs = get_track_specs(config, track_names)
+
+    fetch_workers = get_fetch_workers(config, reg, track_specs)
+
+    if fetch_workers > 1:
+        # read the data for all tracks at once in worker threads, and
+        # create each track (in order) once its data has been read
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(fetch_workers) as executor:
+            prefetches = [executor.submit(track_class.prefetch, reg, options)
+                          if hasattr(track_class, "prefetch") else None
+                          for track_name, track_class, options in track_specs]
+            add_tracks(tracks, reg, track_specs, prefetches)
+    else:
+        add_tracks(tracks, reg, track_specs, [None] * len(track_specs))
+
+    return tracks
+
+
+
+def add_tracks(tracks, reg, track_specs, prefetches):
+    """Creates the tracks for a region, after waiting for the data of
+    each to be prefetched (if it is being prefetched), and appends
+    them to tracks as (track_name, track) tuples"""
+    for (track_name, track_class, options), prefetch in \
+            zip(track_specs, prefetches):
+        sys.stderr.write("  adding track %s\n" % track_name)
+        track_type = options['type']
+
+        if prefetch is not None:
+            # errors are reported when the track is created
+            prefetch.exception()
+
+        try:
+            track = track_class(reg, options)
+            tracks.append((track_name, track))
+        except TypeError as err:
+            sys.stderr.write(("-" * 60) + "\n") 
+            sys.stderr.write("WARNING: could not init track %s of "
+                             "type %s:\n%s\n" %
+                             (track_name, track_type, str(err)))
+            traceback.print_exc()
+            sys.stderr.write(("-" * 60) + "\n") 
+        except ValueError as err:
+            sys.stderr.write(("-" * 60) + "\n") 
+            sys.stderr.write("WARNING: could not open track %s of "
+                             "type %s:\n%s\n" %
+                             (track_name, options['type'], str(err)))
+            traceback.print_exc()
+            sys.stderr.write(("-" * 60) + "\n") 
+
+
+
+# warnings about prefetching that have already been written, so that
+# they are only written once per run
+prefetch_warnings = set()
+
+
+def get_fetch_workers(config, reg, track_specs):
+    """Returns the number of threads that the data of the tracks of a
+    region is read with before the tracks are created (FETCH_WORKERS
+    in the MAIN section), or 1 if data should not be prefetched.
+    Prefetched data is kept in the block cache until the track is
+    created, so nothing is prefetched when the cache is turned off."""
+    from draw import trackcache
+    from draw.track import Track
+
+    fetch_workers = 1
+    if config.has_option("MAIN", "FETCH_WORKERS"):
+        fetch_workers = config.getint("MAIN", "FETCH_WORKERS")
+
+    if fetch_workers <= 1 or len(track_specs) <= 1:
+        return 1
+
+    cache = trackcache.get_cache()
+    if cache.max_bytes <= 0:
+        if "no_cache" not in prefetch_warnings:
+            sys.stderr.write("WARNING: not prefetching track data because "
+                             "the block cache is turned off "
+                             "(BLOCK_CACHE_MB=0)\n")
+            prefetch_warnings.add("no_cache")
+        return 1
+
+    # the most that the prefetched blocks of the region take up in the
+    # cache, assuming 8 byte values
+    default_prefetch = Track.prefetch.__func__
+    n_prefetch = 0
+    for track_name, track_class, options in track_specs:
+        prefetch = getattr(track_class, "prefetch", None)
+        if prefetch is not None and \
+           getattr(prefetch, "__func__", None) is not default_prefetch:
+            n_prefetch += 1
+    bs = cache.block_size
+    n_block = (reg.end - 1) // bs - (reg.start - 1) // bs + 1
+    n_bytes = n_prefetch * n_block * bs * 8
+
+    if n_bytes > cache.max_bytes and "small_cache" not in prefetch_warnings:
+        sys.stderr.write("WARNING: the block cache (BLOCK_CACHE_MB=%g) may "
+                         "be too small to hold the prefetched data of all "
+                         "tracks of a region (up to %.0f MB), in which case "
+                         "some data is read twice\n" %
+                         (cache.max_bytes / (1024.0 * 1024.0),
+                          n_bytes / (1024.0 * 1024.0)))
+        prefetch_warnings.add("small_cache")
+
+    return fetch_workers
+
+
+
+def create_window(config, reg, tracks, raster=False, axes=True):
+    """Creates a window for this region and adds tracks to it"""
+    from draw.window import Window
+
+    draw_grid = config.getboolean("MAIN", "DRAW_GRID")
+    if config.has_option("MAIN", "DRAW_MIDLINE"):
+        draw_midline = config.getboolean("MAIN", "DRAW_MIDLINE")
+    else:
+        draw_midline = False
+
+    vert_lines, vert_lines_col = get_vert_lines(config, reg)
+
+    margin = config.getfloat("MAIN", "WINDOW_MARGIN")
+    cex = config.getfloat("MAIN", "CEX")
+    window = Window(reg, draw_grid=draw_grid,
+                    draw_midline=draw_midline,
+                    vert_lines=vert_lines,
+                    vert_lines_col=vert_lines_col,
+                    margin=margin, cex=cex,
+                    raster=raster, axes=axes)
+
+    for track_name, track in tracks:
+        window.add_track(track)
+
+    return window
+
+
+
+# state shared with export worker processes, which are forked
+# after it has been set (see export_regions)
+export_state = {}
+
+
+def export_region(i):
+    """Creates the tracks for a region and writes their processed
+    values to a compressed .npz file. Arrays in the file are named
+    <track_name>/<field>."""
+    import numpy as np
+    from draw import trackcache
+
+    config = export_state['config']
+    reg = export_state['regions'][i]
+    plot_num = i + 1
+
+    sys.stderr.write("EXPORTING REGION %d (%s)\n" % (plot_num, str(reg)))
+
+    tracks = create_tracks(config, reg, export_state['gene_types'],
+                           export_state['gene_dict'])
+
+    data = {'chrom' : np.array(reg.chrom.name),
+            'start' : np.array(reg.start),
+            'end' : np.array(reg.end)}
+
+    for track_name, track in tracks:
+        for key, val in track.get_export_data().items():
+            data["%s/%s" % (track_name, key)] = np.asarray(val)
+
+    filename = "%s%d.npz" % (export_state['output_prefix'], plot_num)
+    np.savez_compressed(filename, **data)
+    trackcache.get_cache().write_stats()
+
+    return filename
+
+
+
+def export_regions(config, regions, gene_types, gene_dict, n_proc=1,
+                   indices=None):
+    """Writes processed track data for each region (or the regions
+    with the provided indices) without drawing"""
+    export_state['config'] = config
+    export_state['regions'] = regions
+    export_state['gene_types'] = gene_types
+    export_state['gene_dict'] = gene_dict
+    export_state['output_prefix'] = get_output_prefix(config)
+
+    if indices is None:
+        indices = range(len(regions))
+
+    prepare_tracks(config, [regions[i] for i in indices])
+
+    if n_proc > 1:
+        # workers must be forked, so that they inherit export_state and
+        # the data read by prepare_tracks (fork is no longer the
+        # default start method everywhere)
+        pool = multiprocessing.get_context("fork").Pool(n_proc)
+        filenames = pool.map(export_region, indices, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        filenames = [export_region(i) for i in indices]
+
+    sys.stderr.write("exported %d regions\n" % len(filenames))
+
+
+
+# default options for aggregate plots, which can be overridden in
+# the AGGREGATE section of the config file
+AGGREGATE_DEFAULTS = {"WIDTH" : "2000",
+                      "STAT" : "mean",
+                      "QUANTILES" : "0.25,0.75",
+                      "MAX_EXACT" : "2000",
+                      "N_BIN" : "512",
+                      "MAX_SPAN" : "1000000"}
+
+
+def get_aggregate_option(config, name):
+    if config.has_option("AGGREGATE", name):
+        return config.get("AGGREGATE", name)
+    return AGGREGATE_DEFAULTS[name]
+
+
+
+def aggregate_track(config, track_name, options, chrom_regions, width):
+    """Accumulates the values of a track across all regions. Returns a
+    ProfileAccumulator, or None if the track cannot be aggregated."""
+    from draw.aggregate import ProfileAccumulator, iter_region_matrices
+
+    track_class = registry.get_track_class(options['type'])
+    if track_class is None:
+        sys.stderr.write("WARNING: unknown type %s for track %s\n" %
+                         (options['type'], track_name))
+        return None
+
+    acc = ProfileAccumulator(width,
+                             max_exact=int(get_aggregate_option(config,
+                                                                "MAX_EXACT")),
+                             n_bin=int(get_aggregate_option(config, "N_BIN")))
+    max_span = int(get_aggregate_option(config, "MAX_SPAN"))
+
+    try:
+        for idx, matrix in iter_region_matrices(track_class, options,
+                                                chrom_regions, width,
+                                                max_span):
+            acc.add(matrix)
+    except ValueError as err:
+        sys.stderr.write("WARNING: cannot aggregate track %s: %s\n" %
+                         (track_name, str(err)))
+        return None
+
+    return acc
+
+
+
+def draw_aggregate(config, regions):
+    """Draws the mean (or median) of each track across all regions,
+    aligned on their centers, with a band between quantiles"""
+    import numpy as np
+    from draw.window import Window
+    from draw.aggregatetrack import AggregateRegion, AggregateTrack
+    from draw.aggregate import get_centered_regions
+
+    width = int(get_aggregate_option(config, "WIDTH"))
+    stat = get_aggregate_option(config, "STAT").lower()
+    if stat not in ("mean", "median"):
+        raise ValueError("unknown aggregate STAT %s, expected mean or "
+                         "median" % stat)
+    quantiles = [float(q) for q in
+                 get_aggregate_option(config, "QUANTILES").split(",")
+                 if q.strip()]
+    if quantiles and len(quantiles) != 2:
+        raise ValueError("aggregate QUANTILES should give a lower and "
+                         "upper quantile")
+
+    chrom_regions = get_centered_regions(regions, width)
+    n_region = sum(x[1].size for x in chrom_regions)
+    sys.stderr.write("AGGREGATING %d REGIONS\n" % n_region)
+
+    agg_region = AggregateRegion(width)
+    output_prefix = get_output_prefix(config)
+    data = {}
+    tracks = []
+
+    for track_name in config.get("MAIN", "TRACKS").split(","):
+        track_name = track_name.strip()
+        section_name = "TRACK_" + track_name
+        if track_name == "" or not config.has_section(section_name):
+            continue
+        sys.stderr.write("  aggregating track %s\n" % track_name)
+
+        options = dict(config.items(section_name))
+        acc = aggregate_track(config, track_name, options, chrom_regions,
+                              width)
+        if acc is None:
+            continue
+
+        if stat == "mean":
+            values = acc.get_mean()
+        else:
+            values = acc.get_median()
+
+        lower = upper = None
+        if quantiles:
+            lower = acc.get_quantile(quantiles[0])
+            upper = acc.get_quantile(quantiles[1])
+
+        # values were already smoothed when tracks were created
+        track_options = dict(options)
+        track_options.pop('smooth', None)
+        track = AggregateTrack(values, agg_region, track_options,
+                               lower=lower, upper=upper)
+        tracks.append(track)
+
+        for key, val in track.get_export_data().items():
+            data["%s/%s" % (track_name, key)] = np.asarray(val)
+        data["%s/n_region" % track_name] = np.array(acc.n_region)
+
+    # write the profiles as well as drawing them
+    np.savez_compressed("%s.aggregate.npz" % output_prefix, **data)
+
+    if config.has_option("MAIN", "DRAW_MIDLINE"):
+        draw_midline = config.getboolean("MAIN", "DRAW_MIDLINE")
+    else:
+        draw_midline = False
+
+    window = Window(agg_region, margin=config.getfloat("MAIN",
+                                                       "WINDOW_MARGIN"),
+                    draw_grid=config.getboolean("MAIN", "DRAW_GRID"),
+                    draw_midline=draw_midline,
+                    cex=config.getfloat("MAIN", "CEX"),
+                    x_label="position relative to region center "
+                    "(%d regions)" % n_region,
+                    x_offset=width // 2 + 1)
+    for track in tracks:
+        window.add_track(track)
+
+    output_format = config.get("MAIN", "OUTPUT_FORMAT").lower()
+    filename = "%s.aggregate.%s" % (output_prefix, output_format)
+    width_in = config.getfloat("MAIN", "WINDOW_WIDTH")
+    height = get_window_height(config, window)
+    sys.stderr.write("writing aggregate plot to '%s'\n" % filename)
+    draw_window_file(window, filename, output_format, width_in, height)
+
+
+
+# default options for heatmaps, which can be overridden in the
+# HEATMAP section of the config file
+HEATMAP_DEFAULTS = {"WIDTH" : "2000",
+                    "SORT" : "signal",
+                    "SORT_DESCENDING" : "true",
+                    "COLUMNS" : "500",
+                    "ROWS" : "2000",
+                    "MAX_SPAN" : "1000000"}
+
+
+def get_heatmap_option(config, name):
+    if config.has_option("HEATMAP", name):
+        return config.get("HEATMAP", name)
+    return HEATMAP_DEFAULTS[name]
+
+
+
+def get_heatmap_sort_keys(sort_key, region_idx, regions, signal):
+    """Returns keys that heatmap rows are sorted by: the total signal
+    of each region, the position of the region in the region list
+    (SORT=none), or the value of a region attribute"""
+    import numpy as np
+
+    if sort_key == "signal":
+        return signal
+    if sort_key == "none":
+        return region_idx
+
+    vals = []
+    for i in region_idx:
+        if not hasattr(regions[i], sort_key):
+            raise ValueError("cannot sort heatmap by %s: region %s does "
+                             "not have a %s attribute" %
+                             (sort_key, str(regions[i]), sort_key))
+        vals.append(getattr(regions[i], sort_key))
+    try:
+        return np.array(vals, dtype=np.float64)
+    except ValueError:
+        # sort non-numeric attributes as strings
+        return np.array([str(v) for v in vals])
+
+
+
+def draw_heatmap(config, regions):
+    """Draws the values of one track across all regions, aligned on
+    their centers, as the rows of a single heatmap image"""
+    import numpy as np
+    from draw.window import Window
+    from draw.aggregate import get_centered_regions, iter_region_matrices, \
+         bin_means
+    from draw.aggregatetrack import AggregateRegion
+    from draw.heatmaptrack import HeatmapTrack
+
+    if config.has_option("HEATMAP", "TRACK"):
+        track_name = config.get("HEATMAP", "TRACK")
+    else:
+        track_name = config.get("MAIN", "TRACKS").split(",")[0]
+    track_name = track_name.strip()
+    options = dict(config.items("TRACK_" + track_name))
+
+    track_class = registry.get_track_class(options['type'])
+    if track_class is None:
+        raise ValueError("unknown type %s for track %s" %
+                         (options['type'], track_name))
+
+    width = int(get_heatmap_option(config, "WIDTH"))
+    n_col = min(int(get_heatmap_option(config, "COLUMNS")), width)
+    max_span = int(get_heatmap_option(config, "MAX_SPAN"))
+    sort_key = get_heatmap_option(config, "SORT")
+    descending = get_heatmap_option(config, "SORT_DESCENDING").lower() in \
+                 ("true", "1", "yes")
+
+    chrom_regions = get_centered_regions(regions, width)
+    n_region = sum(x[1].size for x in chrom_regions)
+    sys.stderr.write("HEATMAP OF %s ACROSS %d REGIONS\n" %
+                     (track_name, n_region))
+    if n_region == 0:
+        sys.stderr.write("WARNING: no regions to draw in heatmap\n")
+        return
+
+    # values of each region binned to pixel columns, in the
+    # (chromosome-sorted) order that they are read
+    binned = np.empty((n_region, n_col), dtype=np.float32)
+    signal = np.empty(n_region, dtype=np.float64)
+    region_idx = np.empty(n_region, dtype=np.int64)
+    row = 0
+    for idx, matrix in iter_region_matrices(track_class, options,
+                                            chrom_regions, width, max_span):
+        n = idx.size
+        binned[row:row+n] = bin_means(matrix, n_col, axis=1)
+        signal[row:row+n] = np.nansum(matrix, axis=1)
+        region_idx[row:row+n] = idx
+        row += n
+
+    keys = get_heatmap_sort_keys(sort_key, region_idx, regions, signal)
+    order = np.argsort(keys, kind='stable')
+    if descending and sort_key != "none":
+        order = order[::-1]
+    binned = binned[order]
+    region_idx = region_idx[order]
+    keys = keys[order]
+
+    output_prefix = get_output_prefix(config)
+    np.savez_compressed("%s.heatmap.npz" % output_prefix,
+                        values=binned, region_index=region_idx, key=keys)
+
+    # reduce rows to the number of pixel rows
+    n_row = min(int(get_heatmap_option(config, "ROWS")), n_region)
+    values = bin_means(binned, n_row, axis=0)
+
+    agg_region = AggregateRegion(width)
+    track = HeatmapTrack(values, agg_region, options)
+
+    window = Window(agg_region, margin=config.getfloat("MAIN",
+                                                       "WINDOW_MARGIN"),
+                    draw_grid=False, cex=config.getfloat("MAIN", "CEX"),
+                    x_label="position relative to region center "
+                    "(%d regions sorted by %s)" % (n_region, sort_key),
+                    x_offset=width // 2 + 1)
+    window.add_track(track)
+
+    output_format = config.get("MAIN", "OUTPUT_FORMAT").lower()
+    filename = "%s.heatmap.%s" % (output_prefix, output_format)
+    width_in = config.getfloat("MAIN", "WINDOW_WIDTH")
+    height = get_window_height(config, window)
+    sys.stderr.write("writing heatmap to '%s'\n" % filename)
+    draw_window_file(window, filename, output_format, width_in, height)
+
+
+
+# default options for overview plots, which can be overridden in
+# the OVERVIEW section of the config file
+OVERVIEW_DEFAULTS = {"CHROMOSOMES" : "",
+                     "N_BIN" : "2000",
+                     "BIN_SIZE" : "0",
+                     "CHUNK_SIZE" : "5000000",
+                     "SUMMARY_DIR" : "",
+                     "ROW_HEIGHT" : "0.3"}
+
+
+def get_overview_option(config, name):
+    if config.has_option("OVERVIEW", name):
+        return config.get("OVERVIEW", name)
+    return OVERVIEW_DEFAULTS[name]
+
+
+
+def get_overview_chroms(config, chrom_dict):
+    """Returns the chromosomes named by the CHROMOSOMES option of the
+    OVERVIEW section, or by default every chromosome without an
+    underscore in its name (i.e. not unplaced or alternate contigs)"""
+    names = [name.strip() for name in
+             get_overview_option(config, "CHROMOSOMES").split(",")
+             if name.strip()]
+    if not names:
+        return [chrom for name, chrom in chrom_dict.items()
+                if "_" not in name]
+
+    for name in names:
+        if name not in chrom_dict:
+            raise ValueError("unknown chromosome %s in OVERVIEW "
+                             "CHROMOSOMES" % name)
+    return [chrom_dict[name] for name in names]
+
+
+
+def draw_overview(config, chrom_dict):
+    """Draws tracks along whole chromosomes. Values are reduced to bins
+    a chunk at a time, so memory use depends on the chunk size and the
+    number of bins rather than on the length of the genome."""
+    from draw import overview
+    from draw import trackcache
+
+    chroms = get_overview_chroms(config, chrom_dict)
+
+    bin_size = int(get_overview_option(config, "BIN_SIZE"))
+    if bin_size <= 0:
+        bin_size = overview.get_bin_size(chroms,
+                                         int(get_overview_option(config,
+                                                                 "N_BIN")))
+    chunk_size = int(get_overview_option(config, "CHUNK_SIZE"))
+    summary_dir = get_overview_option(config, "SUMMARY_DIR").strip()
+
+    sys.stderr.write("OVERVIEW OF %d CHROMOSOMES (%d bp bins)\n" %
+                     (len(chroms), bin_size))
+
+    # each block of the genome is only read once
+    trackcache.configure(max_mb=0)
+
+    track_names = config.get("MAIN", "TRACKS").split(",")
+    if config.has_option("OVERVIEW", "TRACKS"):
+        track_names = config.get("OVERVIEW", "TRACKS").split(",")
+
+    tracks = []
+    for track_name, track_class, options in get_track_specs(config,
+                                                            track_names):
+        if options['type'] not in overview.SUMMARY_KINDS:
+            sys.stderr.write("WARNING: cannot draw track %s of type %s in "
+                             "an overview, types that can be drawn are %s\n"
+                             % (track_name, options['type'],
+                                ", ".join(sorted(overview.SUMMARY_KINDS))))
+            continue
+
+        summaries = {}
+        for chrom in chroms:
+            summaries[chrom.name] = overview.get_summary(track_name,
+                                                         track_class,
+                                                         options, chrom,
+                                                         bin_size,
+                                                         chunk_size,
+                                                         summary_dir)
+        tracks.append(overview.OverviewTrack(track_name, options, bin_size,
+                                             summaries))
+
+    if not tracks:
+        raise ValueError("no tracks to draw in overview")
+
+    output_prefix = get_output_prefix(config)
+    output_format = config.get("MAIN", "OUTPUT_FORMAT").lower()
+    if len(chroms) == 1:
+        filename = "%s.overview.%s.%s" % (output_prefix, chroms[0].name,
+                                          output_format)
+    else:
+        filename = "%s.overview.%s" % (output_prefix, output_format)
+
+    width = config.getfloat("MAIN", "WINDOW_WIDTH")
+    height = config.getfloat("MAIN", "WINDOW_HEIGHT")
+    if height <= 0.0:
+        n_row = len(chroms) * len(tracks)
+        height = max(n_row * float(get_overview_option(config, "ROW_HEIGHT"))
+                     + 1.0, 5.0)
+
+    sys.stderr.write("writing overview to '%s'\n" % filename)
+    r = open_device(output_format, filename, width, height)
+    overview.draw_overview(r, chroms, tracks,
+                           cex=config.getfloat("MAIN", "CEX"))
+    if output_format == "scene":
+        scene.write_scene(filename, [scene.record_page(r)], width, height)
+    close_device()
+
+
+
+def open_device(output_format, filename, width, height):
+    """Opens a graphics device that writes to the specified file,
+    starting R if it has not been started yet. Returns the R
+    instance that should be used for drawing."""
+    grdevices = get_grdevices()
+
+    if output_format == "pdf":
+        grdevices.pdf(file=filename, width=width, height=height)
+    elif output_format == "png":
+        grdevices.png(file=filename, width=width, height=height)
+    elif output_format == "svg":
+        # SVG is written as it is drawn, and has dimensions in inches
+        grdevices.svg(filename=filename, width=width, height=height)
+    elif output_format == "scene":
+        # drawing is recorded and written to the file with write_scene
+        return scene.open_scene_device(width, height)
+    else:
+        raise ValueError("unknown output format %s" % output_format)
+
+    return robjects.r
+
+
+
+def close_device():
+    get_grdevices().dev_off()
+
+
+
+def get_window_height(config, window):
+    """Returns the height of the output file for a single window"""
+    height = config.getfloat("MAIN", "WINDOW_HEIGHT")
+    if height <= 0.0:
+        height = window.get_height() * 0.5
+    if height < 5.0:
+        # make minimum height 5 inches
+        height = 5.0
+    return height
+
+
+
+def draw_window_file(window, filename, output_format, width, height):
+    """Draws a single window to its own output file"""
+    r = open_device(output_format, filename, width, height)
+
+    # the device is closed even if drawing fails, so that a long-running
+    # process (such as draw_daemon.py) does not run out of R devices
+    try:
+        if output_format in ("pdf", "svg", "scene"):
+            # turn off clipping
+            r.par(xpd=True)
+
+        # render window
+        window.draw(r)
+
+        if output_format == "scene":
+            scene.write_scene(filename, [scene.record_page(r)], width,
+                              height)
+    finally:
+        close_device()
+
+
+
+def get_shard_regions(config, regions, gene_types, shard):
+    """Returns the indices of the regions drawn by this run. When
+    shard is an (i, N) tuple, regions are balanced across N shards by
+    their estimated cost and only those of shard i are returned."""
+    if shard is None:
+        return list(range(len(regions)))
+
+    from draw import shard as shardlib
+
+    track_names = [name for name in config.get("MAIN", "TRACKS").split(",")
+                   if name.strip()]
+    costs = shardlib.get_region_costs(regions,
+                                      len(track_names) + len(gene_types))
+    indices = shardlib.get_shard_indices(costs, shard[0], shard[1])
+
+    sys.stderr.write("shard %d/%d: %d of %d regions\n" %
+                     (shard[0], shard[1], len(indices), len(regions)))
+    return indices.tolist()
+
+
+
+def draw_regions(config, regions, gene_types, gene_dict, shard=None):
+    """Draws each region (or each region of a shard, see
+    get_shard_regions) and writes a manifest listing the file (and
+    page) that each region was drawn to. Plots are numbered by their
+    position in the full list of regions, even when sharded."""
+    from draw import trackcache
+    from draw import shard as shardlib
+
+    output_prefix = get_output_prefix(config)
+    single_file = config.getboolean("MAIN", "SINGLE_FILE")
+    width = config.getfloat("MAIN", "WINDOW_WIDTH")
+    output_format = config.get("MAIN", "OUTPUT_FORMAT").lower()
+
+    if shard is None:
+        shard_num = n_shard = None
+    else:
+        shard_num, n_shard = shard
+
+    manifest = {'output_prefix' : output_prefix,
+                'output_format' : output_format,
+                'single_file' : single_file,
+                'shard' : shard_num,
+                'n_shard' : n_shard,
+                'n_region' : len(regions),
+                'regions' : []}
+
     if single_file:
         # get output file parameters
         height = config.getfloat("MAIN", "WINDOW_HEIGHT")
@@ -134,165 +1083,105 @@ def main():
             # make minimum height 5
             height = 5.0
 
-        if output_format == "pdf":
-            filename = "%s.pdf" % output_prefix
-            grdevices.pdf(file=filename, width=width, height=height)
-        elif output_format == "png":
-            filename = "%s.png" % output_prefix
-            grdevices.png(file=filename, width=width, height=height)
-        else:
-            raise ValueError("unknown output format %s" % output_format)
+        filename = shardlib.get_single_file_path(output_prefix, output_format,
+                                                 shard_num, n_shard)
+        r = open_device(output_format, filename, width, height)
+        pages = []
+        manifest['width'] = width
+        manifest['height'] = height
 
         sys.stderr.write("writing output to single file '%s'\n" % filename)
 
-        
-    plot_num = 0
-    for i in range(len(regions)):
+
+    # shared axes are found from all regions, so that every shard
+    # draws the same axes
+    set_shared_axes(config, regions)
+
+    indices = get_shard_regions(config, regions, gene_types, shard)
+    prepare_tracks(config, [regions[i] for i in indices])
+
+    for i in indices:
         reg = regions[i]
-        plot_num += 1
+        plot_num = i + 1
         sys.stderr.write("DRAWING REGION %d (%s)\n" %
                          (plot_num, str(reg)))
 
         # create window for this region
-        draw_grid = config.getboolean("MAIN", "DRAW_GRID")
-        if config.has_option("MAIN", "DRAW_MIDLINE"):
-            draw_midline = config.getboolean("MAIN", "DRAW_MIDLINE")
-        else:
-            draw_midline = False
-
-        # draw some vertical lines on this plot?
-        if config.has_option("MAIN", "DRAW_VERTLINES"):
-            vert_lines = [float(x) for x in config.get("MAIN","DRAW_VERTLINES").split(",")]
-            vert_lines_col = ["black"] * len(vert_lines)
-        else:
-            vert_lines = []
-            vert_lines_col = []
-
-        # region attributes can also be used to specify locations of
-        # vertical lines
-        if config.has_option("MAIN", "VERTLINES_ATTRIBUTES"):
-            attr_names = config.get("MAIN", "VERTLINES_ATTRIBUTES").split(",")
-
-            sys.stderr.write("drawing vertical lines corresponding to "
-                             "region attrs %s\n" %",".join(attr_names))
-            
-            for a in attr_names:
-                if hasattr(reg, a):
-                    pos = int(getattr(reg, a))
-                    vert_lines.append(pos)
-                else:
-                    sys.stderr.write("region is missing attribute %s\n" % a)
-                
-            # colors can be specified for these lines
-            if config.has_option("MAIN", "VERTLINES_COLORS"):
-                cols = config.get("MAIN", "VERTLINES_COLORS").split(",")
-                vert_lines_col.extend(cols)
-
-        if len(vert_lines_col) < len(vert_lines):
-            # set extra lines to color black
-            diff = len(vert_lines) - len(vert_lines_col)
-            vert_lines_col.extend(["black"] * diff)
-
-        # sys.stderr.write("vert_lines: %s\n" % repr(vert_lines))
-        # sys.stderr.write("vert_lines_col: %s\n" % repr(vert_lines_col))
-        margin = config.getfloat("MAIN", "WINDOW_MARGIN")
-        cex = config.getfloat("MAIN", "CEX")
-        window = Window(reg, draw_grid=draw_grid,
-                        draw_midline=draw_midline,
-                        vert_lines=vert_lines,
-                        vert_lines_col=vert_lines_col,
-                        margin=margin, cex=cex)
-
-        # add gene tracks to window
-        for genes_type in gene_types:
-            gene_label = "GENE_" + genes_type 
-            sys.stderr.write("  adding genes track %s\n" % gene_label)
-            options = dict(config.items(gene_label))
-            track_class = track_types[options['type']]
-            genes_track = track_class(gene_dict[gene_label], reg, options)
-            window.add_track(genes_track)
-
-        # add other tracks to window
-        track_names = config.get("MAIN", "TRACKS").split(",")
-        for track_name in track_names:
-            if track_name.strip() == "":
-                continue
-            sys.stderr.write("  adding track %s\n" % track_name)
-            section_name = "TRACK_" + track_name
-            if not config.has_section(section_name):
-                sys.stderr.write("WARNING: no config section '%s' for "
-                                 "track '%s'\n" % (section_name, track_name))
-                continue
-
-            options = dict(config.items(section_name))
-
-            if 'type' not in options:
-                sys.stderr.write("WARNING: track %s does not define "
-                                 "TYPE in configuration file\n" % track_name)
-                continue
-
-            track_type = options['type']
-
-            if track_type not in track_types:
-                sys.stderr.write("WARNING: don't how to create "
-                                 "track %s with type %s.\n"
-                                 "         Known types are %s\n"
-                                 % (track_name, track_type,
-                                    ", ".join(list(track_types.keys()))))
-                continue
-            
-            try:
-                track_class = track_types[track_type]
-                track = track_class(reg, options)
-                window.add_track(track)
-            except TypeError as err:
-                sys.stderr.write(("-" * 60) + "\n") 
-                sys.stderr.write("WARNING: could not init track %s of "
-                                 "type %s:\n%s\n" %
-                                 (track_name, track_type, str(err)))
-                traceback.print_exc()
-                sys.stderr.write(("-" * 60) + "\n") 
-            except ValueError as err:
-                sys.stderr.write(("-" * 60) + "\n") 
-                sys.stderr.write("WARNING: could not open track %s of "
-                                 "type %s:\n%s\n" %
-                                 (track_name, options['type'], str(err)))
-                traceback.print_exc()
-                sys.stderr.write(("-" * 60) + "\n") 
+        tracks = create_tracks(config, reg, gene_types, gene_dict)
+        trackcache.get_cache().write_stats()
+        window = create_window(config, reg, tracks,
+                               raster=(output_format == "png"))
         
         if single_file:
             # each region is a separate page of a single PDF
             window.draw(r)
+            if output_format == "scene":
+                pages.append(scene.record_page(r))
+            page = len(manifest['regions']) + 1
         else:
             # make a separate PDF for each region            
-            # get output file parameters
-            height = config.getfloat("MAIN", "WINDOW_HEIGHT")
-            if height <= 0.0:
-                height = window.get_height() * 0.5
-            if height < 5.0:
-                # make minimum height 5 inches
-                height = 5.0
-
-            if output_format == "pdf":
-                filename = "%s%d.pdf" % (output_prefix, plot_num)
-                grdevices.pdf(file=filename, width=width, height=height)
-                
-                # turn off clipping
-                r.par(xpd=True)
-
-            elif output_format == "png":
-                filename = "%s%d.png" % (output_prefix, plot_num)
-                grdevices.png(file=filename, width=width, height=height)
-            else:
-                raise ValueError("unknown output format %s" % output_format)
-            
-            # render window
-            window.draw(r)
-            grdevices.dev_off()
+            height = get_window_height(config, window)
+            filename = "%s%d.%s" % (output_prefix, plot_num, output_format)
+            draw_window_file(window, filename, output_format, width, height)
+            page = 1
 
+        manifest['regions'].append({'plot_num' : plot_num,
+                                    'region' : str(reg),
+                                    'file' : filename,
+                                    'page' : page})
 
     if single_file:
-        grdevices.dev_off()
+        if output_format == "scene":
+            scene.write_scene(filename, pages, width, height)
+        close_device()
+
+    shardlib.write_manifest(shardlib.get_manifest_path(output_prefix,
+                                                       shard_num, n_shard),
+                            manifest)
+
+
+
+def main():
+    args = parse_args()
+        
+    config = ConfigParser()
+    config.read([args.tracks_file, args.config_file])
+    configure_cache(config)
+
+    import genome.chrom
+
+    chrom_dict = genome.chrom.parse_chromosomes_dict(config.get("MAIN",
+                                                                "CHROM_INFO"))
+
+    if args.overview:
+        if args.shard is not None:
+            raise ValueError("--shard cannot be used with --overview")
+        # overviews do not use genes or regions
+        draw_overview(config, chrom_dict)
+        return
+
+    gene_types, gene_dict = load_genes(config, chrom_dict)
+    
+    regions = get_regions(config, gene_dict, chrom_dict)
+
+    if args.shard is not None and (args.aggregate or args.heatmap):
+        raise ValueError("--shard cannot be used with --aggregate "
+                         "or --heatmap")
+
+    if args.aggregate:
+        draw_aggregate(config, regions)
+    elif args.heatmap:
+        draw_heatmap(config, regions)
+    elif args.shared_axes_only:
+        set_shared_axes(config, regions)
+    elif args.export:
+        indices = get_shard_regions(config, regions, gene_types, args.shard)
+        export_regions(config, regions, gene_types, gene_dict,
+                       n_proc=args.processes, indices=indices)
+    else:
+        draw_regions(config, regions, gene_types, gene_dict,
+                     shard=args.shard)
 
 
-main()
+if __name__ == "__main__":
+    main()
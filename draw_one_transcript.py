@@ -1,75 +1,189 @@
+#
+# Draws diagrams of transcripts, either each to its own file or all to
+# a single multi-page PDF. Transcripts are looked up by name in a
+# transcript file, which is parsed once and then cached next to the
+# file (see draw/trindex.py).
+#
 
 import sys
+import os
+import argparse
+import multiprocessing
 
-from draw.transcripttrack import TranscriptTrack
-from draw.window import Window
+from draw.rlib import robjects, get_grdevices
 
-import genome.db
-import genome.transcript
 
-import rpy2.robjects as robjects
-from rpy2.robjects.packages import importr
+OUTPUT_FORMATS = ("pdf", "png", "svg")
 
+TRACK_OPTIONS = {'color' : "#08306B",
+                 'utr_color' : '#DEEBF7',
+                 'border' : 'false',
+                 'height' : 0.1}
 
 
+# state shared with worker processes, which are forked after it
+# has been set
+draw_state = {}
 
-if len(sys.argv) < 3:
-    sys.stderr.write("usage: %s <transcript_filename> <tr_name1> "
-                     "[<tr_name2> ...]\n" % 
-                     sys.argv[0])
-    exit(2)
 
-tr_path = sys.argv[1]
 
-tr_names = sys.argv[2:]
+def parse_args():
+    parser = argparse.ArgumentParser(description="draws diagrams of "
+                                     "transcripts")
 
+    parser.add_argument("--chrom_info", required=True,
+                        help="path to chromInfo file listing the "
+                        "chromosomes of the assembly")
 
-gdb = genome.db.GenomeDB()
-chrom_dict = gdb.get_chromosome_dict()
+    parser.add_argument("--names_file", default=None,
+                        help="file with the names of transcripts to draw, "
+                        "one per line (in addition to any given on the "
+                        "command line)")
 
-sys.stderr.write("reading transcripts\n")
-trs = genome.transcript.read_transcripts(tr_path, chrom_dict)
-tr_dict = dict([(tr.name, tr) for tr in trs])
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="pdf",
+                        help="output format")
 
-for tr_name in tr_names:
-    if tr_name not in tr_dict:
-        sys.stderr.write("WARNING: could not find transcript %s\n" % tr_name)
-        continue
+    parser.add_argument("--output_dir", default=".",
+                        help="directory to write output files to")
 
-    tr = tr_dict[tr_name]
-    
-    r = robjects.r
+    parser.add_argument("--single_file", default=None, metavar="PDF_PATH",
+                        help="draw every transcript as a page of a single "
+                        "multi-page PDF")
 
-    grdevices = importr('grDevices')
+    parser.add_argument("--processes", type=int, default=1,
+                        help="number of processes to draw transcripts "
+                        "with, each with its own R session (ignored with "
+                        "--single_file)")
 
-    output_format = "pdf"
-    output_filename = "%s.%s" % (tr_name, output_format)
-    width=8
-    height=5
+    parser.add_argument("--width", type=float, default=8.0,
+                        help="output width in inches (pixels / 72 for PNG)")
 
+    parser.add_argument("--height", type=float, default=5.0,
+                        help="output height in inches (pixels / 72 for PNG)")
 
-    sys.stderr.write("drawing transcript (filename=%s)\n" % output_filename)
+    parser.add_argument("transcript_file",
+                        help="path to file containing transcripts")
 
-    grdevices.pdf(file=output_filename, width=width, height=height)
+    parser.add_argument("tr_names", nargs="*",
+                        help="names of transcripts to draw")
 
-    region = tr
-    options = {'color' : "#08306B",
-               'utr_color' : '#DEEBF7', 
-               'border' : 'false',
-               'height' : 0.1}
+    return parser.parse_args()
 
-    window = Window(region, draw_grid=False)
 
-    tr_track = TranscriptTrack(tr, region, options)
-    window.add_track(tr_track)
 
+def read_names(args):
+    names = list(args.tr_names)
+
+    if args.names_file:
+        f = open(args.names_file)
+        for line in f:
+            name = line.strip()
+            if name and not name.startswith("#"):
+                names.append(name)
+        f.close()
+
+    return names
+
+
+
+def open_device(output_format, filename, width, height):
+    grdevices = get_grdevices()
+
+    if output_format == "pdf":
+        grdevices.pdf(file=filename, width=width, height=height)
+    elif output_format == "png":
+        grdevices.png(file=filename, width=int(round(width * 72)),
+                      height=int(round(height * 72)))
+    elif output_format == "svg":
+        grdevices.svg(filename=filename, width=width, height=height)
+    else:
+        raise ValueError("unknown output format %s" % output_format)
+
+    return robjects.r
+
+
+
+def draw_transcript(r, tr):
+    from draw.transcripttrack import TranscriptTrack
+    from draw.window import Window
+
+    region = tr
+    window = Window(region, draw_grid=False)
+    tr_track = TranscriptTrack(tr, region, dict(TRACK_OPTIONS))
+    window.add_track(tr_track)
     window.draw(r)
 
-    # top = 0
-    # bottom = -1
-    # tr_track.set_position(tr.start, tr.end, top, bottom)
 
-    # tr_track.draw_track(r)
 
-    grdevices.dev_off()
+def draw_transcript_file(tr):
+    """Draws a transcript to its own file, returning the filename"""
+    args = draw_state['args']
+    filename = os.path.join(args.output_dir,
+                            "%s.%s" % (tr.name, args.format))
+
+    sys.stderr.write("drawing transcript (filename=%s)\n" % filename)
+
+    r = open_device(args.format, filename, args.width, args.height)
+    try:
+        draw_transcript(r, tr)
+    finally:
+        get_grdevices().dev_off()
+
+    return filename
+
+
+
+def main():
+    args = parse_args()
+
+    from draw.trindex import TranscriptIndex
+
+    names = read_names(args)
+    if len(names) == 0:
+        sys.stderr.write("no transcript names given\n")
+        exit(2)
+
+    tr_index = TranscriptIndex(args.transcript_file, args.chrom_info)
+
+    trs = []
+    for tr_name in names:
+        tr = tr_index.get_transcript(tr_name)
+        if tr is None:
+            sys.stderr.write("WARNING: could not find transcript %s\n" %
+                             tr_name)
+        else:
+            trs.append(tr)
+
+    if args.single_file:
+        if args.format != "pdf":
+            raise ValueError("--single_file can only be used with "
+                             "pdf output")
+
+        sys.stderr.write("drawing %d transcripts to '%s'\n" %
+                         (len(trs), args.single_file))
+        r = open_device("pdf", args.single_file, args.width, args.height)
+        try:
+            for tr in trs:
+                draw_transcript(r, tr)
+        finally:
+            get_grdevices().dev_off()
+        return
+
+    draw_state['args'] = args
+
+    if args.processes > 1:
+        # R is not started until the first transcript is drawn, so
+        # each worker process starts its own R session. Workers must be
+        # forked so that they inherit draw_state.
+        pool = multiprocessing.get_context("fork").Pool(args.processes)
+        filenames = pool.map(draw_transcript_file, trs, chunksize=16)
+        pool.close()
+        pool.join()
+    else:
+        filenames = [draw_transcript_file(tr) for tr in trs]
+
+    sys.stderr.write("drew %d transcripts\n" % len(filenames))
+
 
+if __name__ == "__main__":
+    main()
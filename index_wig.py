@@ -0,0 +1,42 @@
+#
+# Builds block indexes for wig or bedGraph files (optionally compressed
+# with bgzip) so that tracks with SOURCE=wig or SOURCE=bedgraph can read
+# regions without scanning the whole file. Each index is written next to
+# its file with the suffix .idx.npz. Indexes are also built automatically
+# the first time a file is drawn, but building them ahead of time avoids
+# doing this in every process of a parallel run.
+#
+
+import sys
+import argparse
+
+from draw import wigindex
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="builds block indexes "
+                                     "for wig or bedGraph files")
+
+    parser.add_argument("--block_lines", type=int,
+                        default=wigindex.BLOCK_LINES,
+                        help="maximum number of data lines in each "
+                        "indexed block")
+
+    parser.add_argument("paths", nargs="+", help="paths to wig or "
+                        "bedGraph files")
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    wigindex.BLOCK_LINES = args.block_lines
+
+    for path in args.paths:
+        sys.stderr.write("%s\n" % path)
+        index = wigindex.build_index(path)
+        wigindex.write_index(index, wigindex.get_index_path(path))
+        sys.stderr.write("  %d blocks\n" % index['start'].size)
+
+
+main()
@@ -0,0 +1,75 @@
+#
+# Builds a GC index that can be used by GCContentTrack (with the GC_INDEX
+# option) to compute GC content over any window without fetching
+# sequence. For each chromosome the index contains an array of length
+# chrom_len+1 where element i is the number of G or C bases at
+# positions 1..i, so the GC count over positions a..b is
+# index[b] - index[a-1].
+#
+
+import sys
+import argparse
+
+import numpy as np
+import tables
+
+import genome.chrom
+import genome.track
+
+
+# number of bases of sequence read at a time
+CHUNK_SIZE = 10000000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="builds a cumulative "
+                                     "G+C count index for each chromosome")
+
+    parser.add_argument("--seq_track", default="seq",
+                        help="name of track containing genome sequence")
+
+    parser.add_argument("chrom_info", help="path to chromInfo file "
+                        "listing chromosomes")
+
+    parser.add_argument("output_path", help="path to HDF5 file to write "
+                        "index to")
+
+    return parser.parse_args()
+
+
+def write_chrom_index(h5f, seq_track, chrom):
+    sys.stderr.write("%s\n" % chrom.name)
+
+    filters = tables.Filters(complevel=1, complib="zlib", shuffle=True)
+    carray = h5f.createCArray(h5f.root, chrom.name, tables.UInt32Atom(),
+                              shape=(chrom.length + 1,), filters=filters)
+    carray[0] = 0
+
+    total = 0
+    for start in range(1, chrom.length + 1, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE - 1, chrom.length)
+        seq = seq_track.get_nparray(chrom, start=start, end=end)
+        # count G and C in the same way as GCContentTrack
+        is_gc = (seq == ord("G")) | (seq == ord("C"))
+
+        cum = np.cumsum(is_gc, dtype=np.uint32) + total
+        carray[start:end+1] = cum
+        total = int(cum[-1])
+
+
+def main():
+    args = parse_args()
+
+    chrom_dict = genome.chrom.parse_chromosomes_dict(args.chrom_info)
+    seq_track = genome.track.Track(args.seq_track)
+
+    h5f = tables.openFile(args.output_path, "w")
+
+    for chrom in sorted(chrom_dict.values(), key=lambda c: c.name):
+        write_chrom_index(h5f, seq_track, chrom)
+
+    h5f.close()
+    seq_track.close()
+
+
+main()
@@ -0,0 +1,154 @@
+#
+# Combines the outputs of a run of draw_genes.py that was split into
+# shards with --shard i/N. Each shard writes a manifest listing the
+# file and page that each of its regions was drawn to. This script
+# checks that every shard is present, and writes the manifest (and,
+# with SINGLE_FILE=true, the multi-page PDF or scene file) that a
+# single unsharded run would have produced. Plots drawn to separate
+# files are already numbered as they would be by an unsharded run.
+#
+# PDFs are merged with qpdf, which must be on the PATH.
+#
+
+import sys
+import argparse
+import subprocess
+
+from draw import shard as shardlib
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="merges the outputs "
+                                     "of a sharded draw_genes.py run")
+
+    parser.add_argument("--qpdf", default="qpdf",
+                        help="path to the qpdf program")
+
+    parser.add_argument("manifests", nargs="+", help="paths to the "
+                        "manifests written by each shard "
+                        "(<prefix>.shard<i>of<N>.manifest.json)")
+
+    return parser.parse_args()
+
+
+
+def read_shard_manifests(paths):
+    """Reads the manifests of all shards of a run, checking that they
+    belong to the same run and that no shard is missing"""
+    manifests = [shardlib.read_manifest(path) for path in paths]
+
+    first = manifests[0]
+    n_shard = first['n_shard']
+    if n_shard is None:
+        raise ValueError("%s is not the manifest of a shard" % paths[0])
+
+    for path, manifest in zip(paths, manifests):
+        for key in ('output_prefix', 'output_format', 'single_file',
+                    'n_shard', 'n_region'):
+            if manifest[key] != first[key]:
+                raise ValueError("%s has a different %s than %s" %
+                                 (path, key, paths[0]))
+
+    shards = sorted(manifest['shard'] for manifest in manifests)
+    if shards != list(range(1, n_shard + 1)):
+        missing = set(range(1, n_shard + 1)) - set(shards)
+        raise ValueError("expected one manifest for each of %d shards; "
+                         "missing shards: %s" %
+                         (n_shard, ", ".join(str(s) for s in
+                                             sorted(missing)) or "none"))
+
+    return manifests
+
+
+
+def get_page_ranges(entries):
+    """Returns qpdf --pages arguments that select the page of each
+    entry, joining consecutive pages of the same file into ranges"""
+    runs = []
+    for entry in entries:
+        if runs and runs[-1][0] == entry['file'] and \
+           runs[-1][2] + 1 == entry['page']:
+            runs[-1][2] = entry['page']
+        else:
+            runs.append([entry['file'], entry['page'], entry['page']])
+
+    args = []
+    for filename, first, last in runs:
+        args.append(filename)
+        if first == last:
+            args.append(str(first))
+        else:
+            args.append("%d-%d" % (first, last))
+    return args
+
+
+
+def merge_pdfs(qpdf, entries, out_path):
+    cmd = [qpdf, "--empty", "--pages"] + get_page_ranges(entries) + \
+          ["--", out_path]
+    subprocess.check_call(cmd)
+
+
+
+def merge_scenes(entries, out_path):
+    from draw import scene
+
+    scenes = {}
+    width = height = None
+    pages = []
+    for entry in entries:
+        if entry['file'] not in scenes:
+            scenes[entry['file']] = scene.read_scene(entry['file'])
+        scene_width, scene_height, scene_pages = scenes[entry['file']]
+        if width is None:
+            width, height = scene_width, scene_height
+        pages.append(scene_pages[entry['page'] - 1])
+
+    scene.write_scene(out_path, pages, width, height)
+
+
+
+def main():
+    args = parse_args()
+
+    manifests = read_shard_manifests(args.manifests)
+    first = manifests[0]
+
+    entries = []
+    for manifest in manifests:
+        entries.extend(manifest['regions'])
+    entries.sort(key=lambda entry: entry['plot_num'])
+
+    if len(entries) != first['n_region']:
+        raise ValueError("shards drew %d regions, expected %d" %
+                         (len(entries), first['n_region']))
+
+    merged = dict(first)
+    merged['shard'] = None
+    merged['n_shard'] = None
+    merged['regions'] = [dict(entry) for entry in entries]
+
+    if first['single_file']:
+        output_format = first['output_format']
+        out_path = shardlib.get_single_file_path(first['output_prefix'],
+                                                 output_format)
+        sys.stderr.write("writing %d pages to '%s'\n" %
+                         (len(entries), out_path))
+
+        if output_format == "pdf":
+            merge_pdfs(args.qpdf, entries, out_path)
+        elif output_format == "scene":
+            merge_scenes(entries, out_path)
+        else:
+            raise ValueError("cannot merge single %s files" % output_format)
+
+        for page, entry in enumerate(merged['regions']):
+            entry['file'] = out_path
+            entry['page'] = page + 1
+
+    manifest_path = shardlib.get_manifest_path(first['output_prefix'])
+    sys.stderr.write("writing manifest '%s'\n" % manifest_path)
+    shardlib.write_manifest(manifest_path, merged)
+
+
+main()
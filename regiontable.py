@@ -0,0 +1,226 @@
+#
+# Columnar loader for regions read from BED files. Regions are parsed
+# into a numpy structured array and Coord objects are only created
+# when a region is accessed, so that large region files can be loaded,
+# flanked and subsetted quickly and without much memory.
+#
+
+import sys
+
+import numpy as np
+
+import genome.coord
+
+
+STRANDS = {b"+" : 1, b"-" : -1}
+
+
+
+class TableRegion(genome.coord.Coord):
+    """A region from a RegionTable. Additional BED columns are available
+    as attributes (e.g. reg.snp_pos), which are read from the table
+    when they are first accessed."""
+
+    def __init__(self, table, i, chrom, start, end, strand):
+        genome.coord.Coord.__init__(self, chrom, start, end, strand=strand)
+        self._table = table
+        self._i = i
+
+
+    def __getattr__(self, name):
+        # only called for attributes that have not been set, so region
+        # attributes are read from the table the first time they are used
+        table = self.__dict__.get("_table")
+        if table is None or name not in table.attr_names:
+            raise AttributeError(name)
+
+        val = self._table.attrs[name][self._i].decode()
+        setattr(self, name, val)
+        return val
+
+
+
+class RegionTable(object):
+    """A sequence of regions stored as columns of a numpy structured
+    array with fields chrom, start, end and strand. Additional
+    attribute columns are stored as separate arrays of strings."""
+
+    def __init__(self, rows, attrs, chrom_dict):
+        self.rows = rows
+        self.attrs = attrs
+        self.attr_names = list(attrs.keys())
+        self.chrom_dict = chrom_dict
+
+
+    def __len__(self):
+        return self.rows.size
+
+
+    def __getitem__(self, i):
+        row = self.rows[i]
+        return TableRegion(self, i, self.chrom_dict[row['chrom']],
+                           int(row['start']), int(row['end']),
+                           int(row['strand']))
+
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+    def subset(self, keep):
+        """Returns a new table containing the rows selected by a boolean
+        mask or array of indices"""
+        attrs = dict((name, vals[keep]) for name, vals in self.attrs.items())
+        return RegionTable(self.rows[keep], attrs, self.chrom_dict)
+
+
+    def flank(self, min_size):
+        """Expands regions that are smaller than min_size about their
+        midpoints. Regions near chromosome ends are shifted so that
+        they do not extend past them."""
+        start = self.rows['start']
+        end = self.rows['end']
+        small = (end - start + 1) < min_size
+        if not np.any(small):
+            return
+
+        chrom_len = np.array([self.chrom_dict[c].length
+                              for c in self.rows['chrom'][small]],
+                             dtype=np.int64)
+
+        mid = (start[small] + end[small]) // 2
+        new_start = np.minimum(mid - min_size // 2, chrom_len - min_size + 1)
+        new_start = np.maximum(new_start, 1)
+        new_end = np.minimum(new_start + min_size - 1, chrom_len)
+
+        start[small] = new_start
+        end[small] = new_end
+
+
+    def random_subset(self, n, seed):
+        """Returns a table with a random sample of n regions, kept in
+        their original order"""
+        if n >= len(self):
+            return self
+
+        rng = np.random.default_rng(seed)
+        idx = np.sort(rng.choice(len(self), size=n, replace=False))
+        return self.subset(idx)
+
+
+
+def get_row_dtype(chrom_len):
+    return [('chrom', 'U%d' % max(chrom_len, 1)), ('start', np.int64),
+            ('end', np.int64), ('strand', np.int8)]
+
+
+
+def read_lines(path, has_header):
+    """Reads data lines from a BED file, returning a list of lines and
+    the header line (or None)"""
+    f = open(path, "rb")
+    lines = f.read().split(b"\n")
+    f.close()
+
+    # remove trailing whitespace, comments and track lines
+    lines = [l.rstrip(b"\r") for l in lines if l.strip() and
+             not l.startswith(b"#") and not l.startswith(b"track") and
+             not l.startswith(b"browser")]
+
+    header = None
+    if has_header and lines:
+        header = lines[0]
+        lines = lines[1:]
+
+    return lines, header
+
+
+
+def parse_table(lines, header, attr_names, chrom_dict):
+    """Parses the columns of tab-delimited BED lines. BED start
+    coordinates are 0-based and are converted to 1-based."""
+    n_col = lines[0].count(b"\t") + 1
+    if n_col < 3:
+        raise ValueError("expected at least 3 columns in BED file")
+
+    tokens = np.array(b"\t".join(lines).split(b"\t"))
+    if tokens.size != n_col * len(lines):
+        raise ValueError("lines of BED file do not all have %d columns" %
+                         n_col)
+    cols = tokens.reshape(len(lines), n_col)
+
+    # names of additional columns are given by REGION_ATTRIBUTES,
+    # by the header, or are col4, col5, etc.
+    if attr_names is None:
+        if header is not None:
+            attr_names = [h.decode() for h in header.split(b"\t")[3:]]
+        else:
+            attr_names = ["col%d" % (i+1) for i in range(3, n_col)]
+    attr_names = attr_names[:n_col-3]
+
+    rows = np.empty(len(lines), dtype=get_row_dtype(cols[:,0].itemsize))
+    rows['chrom'] = cols[:,0].astype(np.str_)
+    rows['start'] = cols[:,1].astype(np.int64) + 1
+    rows['end'] = cols[:,2].astype(np.int64)
+    rows['strand'] = 0
+
+    attrs = {}
+    for i, name in enumerate(attr_names):
+        if name == 'strand':
+            for s, val in STRANDS.items():
+                rows['strand'][cols[:,i+3] == s] = val
+        else:
+            # copy so that the full token array can be freed
+            attrs[name] = cols[:,i+3].copy()
+
+    return RegionTable(rows, attrs, chrom_dict)
+
+
+
+def read_bed_regions(config, chrom_dict):
+    """Reads regions from the BED file given by the [REGION_BEDFILE]
+    section of the config, flanking them to MIN_REGION_SIZE and
+    sampling RANDOM_SUBSET of them (if non-zero) using SEED"""
+    section = "REGION_BEDFILE"
+    path = config.get(section, "PATH")
+
+    has_header = config.has_option(section, "HAS_HEADER") and \
+                 config.get(section, "HAS_HEADER").lower() in ("true", "1",
+                                                               "yes")
+
+    if config.has_option(section, "REGION_ATTRIBUTES"):
+        attr_names = config.get(section, "REGION_ATTRIBUTES").split(",")
+    else:
+        attr_names = None
+
+    lines, header = read_lines(path, has_header)
+    if not lines:
+        sys.stderr.write("WARNING: no regions in %s\n" % path)
+        return RegionTable(np.empty(0, dtype=get_row_dtype(1)), {},
+                           chrom_dict)
+
+    table = parse_table(lines, header, attr_names, chrom_dict)
+
+    # drop regions on chromosomes that are not in the chromosome list
+    known = np.isin(table.rows['chrom'], list(chrom_dict.keys()))
+    if not np.all(known):
+        sys.stderr.write("WARNING: skipping %d regions on unknown "
+                         "chromosomes\n" % np.sum(~known))
+        table = table.subset(known)
+
+    if config.has_option(section, "MIN_REGION_SIZE"):
+        table.flank(config.getint(section, "MIN_REGION_SIZE"))
+
+    if config.has_option(section, "RANDOM_SUBSET"):
+        n_subset = config.getint(section, "RANDOM_SUBSET")
+        if n_subset > 0:
+            if config.has_option(section, "SEED"):
+                seed = config.getint(section, "SEED")
+            else:
+                seed = None
+            table = table.random_subset(n_subset, seed)
+
+    sys.stderr.write("read %d regions from %s\n" % (len(table), path))
+
+    return table
@@ -0,0 +1,134 @@
+#
+# Renders scene files written by draw_genes.py (with OUTPUT_FORMAT=scene)
+# to PDF, PNG or SVG. Scene files contain every drawing primitive of
+# each plot, so they can be rendered again in other formats or sizes
+# without reading any genome data. They cannot be re-styled, and can
+# only be rendered by the version of R that recorded them.
+#
+
+import sys
+import os
+import argparse
+
+from draw.rlib import get_grdevices
+from draw import scene
+
+
+OUTPUT_FORMATS = ("pdf", "png", "svg")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="renders scene files "
+                                     "written by draw_genes.py")
+
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="pdf",
+                        help="output format")
+
+    parser.add_argument("--output_dir", default=None,
+                        help="directory to write output files to (by "
+                        "default they are written next to each scene file)")
+
+    parser.add_argument("--single_file", default=None, metavar="PDF_PATH",
+                        help="write every page of every scene file to "
+                        "a single multi-page PDF")
+
+    parser.add_argument("--width", type=float, default=None,
+                        help="output width in inches (by default the "
+                        "width the scene was drawn with)")
+
+    parser.add_argument("--height", type=float, default=None,
+                        help="output height in inches (by default the "
+                        "height the scene was drawn with)")
+
+    parser.add_argument("--res", type=int, default=100,
+                        help="resolution of PNG output in pixels per inch")
+
+    parser.add_argument("--allow_other_r_version", action="store_true",
+                        default=False, help="render scenes recorded by a "
+                        "different version of R (with a warning) instead "
+                        "of refusing to. R does not support replaying "
+                        "recorded plots across versions, so the output "
+                        "may be wrong")
+
+    parser.add_argument("scene_files", nargs="+",
+                        help="paths to scene files")
+
+    return parser.parse_args()
+
+
+
+def get_output_path(args, scene_path, page_num, n_page):
+    base = os.path.basename(scene_path)
+    if base.endswith(".scene"):
+        base = base[:-len(".scene")]
+
+    if n_page > 1 and args.format != "pdf":
+        # each page of a multi-page scene goes to its own file
+        base = "%s_%d" % (base, page_num)
+
+    out_dir = args.output_dir
+    if out_dir is None:
+        out_dir = os.path.dirname(scene_path)
+
+    return os.path.join(out_dir, "%s.%s" % (base, args.format))
+
+
+
+def open_device(output_format, filename, width, height, res):
+    grdevices = get_grdevices()
+
+    if output_format == "pdf":
+        grdevices.pdf(file=filename, width=width, height=height)
+    elif output_format == "png":
+        grdevices.png(file=filename, width=int(round(width * res)),
+                      height=int(round(height * res)), res=res)
+    elif output_format == "svg":
+        grdevices.svg(filename=filename, width=width, height=height)
+    else:
+        raise ValueError("unknown output format %s" % output_format)
+
+
+
+def render_pages(args, filename, pages, width, height):
+    sys.stderr.write("writing %d pages to '%s'\n" % (len(pages), filename))
+    open_device(args.format, filename, width, height, args.res)
+    for page in pages:
+        scene.replay_page(page)
+    get_grdevices().dev_off()
+
+
+
+def main():
+    args = parse_args()
+
+    if args.single_file:
+        args.format = "pdf"
+
+    all_pages = []
+    width = height = None
+
+    for path in args.scene_files:
+        scene_width, scene_height, pages = \
+            scene.read_scene(path, allow_other_r=args.allow_other_r_version)
+        scene_width = args.width or scene_width
+        scene_height = args.height or scene_height
+
+        if args.single_file:
+            # page size is taken from the first scene
+            if width is None:
+                width, height = scene_width, scene_height
+            all_pages.extend(pages)
+        elif args.format == "pdf":
+            render_pages(args, get_output_path(args, path, 1, len(pages)),
+                         pages, scene_width, scene_height)
+        else:
+            for i in range(len(pages)):
+                filename = get_output_path(args, path, i+1, len(pages))
+                render_pages(args, filename, [pages[i]], scene_width,
+                             scene_height)
+
+    if args.single_file:
+        render_pages(args, args.single_file, all_pages, width, height)
+
+
+main()
@@ -0,0 +1,60 @@
+import numpy as np
+
+from draw.pointstrack import PointsTrack
+
+
+class Region(object):
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+
+
+def make_points_track(values, options, monkeypatch):
+    monkeypatch.setattr(PointsTrack, "get_source_values",
+                        classmethod(lambda cls, region, options, fill=0.0:
+                                    values.copy()))
+    region = Region(1, len(values))
+    track = PointsTrack(region, options)
+    track.set_position(region.start, region.end, track.height, 0.0)
+    return track
+
+
+
+def test_decimate_keeps_significant_neg_log_points(monkeypatch):
+    # p-values as in a GWAS track, with a few genome-wide significant
+    # hits spread among many non-significant points
+    rng = np.random.RandomState(0)
+    n = 200000
+    values = rng.uniform(1e-6, 1.0, n)
+    sig_idx = rng.choice(n, 50, replace=False)
+    values[sig_idx] = 10.0 ** rng.uniform(-12, -8, 50)
+
+    track = make_points_track(values, {'neg_log_transform' : 'true',
+                                       'threshold' : '5e-8',
+                                       'below_thresh_color' : 'red',
+                                       'color' : 'grey50'},
+                              monkeypatch)
+
+    # 1000 x 200 device units
+    unit_x = (track.region.end - track.region.start) / 1000.0
+    unit_y = track.height / 200.0
+    monkeypatch.setattr(track, "get_device_units",
+                        lambda r: (unit_x, unit_y))
+
+    yscale = track.height / (track.max_val - track.min_val)
+    vals = (track.values - track.min_val) * yscale + track.bottom
+    idx = track.get_draw_order(None, vals)
+
+    # significant points are past the threshold line in plotted space
+    past_thresh = track.get_past_thresh()
+    assert np.array_equal(np.where(past_thresh)[0], np.sort(sig_idx))
+
+    # all significant points are kept and drawn last, while the others
+    # are decimated
+    assert len(idx) < n // 4
+    assert np.array_equal(np.sort(idx[-len(sig_idx):]), np.sort(sig_idx))
+    assert not np.any(past_thresh[idx[:-len(sig_idx)]])
+
+    # and they are drawn in the below threshold color
+    assert set(track.get_point_colors()[sig_idx]) == set(["red"])